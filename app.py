@@ -6,20 +6,19 @@ Subsequent runs: Launches in 30 seconds
 """
 
 import gradio as gr
-from datetime import datetime
-import time
 import sys
 import os
 
 # Add project root to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from models.vlm_handler import VLMHandler
-from models.llm_handler import LLMHandler
-from voice.stt import STTHandler
-from rag.graphrag_query import GraphRAGEngine
-from utils.safety import SafetyGuardrails
-from utils.latency_tracker import LatencyTracker
+from pipeline import TanitPipeline, load_components
+from voice.stt import LiveTranscriber
+from utils.speculation import SpeculationStats
+from utils.session_store import SessionStore
+from utils.admission import AdmissionController
+from utils.tracing import start_metrics_server, tracer
+from utils.profiling import RequestProfiler
 
 # Initialize components
 print("🚀 Initializing Tanit Fertility Assistant (Production Mode)...")
@@ -27,21 +26,13 @@ print("⏳ First run: Downloading models (~10GB, 10-15 minutes)")
 print("   Subsequent runs: 30 seconds\n")
 
 try:
-    print("1/5 Loading VLM (Qwen2-VL-4B-Instruct)...")
-    vlm = VLMHandler(model_name="Qwen/Qwen2-VL-2B-Instruct", quantization="4bit")  # Using 2B for faster demo
-    
-    print("2/5 Loading LLM (Qwen2.5-4B-Instruct)...")
-    llm = LLMHandler(model_name="Qwen/Qwen2.5-3B-Instruct", quantization="4bit")  # Using 3B for faster demo
-    
-    print("3/5 Loading STT (faster-whisper medium)...")
-    stt = STTHandler(model_size="base")  # Using base for faster demo
-    
-    print("4/5 Loading GraphRAG knowledge base...")
-    graphrag = GraphRAGEngine(index_path="rag/graphrag_index")
-    
-    print("5/5 Initializing safety guardrails...")
-    safety = SafetyGuardrails()
-    
+    # Using Qwen2-VL-2B / Qwen2.5-3B / whisper base for a faster demo
+    components = load_components(
+        vlm_model="Qwen/Qwen2-VL-2B-Instruct",
+        llm_model="Qwen/Qwen2.5-3B-Instruct",
+        stt_model_size="base",
+        quantization="4bit"
+    )
     print("\n✅ All models loaded successfully!\n")
     
 except Exception as e:
@@ -49,114 +40,104 @@ except Exception as e:
     print("\n💡 For quick demo without downloads, run: python app_demo.py")
     sys.exit(1)
 
-# Global conversation history
-conversation_history = []
+# Per-session conversation history (bounded; evicted sessions spill to disk for resumption)
+sessions = SessionStore(spill_path=os.path.join(".tanit_cache", "sessions.sqlite"))
 
-def process_multimodal_input(text_input, audio_input, image_input, pdf_input):
-    """
-    Main processing pipeline with real AI models:
-    1. STT if audio provided
-    2. VLM if image/PDF provided
-    3. GraphRAG retrieval for grounding
-    4. LLM synthesis with safety checks
-    """
-    latency = LatencyTracker()
-    latency.start()
-    
-    try:
-        # Step 1: Transcribe audio if provided
-        if audio_input is not None:
-            latency.checkpoint("stt_start")
-            text_input = stt.transcribe(audio_input)
-            latency.checkpoint("stt_end")
-            print(f"📝 Transcribed: {text_input[:100]}...")
-        
-        if not text_input or text_input.strip() == "":
-            return "⚠️ Please provide a question (text or voice) to get started."
-        
-        # Step 2: Process visual inputs (images/PDFs)
-        visual_context = ""
-        if image_input is not None:
-            latency.checkpoint("vlm_start")
-            visual_context = vlm.analyze_image(
-                image_input,
-                prompt="You are analyzing a medical document. Extract all visible information including: hormone values with units, reference ranges, dates, patient age, and any medical measurements. Be precise and complete."
-            )
-            latency.checkpoint("vlm_end")
-            print(f"👁️ VLM extracted: {visual_context[:200]}...")
-        
-        if pdf_input is not None:
-            latency.checkpoint("pdf_start")
-            visual_context += "\n\n" + vlm.analyze_pdf(pdf_input)
-            latency.checkpoint("pdf_end")
-        
-        # Step 3: GraphRAG retrieval for medical grounding
-        latency.checkpoint("rag_start")
-        query = text_input + " " + visual_context if visual_context else text_input
-        rag_context = graphrag.query(query, top_k=5, include_subgraph=True)
-        latency.checkpoint("rag_end")
-        print(f"📚 Retrieved medical knowledge from GraphRAG")
-        
-        # Step 4: Build comprehensive prompt
-        system_prompt = safety.get_medical_system_prompt()
-        
-        user_prompt = f"""Patient Query: {text_input}
-
-{f"Visual Analysis (VLM extracted data): {visual_context}" if visual_context else ""}
-
-Relevant Medical Knowledge (GraphRAG):
-{rag_context['formatted_context']}
-
-Instructions:
-- Provide a warm, empathetic, evidence-based response
-- Explain medical terms in plain language
-- Reference the knowledge sources you're drawing from
-- Give actionable next steps when appropriate
-- Include appropriate medical disclaimers
-- Be encouraging and supportive"""
-
-        # Step 5: Generate response with LLM
-        latency.checkpoint("llm_start")
-        response = llm.generate(
-            system_prompt=system_prompt,
-            user_prompt=user_prompt,
-            conversation_history=conversation_history[-4:],  # Last 2 turns for context
-            temperature=0.7,
-            max_tokens=800
-        )
-        latency.checkpoint("llm_end")
-        
-        # Step 6: Safety post-processing
-        response = safety.apply_disclaimers(response, query_type="fertility")
-        response = safety.check_hallucination(response, rag_context)
-        
-        # Update conversation history
-        conversation_history.append({"role": "user", "content": query[:500]})
-        conversation_history.append({"role": "assistant", "content": response[:500]})
-        
-        # Generate latency report
-        latency.stop()
-        latency_report = latency.get_report()
-        total_time = latency_report.get('total', 0)
-        
-        print(f"⚡ Total latency: {total_time:.2f}s")
-        
-        # Append latency to response
-        response += f"\n\n---\n⚡ **Processing Time:** {total_time:.2f}s"
-        if 'vlm' in latency_report:
-            response += f" (VLM: {latency_report['vlm']:.2f}s"
-        if 'rag' in latency_report:
-            response += f" | RAG: {latency_report['rag']:.2f}s"
-        if 'llm' in latency_report:
-            response += f" | LLM: {latency_report['llm']:.2f}s)"
-        
+# Speculative retrieval on partial transcripts (hit/miss across requests)
+speculation_stats = SpeculationStats()
+
+# Admission control: per-input-type lanes (concurrency, queue) and per-stage limits.
+# Over capacity, requests are turned away immediately instead of queueing until timeout.
+# Defaults from utils/admission.py, overridden by TANIT_ADMISSION_* (e.g. TANIT_ADMISSION_TEXT_CONCURRENCY=16,
+# TANIT_ADMISSION_LLM_LIMIT=4, TANIT_ADMISSION_MAX_WAIT_SECONDS=20, TANIT_ADMISSION_OVERFLOW_QUEUE=32)
+admission = AdmissionController.from_env(max_wait_seconds=30.0)
+
+# Opt-in profiling: TANIT_PROFILE_SAMPLE_RATE / TANIT_PROFILE_LATENCY_SECONDS / TANIT_PROFILE_TORCH,
+# adjustable at runtime with POST /profiling?sample_rate=0.05&latency_threshold=8 on the metrics port
+profiler = RequestProfiler.from_env()
+
+pipeline = TanitPipeline(
+    **components,
+    sessions=sessions,
+    admission=admission,
+    speculation_stats=speculation_stats,
+    profiler=profiler,
+    lab_json_mode=os.environ.get("TANIT_LAB_JSON_MODE", "0") == "1"  # VLM returns lab results as JSON
+)
+stt = components["stt"]
+
+# Gauges exported next to the span histograms on the metrics endpoint
+tracer.register_collector("admission", admission.get_metrics)
+tracer.register_collector("sessions", sessions.get_metrics)
+tracer.register_collector("speculation", speculation_stats.get_report)
+tracer.register_collector("profiling", profiler.get_settings)
+tracer.register_collector("gate", pipeline.get_gate_metrics)
+tracer.register_collector("kb_fast_path", components["kb_answers"].get_coverage)
+tracer.register_collector("llm_prefix", components["llm"].get_prefix_metrics)
+if components["vlm"].cache is not None:
+    tracer.register_collector("vlm_cache", components["vlm"].cache.stats)
+if stt.cache is not None:
+    tracer.register_collector("transcript_cache", stt.cache.stats)
+METRICS_PORT = int(os.environ.get("TANIT_METRICS_PORT", "9464"))
+
+def format_response(result):
+    """Markdown for the UI: answer plus the per-stage latency footer"""
+    response = result["answer"]
+    if result["status"] != "ok":
         return response
     
-    except Exception as e:
-        print(f"❌ Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return safety.get_error_message()
+    timings = result["timings"]
+    stages = timings["stages"]
+    labels = [("stt", "STT"), ("image", "VLM"), ("pdf", "PDF"), ("rag", "RAG"), ("llm", "LLM")]
+    breakdown = " | ".join(f"{label}: {stages[name]:.2f}s" for name, label in labels if name in stages)
+    response += f"\n\n---\n⚡ **Processing Time:** {timings['total']:.2f}s"
+    if breakdown:
+        response += f" ({breakdown})"
+    if result["route"] == "kb":
+        response += " · answered from the knowledge base"
+    if timings["overlap"] > 1.05:
+        response += f" · {timings['overlap']:.1f}x stage overlap"
+    return response
+
+def process_multimodal_input(text_input, audio_input, image_input, pdf_input, request: gr.Request = None):
+    """
+    Gradio entry point: runs the headless pipeline (with admission control)
+    and streams the safety-filtered answer into the output as it is generated
+    Conversation history is kept per Gradio session (request.session_hash)
+    """
+    session_id = request.session_hash if request is not None else "default"
+    answer = ""
+    for event in pipeline.run_stream(
+        text=text_input,
+        audio=audio_input,
+        image=image_input,
+        pdf=pdf_input,
+        session_id=session_id
+    ):
+        if "delta" in event:
+            answer += event["delta"]
+            yield answer
+        else:
+            yield format_response(event["result"])
+
+def live_transcribe(audio_chunk, transcriber):
+    """
+    Live dictation: transcribe rolling microphone windows while the user speaks
+    and show the partial transcript in the question box
+    """
+    if audio_chunk is None:
+        return gr.update(), transcriber
+    if transcriber is None:
+        # Dictation decodes count against the same STT stage limit as submitted requests
+        transcriber = LiveTranscriber(stt, slot=lambda: admission.stage("stt"))
+    sample_rate, samples = audio_chunk
+    return transcriber.feed(samples, sample_rate), transcriber
+
+def finish_live_transcription(transcriber):
+    """Flush the last window when recording stops; reset for the next dictation"""
+    if transcriber is None:
+        return gr.update(), None
+    return transcriber.finish(), None
 
 # Gradio Interface
 with gr.Blocks(title="Tanit Fertility Companion") as demo:
@@ -186,7 +167,7 @@ with gr.Blocks(title="Tanit Fertility Companion") as demo:
                 audio_input = gr.Audio(
                     label="🎤 Voice Input (optional)",
                     sources=["microphone"],
-                    type="filepath"
+                    type="numpy"  # In memory: no temp file, no ffmpeg re-decode
                 )
                 
                 image_input = gr.Image(
@@ -199,6 +180,14 @@ with gr.Blocks(title="Tanit Fertility Companion") as demo:
                 file_types=[".pdf"]
             )
             
+            live_audio = gr.Audio(
+                label="🎙️ Live Dictation (transcribed into your question as you speak)",
+                sources=["microphone"],
+                streaming=True,
+                type="numpy"
+            )
+            live_state = gr.State(None)
+            
             submit_btn = gr.Button("Send Message", variant="primary", size="lg")
         
         with gr.Column(scale=2):
@@ -234,14 +223,33 @@ with gr.Blocks(title="Tanit Fertility Companion") as demo:
     Always seek professional medical advice for your specific situation.
     """)
     
+    # Live dictation fills the question box with partial transcripts; decodes hold an
+    # admission "stt" slot, so streams beyond the STT limit wait in Gradio's queue
+    live_audio.stream(
+        fn=live_transcribe,
+        inputs=[live_audio, live_state],
+        outputs=[text_input, live_state],
+        concurrency_limit=admission.stage_limits["stt"]
+    )
+    live_audio.stop_recording(
+        fn=finish_live_transcription,
+        inputs=[live_state],
+        outputs=[text_input, live_state]
+    )
+    
     # Event handler
+    # Let requests reach admission control (which queues/rejects per input type)
+    # instead of waiting in Gradio's default one-at-a-time queue
     submit_btn.click(
         fn=process_multimodal_input,
         inputs=[text_input, audio_input, image_input, pdf_input],
-        outputs=output
+        outputs=output,
+        concurrency_limit=admission.total_capacity()
     )
 
 if __name__ == "__main__":
     print("✅ Production app ready!")
     print("🌐 Launching Gradio interface...")
+    start_metrics_server(port=METRICS_PORT, controls={"/profiling": profiler.configure})
+    demo.queue(max_size=admission.overflow_queue)  # Overflow beyond admission capacity is bounded too
     demo.launch(share=True, server_name="0.0.0.0")
\ No newline at end of file
@@ -0,0 +1,304 @@
+"""
+End-to-end load test of the production pipeline on mock backends
+Drives the real TanitPipeline (stage graph, speculation, admission control,
+safety post-processing) with configurable mock models, under concurrent
+mixed-modality load, and reports per concurrency level:
+- throughput and p50/p95/p99 end-to-end latency
+- queueing delay (admission lane wait, per-stage slot wait) and service time per stage
+- request outcomes (ok / rejected / error) and LLM time to first token
+
+All times are reported in simulated seconds (measured / time_scale), so a fast
+CI run with --time_scale 0.05 is comparable to a full-speed run.
+
+Usage:
+    python benchmarks/load_test.py --levels 1,2,4,8,16 --requests 40 --time_scale 0.05 --output load.json
+    python benchmarks/load_test.py --baseline load.json --tolerance 0.25   # exit 1 on regression
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_backends import LatencyModel, MockGraphRAG, MockLLM, MockSTT, MockVLM
+from pipeline import TanitPipeline
+from rag.graphrag_query import GraphRAGEngine
+from utils.admission import DEFAULT_LANE_LIMITS, DEFAULT_STAGE_LIMITS, AdmissionController
+from utils.safety import SafetyGuardrails
+
+DEFAULT_MIX = {"text": 0.5, "audio": 0.2, "image": 0.2, "pdf": 0.1}
+
+# One representative request per modality (media paths are never opened by the mocks)
+REQUEST_TEMPLATES = {
+    "text": {"text": "What does an AMH of 1.5 ng/mL mean at age 32?"},
+    "audio": {"audio": "voice_note.wav"},
+    "image": {"text": "Can you explain my hormone panel?", "image": "hormone_panel.png"},
+    "pdf": {"text": "Summarize my fertility workup", "pdf": "fertility_workup.pdf"},
+}
+
+
+class InstrumentedAdmission(AdmissionController):
+    """AdmissionController that records how long requests wait for lanes and stage slots"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._samples_lock = threading.Lock()
+        self.waits = defaultdict(list)     # "lane:<type>" or stage name -> seconds
+        self.service = defaultdict(list)   # stage name -> seconds holding the slot
+
+    def _record(self, samples, key, seconds):
+        with self._samples_lock:
+            samples[key].append(seconds)
+
+    def reset_samples(self):
+        with self._samples_lock:
+            self.waits.clear()
+            self.service.clear()
+
+    @contextmanager
+    def admit(self, input_type):
+        start = time.perf_counter()
+        with super().admit(input_type):
+            self._record(self.waits, f"lane:{input_type}", time.perf_counter() - start)
+            yield
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        with super().stage(name):
+            acquired = time.perf_counter()
+            self._record(self.waits, name, acquired - start)
+            try:
+                yield
+            finally:
+                self._record(self.service, name, time.perf_counter() - acquired)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+def distribution(values, scale=1.0):
+    values = [v / scale for v in values]
+    return {
+        "count": len(values),
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "p99": round(percentile(values, 99), 4),
+        "max": round(max(values), 4) if values else 0.0
+    }
+
+
+def build_pipeline(args):
+    """Real pipeline, real admission limits, mock models"""
+    scale = args.time_scale
+    fail = args.failure_rate
+    backends = {
+        "vlm": MockVLM(
+            image=LatencyModel(args.vlm_seconds, args.vlm_seconds * args.tail, fail),
+            pdf_page=LatencyModel(args.vlm_page_seconds, args.vlm_page_seconds * args.tail, fail),
+            pdf_pages=args.pdf_pages, seed=args.seed, time_scale=scale
+        ),
+        "llm": MockLLM(
+            prefill=LatencyModel(args.llm_prefill_seconds, args.llm_prefill_seconds * args.tail, fail),
+            tokens_per_second=args.llm_tokens_per_second,
+            output_tokens=args.llm_output_tokens, seed=args.seed, time_scale=scale
+        ),
+        "stt": MockSTT(
+            segment=LatencyModel(args.stt_segment_seconds, args.stt_segment_seconds * args.tail, fail),
+            seed=args.seed, time_scale=scale
+        ),
+        "graphrag": MockGraphRAG(
+            GraphRAGEngine(index_path=args.index_path),
+            query_latency=LatencyModel(args.rag_seconds, args.rag_seconds * args.tail),
+            seed=args.seed, time_scale=scale
+        ),
+    }
+
+    admission = InstrumentedAdmission(
+        lane_limits=DEFAULT_LANE_LIMITS,
+        stage_limits=DEFAULT_STAGE_LIMITS,
+        max_wait_seconds=args.max_wait_seconds * scale,
+        initial_service_seconds={"text": 2.0 * scale, "audio": 4.0 * scale,
+                                 "image": 6.0 * scale, "pdf": 10.0 * scale}
+    )
+    pipeline = TanitPipeline(**backends, safety=SafetyGuardrails(), admission=admission)
+    return pipeline, admission
+
+
+def make_workload(count, mix, seed):
+    rng = random.Random(seed)
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    return [(i, rng.choices(kinds, weights)[0]) for i in range(count)]
+
+
+def run_level(pipeline, admission, concurrency, workload, time_scale=1.0):
+    """
+    Closed-loop load: `concurrency` clients each send their next request as soon
+    as the previous one returns
+    """
+    admission.reset_samples()
+    pending = list(workload)
+    pending_lock = threading.Lock()
+    results = []
+    results_lock = threading.Lock()
+
+    def client():
+        while True:
+            with pending_lock:
+                if not pending:
+                    return
+                index, kind = pending.pop(0)
+            start = time.perf_counter()
+            result = pipeline.run(**REQUEST_TEMPLATES[kind], session_id=f"load-{index}")
+            with results_lock:
+                results.append((kind, result, time.perf_counter() - start))
+
+    start = time.perf_counter()
+    clients = [threading.Thread(target=client, name=f"client-{i}") for i in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    outcomes = defaultdict(int)
+    latencies = []
+    latencies_by_kind = defaultdict(list)
+    graph_stages = defaultdict(list)
+    llm_metrics = []
+    for kind, result, seconds in results:
+        if "llm" in result.get("generation", {}):
+            llm_metrics.append(result["generation"]["llm"])
+        outcomes[result["status"]] += 1
+        if result["status"] == "ok":
+            latencies.append(seconds)
+            latencies_by_kind[kind].append(seconds)
+        for stage, stage_seconds in result["timings"].get("stages", {}).items():
+            graph_stages[stage].append(stage_seconds)
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "outcomes": dict(outcomes),
+        "wall_seconds": round(wall / time_scale, 3),
+        "throughput_rps": round(outcomes["ok"] / (wall / time_scale), 3) if wall else 0.0,
+        "latency": distribution(latencies, time_scale),
+        "latency_by_type": {kind: distribution(values, time_scale) for kind, values in sorted(latencies_by_kind.items())},
+        "queue_wait": {key: distribution(values, time_scale) for key, values in sorted(admission.waits.items())},
+        "stage_service": {key: distribution(values, time_scale) for key, values in sorted(admission.service.items())},
+        "graph_stages": {key: distribution(values, time_scale) for key, values in sorted(graph_stages.items())},
+        "llm_generation": {
+            "ttft": distribution([m["ttft_seconds"] for m in llm_metrics], time_scale),
+            "prompt_tokens": distribution([m["prompt_tokens"] for m in llm_metrics]),
+            "hit_max_tokens_rate": round(sum(m["hit_max_tokens"] for m in llm_metrics) / len(llm_metrics), 3) if llm_metrics else 0.0
+        }
+    }
+
+
+def compare_to_baseline(levels, baseline, tolerance):
+    """Regressions: p95 latency up or throughput down by more than tolerance at any shared level"""
+    previous = {level["concurrency"]: level for level in baseline["levels"]}
+    regressions = []
+    for level in levels:
+        base = previous.get(level["concurrency"])
+        if base is None:
+            continue
+        if base["latency"]["p95"] and level["latency"]["p95"] > base["latency"]["p95"] * (1 + tolerance):
+            regressions.append(f"c={level['concurrency']}: p95 {base['latency']['p95']:.2f}s -> {level['latency']['p95']:.2f}s")
+        if base["throughput_rps"] and level["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"c={level['concurrency']}: throughput {base['throughput_rps']:.2f} -> {level['throughput_rps']:.2f} req/s")
+    return regressions
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(","):
+        kind, weight = item.split("=")
+        if kind not in REQUEST_TEMPLATES:
+            raise ValueError(f"Unknown request type '{kind}' (expected one of {', '.join(REQUEST_TEMPLATES)})")
+        mix[kind] = float(weight)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the Tanit pipeline on mock backends")
+    parser.add_argument("--levels", type=str, default="1,2,4,8,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=40, help="Requests per concurrency level")
+    parser.add_argument("--mix", type=str, default=",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()),
+                        help="Request mix, e.g. text=0.5,audio=0.2,image=0.2,pdf=0.1")
+    parser.add_argument("--time_scale", type=float, default=0.1, help="Multiply all simulated latencies (CI: 0.05)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tail", type=float, default=1.5, help="p95/median ratio of every latency distribution")
+    parser.add_argument("--failure_rate", type=float, default=0.0, help="Fraction of model calls that fail")
+    parser.add_argument("--vlm_seconds", type=float, default=0.8, help="Median VLM latency per image")
+    parser.add_argument("--vlm_page_seconds", type=float, default=0.6, help="Median VLM latency per PDF page")
+    parser.add_argument("--pdf_pages", type=int, default=3)
+    parser.add_argument("--llm_prefill_seconds", type=float, default=0.15)
+    parser.add_argument("--llm_tokens_per_second", type=float, default=150.0)
+    parser.add_argument("--llm_output_tokens", type=int, default=160)
+    parser.add_argument("--stt_segment_seconds", type=float, default=0.15, help="Median decode time per STT segment")
+    parser.add_argument("--rag_seconds", type=float, default=0.02)
+    parser.add_argument("--max_wait_seconds", type=float, default=30.0, help="Admission max estimated wait")
+    parser.add_argument("--index_path", type=str, default="rag/graphrag_index")
+    parser.add_argument("--output", type=str, default=None, help="JSON report file")
+    parser.add_argument("--baseline", type=str, default=None, help="Previous JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression vs baseline")
+    parser.add_argument("--verbose", action="store_true", help="Show pipeline logs")
+    args = parser.parse_args(argv)
+
+    levels = [int(level) for level in args.levels.split(",")]
+    mix = parse_mix(args.mix)
+    pipeline, admission = build_pipeline(args)
+
+    report = {"config": vars(args), "levels": []}
+    print(f"🏋️ Load test: {args.requests} requests per level, mix {mix}, time scale {args.time_scale}")
+    print(f"{'conc':>5} {'ok':>4} {'rej':>4} {'err':>4} {'req/s':>7} {'p50':>7} {'p95':>7} {'p99':>7}  queue wait p95 (lane/stage)")
+
+    for concurrency in levels:
+        workload = make_workload(args.requests, mix, seed=args.seed + concurrency)
+        if args.verbose:
+            level = run_level(pipeline, admission, concurrency, workload, args.time_scale)
+        else:
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull), redirect_stderr(devnull):
+                level = run_level(pipeline, admission, concurrency, workload, args.time_scale)
+        report["levels"].append(level)
+
+        outcomes = level["outcomes"]
+        waits = " ".join(f"{key}={dist['p95']:.2f}" for key, dist in level["queue_wait"].items())
+        print(f"{concurrency:>5} {outcomes.get('ok', 0):>4} {outcomes.get('rejected', 0):>4} {outcomes.get('error', 0):>4} "
+              f"{level['throughput_rps']:>7.2f} {level['latency']['p50']:>6.2f}s {level['latency']['p95']:>6.2f}s "
+              f"{level['latency']['p99']:>6.2f}s  {waits}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare_to_baseline(report["levels"], json.load(f), args.tolerance)
+        if regressions:
+            print("❌ Regressions vs baseline:")
+            for regression in regressions:
+                print(f"   - {regression}")
+            return 1
+        print(f"✅ No regressions vs baseline (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
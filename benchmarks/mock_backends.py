@@ -0,0 +1,306 @@
+"""
+Configurable mock backends for load testing the real pipeline
+Drop-in stand-ins for VLMHandler, LLMHandler, STTHandler and GraphRAGEngine that
+sleep for sampled latencies instead of running models, so TanitPipeline's
+scheduling (stage graph, speculation, admission) can be exercised on CPU-only
+machines without model weights
+"""
+
+import math
+import random
+import threading
+import time
+
+from models.vision_utils import plan_batches, preprocess_image
+
+
+class BackendFailure(RuntimeError):
+    """Injected backend error"""
+
+
+class LatencyModel:
+    def __init__(self, median=1.0, p95=None, failure_rate=0.0):
+        """
+        Log-normal latency: median seconds, p95 seconds (tail; default 1.5x median)
+        failure_rate: fraction of calls that raise BackendFailure
+        """
+        self.median = median
+        self.p95 = p95 if p95 is not None else median * 1.5
+        self.failure_rate = failure_rate
+
+    def sample(self, rng, scale=1.0):
+        if self.median <= 0:
+            return 0.0
+        # p95 of a log-normal is median * exp(1.645 * sigma)
+        sigma = math.log(self.p95 / self.median) / 1.645 if self.p95 > self.median else 0.0
+        return rng.lognormvariate(math.log(self.median), sigma) * scale
+
+    def fails(self, rng):
+        return self.failure_rate > 0 and rng.random() < self.failure_rate
+
+
+class MockBackend:
+    """Shared sampling state: one seeded RNG per backend, guarded for concurrent calls"""
+
+    def __init__(self, name, seed=0, time_scale=1.0):
+        self.name = name
+        self.time_scale = time_scale
+        self._rng = random.Random(f"{name}:{seed}")
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+
+    def _call(self, latency_model, extra_seconds=0.0):
+        """Sleep for one sampled latency, or raise an injected failure"""
+        with self._lock:
+            self.calls += 1
+            seconds = latency_model.sample(self._rng, self.time_scale) + extra_seconds * self.time_scale
+            failed = latency_model.fails(self._rng)
+            if failed:
+                self.failures += 1
+        time.sleep(seconds)
+        if failed:
+            raise BackendFailure(f"{self.name}: injected failure")
+        return seconds
+
+
+def simulated_metrics(prompt_tokens, generated_tokens, max_new_tokens, ttft, total, visual_tokens=0):
+    """Token metrics in the shape models.generation_metrics produces (no GPU memory)"""
+    decode_seconds = max(total - ttft, 0.0)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "visual_tokens": visual_tokens,
+        "cached_prefix_tokens": 0,
+        "generated_tokens": generated_tokens,
+        "max_new_tokens": max_new_tokens,
+        "hit_max_tokens": generated_tokens >= max_new_tokens,
+        "ttft_seconds": round(ttft, 4),
+        "decode_seconds": round(decode_seconds, 4),
+        "decode_tokens_per_second": round((generated_tokens - 1) / decode_seconds, 2) if decode_seconds > 0 else None,
+        "total_seconds": round(total, 4),
+        "peak_memory_mb": None
+    }
+
+
+class MockVLM(MockBackend):
+    RESPONSE = """
+Extracted from hormone panel:
+- AMH: 1.1 ng/mL (slightly below average for age 34)
+- FSH: 8.2 mIU/mL (day 3) - normal range
+- LH: 5.1 mIU/mL - normal
+- Estradiol: 45 pg/mL - normal follicular phase
+Test date: 2024-12-01
+"""
+    JSON_RESPONSE = (
+        '[{"analyte": "AMH", "value": 1.1, "unit": "ng/mL", "reference_range": null, "date": "2024-12-01", "flag": null}, '
+        '{"analyte": "FSH", "value": 8.2, "unit": "mIU/mL", "reference_range": "3-10", "date": "2024-12-01", "flag": null}]'
+    )
+
+    def __init__(self, image=LatencyModel(0.8), pdf_page=LatencyModel(0.6), pdf_pages=3,
+                 visual_tokens=1024, seed=0, time_scale=1.0):
+        """image: latency per image; pdf_page: latency per PDF page needing the VLM"""
+        super().__init__("vlm", seed, time_scale)
+        self.image = image
+        self.pdf_page = pdf_page
+        self.pdf_pages = pdf_pages
+        self.visual_tokens = visual_tokens
+
+    def _metrics(self, seconds):
+        return simulated_metrics(self.visual_tokens + 40, 90, 512, ttft=seconds * 0.4, total=seconds,
+                                 visual_tokens=self.visual_tokens)
+
+    def analyze_image(self, image_path, prompt=None, return_metrics=False, json_mode=False):
+        seconds = self._call(self.image)
+        response = self.JSON_RESPONSE if json_mode else self.RESPONSE
+        if return_metrics:
+            return response, {"cached": False, "generation": self._metrics(seconds)}
+        return response
+
+    def analyze_pdf(self, pdf_path, return_report=False, json_mode=False, **kwargs):
+        pages = []
+        for page_num in range(1, self.pdf_pages + 1):
+            seconds = self._call(self.pdf_page)
+            pages.append({"page": page_num, "path": "vlm", "seconds": seconds, "prep_seconds": 0.0,
+                          "vlm_seconds": seconds, "vlm_calls": 1})
+        response = self.JSON_RESPONSE if json_mode else self.RESPONSE
+        analysis = "\n\n".join(f"[Page {page['page']}, Scan]: {response}" for page in pages)
+        if not return_report:
+            return analysis
+        report = {
+            "pages": pages,
+            "vlm_calls": len(pages),
+            "vlm_seconds": sum(page["seconds"] for page in pages),
+            "images": [],
+            "generation": [self._metrics(page["seconds"]) for page in pages],
+            "skipped_images": []
+        }
+        return analysis, report
+
+
+class MockPanelVLM(MockBackend):
+    """
+    VLMHandler-compatible reader for synthetic panels (benchmarks/vlm_benchmark.py)
+    Reads the ground truth the panel generator stores in image.info["panel"] and
+    misreads values with a probability that grows as the text gets smaller after
+    preprocessing, more rotated or noisier, so accuracy responds to the same
+    preprocessing settings (min/max_pixels, min_text_px, crop) as the real model.
+    Latency grows with visual tokens per batch.
+    """
+
+    def __init__(self, prefill=LatencyModel(0.05), seconds_per_visual_token=0.0002, seconds_per_output_token=0.01,
+                 base_error=0.01, legible_text_px=14, batch_size=4, max_visual_tokens=8192,
+                 min_pixels=256 * 28 * 28, max_pixels=1280 * 28 * 28, min_text_px=12, crop_margins=True,
+                 seed=0, time_scale=1.0):
+        """
+        legible_text_px: text height (after preprocessing) below which misreads climb
+        batch_size / max_visual_tokens / min_pixels / max_pixels / min_text_px / crop_margins:
+        same meaning as in VLMHandler
+        """
+        super().__init__("vlm", seed, time_scale)
+        self.prefill = prefill
+        self.seconds_per_visual_token = seconds_per_visual_token
+        self.seconds_per_output_token = seconds_per_output_token
+        self.base_error = base_error
+        self.legible_text_px = legible_text_px
+        self.batch_size = batch_size
+        self.max_visual_tokens = max_visual_tokens
+        self.min_pixels = min_pixels
+        self.max_pixels = max_pixels
+        self.min_text_px = min_text_px
+        self.crop_margins = crop_margins
+
+    def error_rate(self, panel, scale):
+        """Misread probability per value for a panel rendered at text_px, shrunk by scale"""
+        text_px = panel["text_px"] * scale
+        illegible = max(0.0, (self.legible_text_px - text_px) / self.legible_text_px)
+        rotation = min(abs(panel["rotation"]) / 30.0, 1.0)
+        return min(1.0, self.base_error + 0.9 * illegible + 0.3 * rotation + 0.5 * panel["noise"])
+
+    def _read(self, panel, scale):
+        lines = ["Extracted from hormone panel:"]
+        p_error = self.error_rate(panel, scale)
+        for name, value, unit, ref in panel["values"]:
+            with self._lock:
+                roll = self._rng.random()
+            if roll < p_error / 2:
+                continue  # row missed
+            if roll < p_error:
+                value = round(value * 10, 2)  # decimal point lost
+            lines.append(f"- {name}: {value:g} {unit} (Ref: {ref})")
+        return "\n".join(lines)
+
+    def analyze_image(self, image_path, prompt=None, return_metrics=False):
+        if not return_metrics:
+            return self.analyze_images([image_path], prompt=prompt)[0]
+        results, report = self.analyze_images([image_path], prompt=prompt, return_report=True)
+        return results[0], report["images"][0]
+
+    def analyze_images(self, images, prompt=None, batch_size=None, max_visual_tokens=None, max_new_tokens=512,
+                       return_report=False):
+        prepared = []
+        for image in images:
+            _, info = preprocess_image(image, min_pixels=self.min_pixels, max_pixels=self.max_pixels,
+                                       min_text_px=self.min_text_px, crop=self.crop_margins)
+            prepared.append(({"cached": False, **info}, image.info["panel"]))
+
+        results = [None] * len(images)
+        batch_metrics = []
+        token_counts = [info["tokens_after"] for info, _ in prepared]
+        for batch in plan_batches(token_counts, batch_size or self.batch_size, max_visual_tokens or self.max_visual_tokens):
+            outputs = [self._read(prepared[i][1], prepared[i][0]["scale"]) for i in batch]
+            output_tokens = [len(output) // 4 for output in outputs]
+            visual_tokens = sum(token_counts[i] for i in batch)
+            seconds = self._call(
+                self.prefill,
+                extra_seconds=visual_tokens * self.seconds_per_visual_token + max(output_tokens) * self.seconds_per_output_token
+            )
+            metrics = simulated_metrics(visual_tokens + 40 * len(batch), sum(output_tokens), max_new_tokens,
+                                        ttft=seconds - max(output_tokens) * self.seconds_per_output_token * self.time_scale,
+                                        total=seconds, visual_tokens=visual_tokens)
+            metrics["batch_size"] = len(batch)
+            batch_metrics.append(metrics)
+            for i, output, generated in zip(batch, outputs, output_tokens):
+                results[i] = output
+                prepared[i][0]["generation"] = {"prompt_tokens": token_counts[i] + 40, "visual_tokens": token_counts[i],
+                                                "generated_tokens": generated, "hit_max_tokens": False}
+
+        if return_report:
+            return results, {"images": [info for info, _ in prepared], "generation": batch_metrics}
+        return results
+
+
+class MockLLM(MockBackend):
+    RESPONSE = ("Thank you for sharing this. According to ASRM guidelines, an AMH in this range "
+                "is within the normal range for many women your age. Consider discussing the full "
+                "panel with your reproductive endocrinologist.")
+
+    def __init__(self, prefill=LatencyModel(0.15), tokens_per_second=150.0, output_tokens=160,
+                 warm_prefix_latency=LatencyModel(0.1), seed=0, time_scale=1.0):
+        """
+        Generation time = sampled prefill + output_tokens / tokens_per_second
+        (output_tokens is capped by the caller's max_tokens)
+        """
+        super().__init__("llm", seed, time_scale)
+        self.prefill = prefill
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.warm_prefix_latency = warm_prefix_latency
+
+    def generate(self, system_prompt, user_prompt, conversation_history=[], temperature=0.7, max_tokens=800,
+                 return_metrics=False, on_text=None):
+        tokens = min(self.output_tokens, max_tokens)
+        if on_text is None:
+            seconds = self._call(self.prefill, extra_seconds=tokens / self.tokens_per_second)
+        else:
+            # Streaming: prefill, then the words spread over the decode time
+            seconds = self._call(self.prefill)
+            words = self.RESPONSE.split(" ")
+            for i, word in enumerate(words):
+                time.sleep(tokens / self.tokens_per_second * self.time_scale / len(words))
+                on_text(word if i == 0 else " " + word)
+            seconds += tokens / self.tokens_per_second * self.time_scale
+        if not return_metrics:
+            return self.RESPONSE
+        prompt_tokens = (len(system_prompt) + len(user_prompt)) // 4  # ~4 characters per token
+        ttft = seconds - tokens / self.tokens_per_second * self.time_scale
+        return self.RESPONSE, simulated_metrics(prompt_tokens, tokens, max_tokens, ttft=ttft, total=seconds)
+
+    def warm_prefix(self, system_prompt, conversation_history=[]):
+        self._call(self.warm_prefix_latency)
+
+
+class MockSTT(MockBackend):
+    SEGMENTS = ["I'm 34 years old,", "my AMH is 1.1 ng/mL", "and I have PCOS.", "Should I be worried?"]
+
+    def __init__(self, segment=LatencyModel(0.15), seed=0, time_scale=1.0):
+        """segment: decode latency per streamed segment"""
+        super().__init__("stt", seed, time_scale)
+        self.segment = segment
+
+    def transcribe_stream(self, audio, **kwargs):
+        position = 0.0
+        for text in self.SEGMENTS:
+            self._call(self.segment)
+            yield {"start": position, "end": position + 2.0, "text": text}
+            position += 2.0
+
+    def transcribe(self, audio_path):
+        return " ".join(segment["text"] for segment in self.transcribe_stream(audio_path))
+
+
+class MockGraphRAG(MockBackend):
+    def __init__(self, engine, query_latency=LatencyModel(0.02), seed=0, time_scale=1.0):
+        """Real keyword matching and context formatting from engine, plus simulated latency"""
+        super().__init__("rag", seed, time_scale)
+        self.engine = engine
+        self.query_latency = query_latency
+
+    def match_entities(self, query_text):
+        return self.engine.match_entities(query_text)
+
+    def query_entities(self, relevant_entities):
+        self._call(self.query_latency)
+        return self.engine.query_entities(relevant_entities)
+
+    def query(self, query_text, **kwargs):
+        return self.query_entities(self.match_entities(query_text))
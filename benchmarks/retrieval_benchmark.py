@@ -0,0 +1,260 @@
+"""
+Retrieval quality and scaling benchmark for GraphRAGEngine
+- Quality: a golden query set over the shipped knowledge base (AMH, FSH, PCOS,
+  cycle tracking) scored with recall@k and MRR on the ranked entity list
+- Scaling: synthetic knowledge bases of growing size (real entities plus
+  generated fillers, each with its own keyword), reporting per size the
+  knowledge_base.json size, load time, memory held by the loaded KB, and
+  match / query latency percentiles
+
+The synthetic keywords are added to the engine's KEYWORD_MAP, so matching cost
+grows with the knowledge base the same way it will once the real corpus lands.
+
+Usage:
+    python benchmarks/retrieval_benchmark.py --output retrieval.json
+    python benchmarks/retrieval_benchmark.py --sizes 10,1000,100000 --queries 100
+    python benchmarks/retrieval_benchmark.py --baseline retrieval.json --tolerance 0.25   # exit 1 on regression
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.load_test import distribution
+from rag.graphrag_query import GraphRAGEngine
+
+# (query, relevant entity keys) - paraphrases without a mapped keyword are kept on purpose
+GOLDEN_QUERIES = [
+    ("What is a normal AMH level for a 32-year-old woman?", ["amh_levels"]),
+    ("My anti-müllerian hormone came back at 0.8", ["amh_levels"]),
+    ("Is an AMH of 1.1 ng/mL too low for IVF?", ["amh_levels"]),
+    ("How is ovarian reserve tested?", ["amh_levels", "fsh_levels"]),
+    ("How many eggs do I have left?", ["amh_levels", "fsh_levels"]),
+    ("What does a day 3 FSH of 12 mean?", ["fsh_levels"]),
+    ("Why is follicle stimulating hormone measured early in the cycle?", ["fsh_levels", "cycle_tracking"]),
+    ("Does a high FSH predict a poor IVF response?", ["fsh_levels"]),
+    ("How is PCOS diagnosed?", ["pcos"]),
+    ("Can polycystic ovaries stop me from getting pregnant?", ["pcos"]),
+    ("Why is my AMH high with PCOS?", ["pcos", "amh_levels"]),
+    ("I have irregular periods and acne, could it be hormonal?", ["pcos"]),
+    ("How do I know when I'm ovulating?", ["cycle_tracking"]),
+    ("When is my fertile window?", ["cycle_tracking"]),
+    ("What is the best time to have intercourse to conceive?", ["cycle_tracking"]),
+    ("Does basal body temperature tracking work?", ["cycle_tracking"]),
+]
+
+DEFAULT_SIZES = (10, 100, 1000, 10000, 100000, 1000000)
+RECALL_AT = (1, 3, 5)
+
+
+def ranked_entities(result):
+    """Entity keys in the order GraphRAGEngine.query returns them"""
+    return [node["name"].lower().replace(" ", "_") for node in result["nodes"]]
+
+
+def score_ranking(ranked, relevant, ks=RECALL_AT):
+    """recall@k for each k and the reciprocal rank of the first relevant entity"""
+    relevant = set(relevant)
+    scores = {f"recall@{k}": len(relevant.intersection(ranked[:k])) / len(relevant) for k in ks}
+    scores["rr"] = next((1.0 / rank for rank, key in enumerate(ranked, 1) if key in relevant), 0.0)
+    return scores
+
+
+def evaluate_golden(engine, queries=GOLDEN_QUERIES, ks=RECALL_AT):
+    """Mean recall@k / MRR of engine over the golden set, plus the queries that missed"""
+    totals = dict.fromkeys([f"recall@{k}" for k in ks] + ["rr"], 0.0)
+    misses = []
+    for query, relevant in queries:
+        ranked = ranked_entities(engine.query(query))
+        scores = score_ranking(ranked, relevant, ks)
+        for key, value in scores.items():
+            totals[key] += value
+        if scores[f"recall@{max(ks)}"] < 1.0:
+            misses.append({"query": query, "relevant": relevant, "retrieved": ranked})
+    report = {key: round(value / len(queries), 4) for key, value in totals.items() if key != "rr"}
+    report["mrr"] = round(totals["rr"] / len(queries), 4)
+    report["queries"] = len(queries)
+    report["misses"] = misses
+    return report
+
+
+def synthetic_keyword(index):
+    """Fixed-width, so no synthetic keyword is a substring of another"""
+    return f"marker-{index:07d}"
+
+
+def generate_synthetic_kb(entity_count, base_kb, seed=0):
+    """
+    Knowledge base of entity_count entities: the real entities plus generated
+    fillers shaped like the lab-value entries
+    Returns: (knowledge_base, keyword_map) with one keyword per filler
+    """
+    rng = random.Random(seed)
+    knowledge_base = dict(base_kb)
+    keyword_map = {}
+    for i in range(max(0, entity_count - len(base_kb))):
+        key = f"synthetic_{i:07d}"
+        keyword = synthetic_keyword(i)
+        low = round(rng.uniform(0.1, 50.0), 1)
+        high = round(low * rng.uniform(1.5, 4.0), 1)
+        knowledge_base[key] = {
+            "description": f"Synthetic analyte {keyword} for retrieval benchmarking",
+            "normal_range": f"{low}-{high} units",
+            "interpretation": {"low": f"<{low} is below range", "high": f">{high} is above range"},
+            "clinical_notes": [f"Interpret {keyword} alongside the full panel"],
+            "sources": [f"Synthetic Source {i % 100}"]
+        }
+        keyword_map[keyword] = [key]
+    return knowledge_base, keyword_map
+
+
+def load_engine(index_path, keyword_map):
+    """GraphRAGEngine on index_path with the synthetic keywords added to its KEYWORD_MAP"""
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        engine = GraphRAGEngine(index_path=index_path)
+    engine.KEYWORD_MAP = dict(GraphRAGEngine.KEYWORD_MAP, **keyword_map)
+    return engine
+
+
+def make_workload(keyword_map, count, seed=0):
+    """count queries: golden queries interleaved with lookups of random synthetic entities"""
+    rng = random.Random(seed)
+    keywords = list(keyword_map)
+    workload = []
+    for i in range(count):
+        if keywords and i % 2:
+            keyword = rng.choice(keywords)
+            workload.append((f"What is the normal range for {keyword}?", keyword_map[keyword]))
+        else:
+            workload.append(GOLDEN_QUERIES[(i // 2) % len(GOLDEN_QUERIES)])
+    return workload
+
+
+def run_size(entity_count, base_kb, queries=200, seed=0):
+    """Build, load and query a synthetic knowledge base of entity_count entities"""
+    knowledge_base, keyword_map = generate_synthetic_kb(entity_count, base_kb, seed=seed)
+    with tempfile.TemporaryDirectory() as index_path:
+        kb_file = os.path.join(index_path, "knowledge_base.json")
+        with open(kb_file, "w") as f:
+            json.dump(knowledge_base, f)
+        file_bytes = os.path.getsize(kb_file)
+        del knowledge_base
+        gc.collect()
+
+        # Timed load without tracing, then a traced load for memory
+        start = time.perf_counter()
+        engine = load_engine(index_path, keyword_map)
+        load_seconds = time.perf_counter() - start
+        del engine
+        gc.collect()
+
+        tracemalloc.start()
+        engine = load_engine(index_path, keyword_map)
+        kb_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    match_latencies = []
+    query_latencies = []
+    synthetic_hits = synthetic_total = 0
+    for query, relevant in make_workload(keyword_map, queries, seed=seed):
+        start = time.perf_counter()
+        engine.match_entities(query)
+        match_latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        result = engine.query(query)
+        query_latencies.append(time.perf_counter() - start)
+
+        if relevant[0].startswith("synthetic_"):
+            synthetic_total += 1
+            synthetic_hits += relevant[0] in ranked_entities(result)
+
+    return {
+        "entities": len(engine.knowledge_base),
+        "keywords": len(engine.KEYWORD_MAP),
+        "file_mb": round(file_bytes / 2 ** 20, 2),
+        "load_seconds": round(load_seconds, 4),
+        "memory_mb": round(kb_bytes / 2 ** 20, 2),
+        "load_peak_memory_mb": round(peak_bytes / 2 ** 20, 2),
+        "match_latency_ms": distribution(match_latencies, scale=1e-3),
+        "query_latency_ms": distribution(query_latencies, scale=1e-3),
+        "golden": {key: value for key, value in evaluate_golden(engine).items() if key != "misses"},
+        "synthetic_recall": round(synthetic_hits / synthetic_total, 4) if synthetic_total else None
+    }
+
+
+def compare_to_baseline(report, baseline, tolerance):
+    """Regressions: golden recall/MRR down by more than tolerance (absolute), p95 query latency up by more than tolerance (relative)"""
+    regressions = []
+    for key in ("mrr", f"recall@{max(RECALL_AT)}"):
+        if report["golden"][key] < baseline["golden"][key] - tolerance:
+            regressions.append(f"golden {key} {baseline['golden'][key]:.3f} -> {report['golden'][key]:.3f}")
+    previous = {size["entities"]: size for size in baseline["sizes"]}
+    for size in report["sizes"]:
+        base = previous.get(size["entities"])
+        if base is None:
+            continue
+        before, after = base["query_latency_ms"]["p95"], size["query_latency_ms"]["p95"]
+        if before and after > before * (1 + tolerance):
+            regressions.append(f"{size['entities']} entities: p95 query {before:.3f}ms -> {after:.3f}ms")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark GraphRAGEngine retrieval quality and scaling")
+    parser.add_argument("--sizes", type=str, default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="Comma-separated knowledge base sizes (entities)")
+    parser.add_argument("--queries", type=int, default=200, help="Timed queries per size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--index_path", type=str, default="rag/graphrag_index")
+    parser.add_argument("--output", type=str, default=None, help="JSON report file")
+    parser.add_argument("--baseline", type=str, default=None, help="Previous JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed recall/MRR drop (absolute) and latency regression (relative)")
+    args = parser.parse_args(argv)
+
+    engine = load_engine(args.index_path, {})
+    golden = evaluate_golden(engine)
+    print(f"🔎 Retrieval benchmark: {golden['queries']} golden queries on {len(engine.knowledge_base)} entities")
+    print("   " + "  ".join(f"{key}={golden[key]:.3f}" for key in [f"recall@{k}" for k in RECALL_AT] + ["mrr"]))
+    for miss in golden["misses"]:
+        print(f"   ⚠️ missed: '{miss['query']}' -> {', '.join(miss['retrieved'])}")
+
+    report = {"config": vars(args), "golden": golden, "sizes": []}
+    print(f"{'entities':>9} {'file':>8} {'load':>8} {'memory':>9} {'match p50':>10} {'query p50':>10} {'query p95':>10}")
+    for entity_count in (int(size) for size in args.sizes.split(",")):
+        size = run_size(entity_count, engine.knowledge_base, queries=args.queries, seed=args.seed)
+        report["sizes"].append(size)
+        print(f"{size['entities']:>9} {size['file_mb']:>6.1f}MB {size['load_seconds']:>7.3f}s {size['memory_mb']:>7.1f}MB "
+              f"{size['match_latency_ms']['p50']:>8.3f}ms {size['query_latency_ms']['p50']:>8.3f}ms "
+              f"{size['query_latency_ms']['p95']:>8.3f}ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+        if regressions:
+            print("❌ Regressions vs baseline:")
+            for regression in regressions:
+                print(f"   - {regression}")
+            return 1
+        print(f"✅ No regressions vs baseline (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
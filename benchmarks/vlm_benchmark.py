@@ -0,0 +1,309 @@
+"""
+VLM extraction accuracy and throughput benchmark
+Generates synthetic hormone panels across layouts, fonts, font sizes, rotations,
+noise levels and resolutions, runs them through any VLMHandler-compatible
+backend (analyze_images(images, prompt, batch_size, return_report=True)), scores
+the extracted values with the lab parser, and reports:
+- extraction accuracy overall and per panel parameter
+- images/s, visual tokens per image and per-call latency percentiles
+
+The mock backend reads the panels' ground truth with a legibility-dependent
+error rate, so the harness (and preprocessing tradeoffs) runs on CPU-only
+machines; --backend qwen runs the real VLMHandler on the same panels.
+
+Usage:
+    python benchmarks/vlm_benchmark.py --panels 200 --output vlm.json
+    python benchmarks/vlm_benchmark.py --backend qwen --model Qwen/Qwen2-VL-2B-Instruct --max_pixels 602112
+    python benchmarks/vlm_benchmark.py --baseline vlm.json --tolerance 0.05   # exit 1 on regression
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.load_test import distribution, percentile
+from benchmarks.mock_backends import LatencyModel, MockPanelVLM
+from pipeline import IMAGE_PROMPT
+from utils.lab_parser import parse_lab_results
+
+# (analyte, typical value range, unit, reference range) drawn from for each panel
+ANALYTE_POOL = [
+    ("AMH", (0.2, 8.0), "ng/mL", "1.5-4.0"),
+    ("FSH", (2.0, 25.0), "mIU/mL", "3.0-10.0"),
+    ("LH", (1.0, 20.0), "mIU/mL", "2.0-10.0"),
+    ("Estradiol", (20, 400), "pg/mL", "25-75"),
+    ("Progesterone", (0.2, 25.0), "ng/mL", ">10"),
+    ("TSH", (0.3, 6.0), "mIU/L", "0.5-4.5"),
+    ("Prolactin", (3.0, 40.0), "ng/mL", "4.8-23.3"),
+    ("Testosterone", (10, 90), "ng/dL", "15-70"),
+]
+
+FONT_FILES = {
+    "sans": "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "serif": "/usr/share/fonts/truetype/dejavu/DejaVuSerif.ttf",
+    "mono": "/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf",
+}
+
+LAYOUTS = ("table", "list", "two_column")
+DEFAULT_GRID = {
+    "layout": LAYOUTS,
+    "font": tuple(FONT_FILES),
+    "font_size": (14, 20, 28),
+    "rotation": (0.0, 2.0, 8.0),
+    "noise": (0.0, 0.1, 0.25),
+    "resolution": ((800, 600), (1600, 1200), (2480, 3508)),
+}
+
+VALUE_TOLERANCE = 0.05  # relative error counted as a correct extraction
+
+
+def _font(name, size):
+    try:
+        return ImageFont.truetype(FONT_FILES[name], size)
+    except (OSError, KeyError):
+        return ImageFont.load_default()
+
+
+def create_synthetic_hormone_panel(values, layout="table", font="sans", font_size=24, rotation=0.0,
+                                   noise=0.0, resolution=(800, 600), seed=0):
+    """
+    Render a hormone panel image
+    values: [(analyte, value, unit, reference range)]
+    layout: "table" (columns), "list" ("AMH: 1.5 ng/mL (Ref ...)") or "two_column" (side-by-side blocks)
+    font_size: at 800px width; scaled with the resolution
+    rotation: degrees (scan skew); noise: std of gaussian pixel noise as a fraction of 255
+    The ground truth is kept in image.info["panel"] for scoring and the mock backend
+    """
+    width, height = resolution
+    scale = width / 800
+    size = max(8, round(font_size * scale))
+    text_font = _font(font, size)
+    small_font = _font(font, max(8, round(size * 0.75)))
+
+    img = Image.new("RGB", (width, height), color="white")
+    draw = ImageDraw.Draw(img)
+    margin = round(50 * scale)
+    draw.text((margin, round(30 * scale)), "Hormone Panel - Lab Results", fill="black", font=text_font)
+    draw.text((margin, round(30 * scale) + size + 8), "Patient: Test Case", fill="black", font=small_font)
+
+    row_height = round(size * 2.0)
+    top = round(40 * scale) + 3 * size
+    for i, (name, value, unit, ref_range) in enumerate(values):
+        if layout == "table":
+            y = top + i * row_height
+            draw.text((margin, y), name, fill="black", font=text_font)
+            draw.text((margin + round(250 * scale), y), f"{value:g}", fill="black", font=text_font)
+            draw.text((margin + round(400 * scale), y), unit, fill="black", font=text_font)
+            draw.text((margin + round(520 * scale), y), f"Ref: {ref_range}", fill="black", font=small_font)
+        elif layout == "list":
+            y = top + i * row_height
+            draw.text((margin, y), f"{name}: {value:g} {unit} (Ref: {ref_range})", fill="black", font=text_font)
+        else:
+            column, row = i % 2, i // 2
+            x = margin + column * round(360 * scale)
+            y = top + row * 2 * row_height
+            draw.text((x, y), f"{name}  {value:g} {unit}", fill="black", font=text_font)
+            draw.text((x, y + size + 4), f"Ref: {ref_range}", fill="black", font=small_font)
+
+    if rotation:
+        img = img.rotate(rotation, resample=Image.BILINEAR, expand=True, fillcolor="white")
+    if noise:
+        rng = np.random.default_rng(seed)
+        grain = rng.standard_normal((img.height, img.width, 1), dtype=np.float32) * (noise * 255)
+        pixels = np.asarray(img, dtype=np.float32) + grain
+        img = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+    img.info["panel"] = {
+        "values": [tuple(row) for row in values],
+        "text_px": size,
+        "rotation": rotation,
+        "noise": noise,
+    }
+    return img
+
+
+def generate_panels(count, seed=0, grid=None, analytes_per_panel=(3, 6)):
+    """
+    count panels with parameters sampled from grid ({parameter: choices}, default DEFAULT_GRID)
+    Returns: [{"image", "expected": {analyte: value}, "params"}]
+    """
+    grid = dict(DEFAULT_GRID, **(grid or {}))
+    rng = random.Random(seed)
+    panels = []
+    for i in range(count):
+        params = {key: rng.choice(choices) for key, choices in grid.items()}
+        chosen = rng.sample(ANALYTE_POOL, rng.randint(*analytes_per_panel))
+        values = []
+        for name, (low, high), unit, ref_range in chosen:
+            value = rng.uniform(low, high)
+            values.append((name, round(value, 1) if high < 100 else float(round(value)), unit, ref_range))
+        image = create_synthetic_hormone_panel(values, seed=seed * 100003 + i, **params)
+        panels.append({"image": image, "expected": {name: value for name, value, _, _ in values}, "params": params})
+    return panels
+
+
+def score_extraction(text, expected):
+    """Per-analyte correctness of one extraction: {analyte: extracted value or None, correct}"""
+    extracted = {}
+    for record in parse_lab_results(text or ""):
+        extracted.setdefault(record.analyte, record.value)
+    scores = {}
+    for analyte, value in expected.items():
+        found = extracted.get(analyte)
+        correct = found is not None and abs(found - value) <= VALUE_TOLERANCE * abs(value)
+        scores[analyte] = {"expected": value, "extracted": found, "correct": correct}
+    return scores
+
+
+def _param_label(value):
+    return "x".join(str(v) for v in value) if isinstance(value, (tuple, list)) else str(value)
+
+
+def run_benchmark(backend, panels, batch_size=4, prompt=IMAGE_PROMPT, max_errors=20):
+    """
+    Run every panel through backend.analyze_images in calls of batch_size images
+    Returns the JSON-ready report (accuracy, throughput, visual tokens, latency)
+    """
+    call_latencies = []
+    visual_tokens = []
+    per_param = defaultdict(lambda: defaultdict(lambda: [0, 0]))  # param -> value -> [correct, total]
+    errors = []
+    correct = total = panels_correct = 0
+
+    start = time.perf_counter()
+    for offset in range(0, len(panels), batch_size):
+        chunk = panels[offset:offset + batch_size]
+        call_start = time.perf_counter()
+        outputs, report = backend.analyze_images([panel["image"] for panel in chunk], prompt=prompt,
+                                                 batch_size=batch_size, return_report=True)
+        call_latencies.append(time.perf_counter() - call_start)
+
+        for panel, output, image_report in zip(chunk, outputs, report["images"]):
+            tokens = image_report.get("tokens_after", image_report.get("generation", {}).get("visual_tokens"))
+            if tokens is not None:
+                visual_tokens.append(tokens)
+            scores = score_extraction(output, panel["expected"])
+            panel_correct = sum(score["correct"] for score in scores.values())
+            correct += panel_correct
+            total += len(scores)
+            panels_correct += panel_correct == len(scores)
+            for key, value in panel["params"].items():
+                bucket = per_param[key][_param_label(value)]
+                bucket[0] += panel_correct
+                bucket[1] += len(scores)
+            for analyte, score in scores.items():
+                if not score["correct"] and len(errors) < max_errors:
+                    errors.append({"analyte": analyte, "expected": score["expected"],
+                                   "extracted": score["extracted"], "params": {k: _param_label(v) for k, v in panel["params"].items()}})
+    wall = time.perf_counter() - start
+
+    return {
+        "panels": len(panels),
+        "values": total,
+        "accuracy": round(correct / total, 4) if total else 0.0,
+        "panel_accuracy": round(panels_correct / len(panels), 4) if panels else 0.0,
+        "accuracy_by": {
+            key: {label: round(c / t, 4) for label, (c, t) in sorted(buckets.items())}
+            for key, buckets in sorted(per_param.items())
+        },
+        "images_per_second": round(len(panels) / wall, 3) if wall > 0 else 0.0,
+        "wall_seconds": round(wall, 3),
+        "latency": distribution(call_latencies),
+        "visual_tokens": {
+            "mean": round(sum(visual_tokens) / len(visual_tokens), 1) if visual_tokens else 0.0,
+            "p50": percentile(visual_tokens, 50),
+            "p95": percentile(visual_tokens, 95),
+            "total": sum(visual_tokens)
+        },
+        "errors": errors
+    }
+
+
+def compare_to_baseline(report, baseline, tolerance):
+    """Regressions: accuracy down by more than tolerance (absolute), throughput / p95 latency by more than tolerance (relative)"""
+    regressions = []
+    if report["accuracy"] < baseline["accuracy"] - tolerance:
+        regressions.append(f"accuracy {baseline['accuracy']:.1%} -> {report['accuracy']:.1%}")
+    if baseline["images_per_second"] and report["images_per_second"] < baseline["images_per_second"] * (1 - tolerance):
+        regressions.append(f"throughput {baseline['images_per_second']:.2f} -> {report['images_per_second']:.2f} images/s")
+    if baseline["latency"]["p95"] and report["latency"]["p95"] > baseline["latency"]["p95"] * (1 + tolerance):
+        regressions.append(f"p95 latency {baseline['latency']['p95']:.2f}s -> {report['latency']['p95']:.2f}s")
+    return regressions
+
+
+def build_backend(args):
+    preprocessing = {
+        "min_pixels": args.min_pixels,
+        "max_pixels": args.max_pixels,
+        "min_text_px": args.min_text_px,
+        "crop_margins": not args.no_crop,
+    }
+    if args.backend == "mock":
+        return MockPanelVLM(prefill=LatencyModel(0.05), batch_size=args.batch_size, seed=args.seed,
+                            time_scale=args.time_scale, **preprocessing)
+    from models.vlm_handler import VLMHandler
+    # No extraction cache: every panel must reach the model
+    return VLMHandler(model_name=args.model, quantization=args.quantization, batch_size=args.batch_size,
+                      cache_path=None, **preprocessing)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark VLM lab-value extraction on synthetic hormone panels")
+    parser.add_argument("--backend", choices=("mock", "qwen"), default="mock")
+    parser.add_argument("--model", type=str, default="Qwen/Qwen2-VL-2B-Instruct")
+    parser.add_argument("--quantization", type=str, default="4bit", choices=["4bit", "none"])
+    parser.add_argument("--panels", type=int, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch_size", type=int, default=4, help="Images per analyze_images call")
+    parser.add_argument("--layouts", type=str, default=",".join(LAYOUTS))
+    parser.add_argument("--min_pixels", type=int, default=256 * 28 * 28)
+    parser.add_argument("--max_pixels", type=int, default=1280 * 28 * 28)
+    parser.add_argument("--min_text_px", type=int, default=12)
+    parser.add_argument("--no_crop", action="store_true", help="Disable margin cropping")
+    parser.add_argument("--time_scale", type=float, default=1.0, help="Mock backend latency multiplier")
+    parser.add_argument("--output", type=str, default=None, help="JSON report file")
+    parser.add_argument("--baseline", type=str, default=None, help="Previous JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.05,
+                        help="Allowed accuracy drop (absolute) and throughput/latency regression (relative)")
+    args = parser.parse_args(argv)
+
+    panels = generate_panels(args.panels, seed=args.seed, grid={"layout": tuple(args.layouts.split(","))})
+    backend = build_backend(args)
+    print(f"🔬 VLM benchmark: {len(panels)} panels, backend {args.backend}, batch size {args.batch_size}")
+
+    report = dict(run_benchmark(backend, panels, batch_size=args.batch_size), config=vars(args))
+    print(f"   accuracy {report['accuracy']:.1%} ({report['values']} values, {report['panel_accuracy']:.1%} panels fully correct)")
+    print(f"   {report['images_per_second']:.2f} images/s, {report['visual_tokens']['mean']:.0f} visual tokens/image, "
+          f"call latency p50 {report['latency']['p50']:.2f}s p95 {report['latency']['p95']:.2f}s")
+    for key, buckets in report["accuracy_by"].items():
+        print(f"   {key:>10}: " + "  ".join(f"{label}={accuracy:.0%}" for label, accuracy in buckets.items()))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+        if regressions:
+            print("❌ Regressions vs baseline:")
+            for regression in regressions:
+                print(f"   - {regression}")
+            return 1
+        print(f"✅ No regressions vs baseline (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Token-level metrics for generate() calls
+Time to first token comes from a streamer hooked into generate(); decode rate,
+token counts and peak GPU memory are measured around the call. Every call's
+metrics also feed the tracer histograms (e.g. llm.ttft_seconds, vlm.visual_tokens)
+"""
+
+import time
+
+import torch
+from transformers.generation.streamers import BaseStreamer
+
+from utils.tracing import current_span, tracer
+
+
+class FirstTokenTimer(BaseStreamer):
+    """Streamer that records when generate() emits its first new token (and forwards to another streamer)"""
+
+    def __init__(self, forward=None):
+        self.first_token_time = None
+        self.forward = forward
+        self._prompt_seen = False
+
+    def put(self, value):
+        # generate() first puts the prompt ids, then each decoding step's tokens
+        if not self._prompt_seen:
+            self._prompt_seen = True
+        elif self.first_token_time is None:
+            self.first_token_time = time.perf_counter()
+        if self.forward is not None:
+            self.forward.put(value)
+
+    def end(self):
+        if self.forward is not None:
+            self.forward.end()
+
+
+class GenerationTimer:
+    def __init__(self, device, streamer=None):
+        """
+        Wrap one generate() call:
+            timer = GenerationTimer(device)
+            with timer:
+                model.generate(..., streamer=timer.streamer)
+            metrics = timer.metrics(prompt_tokens=..., generated_tokens=...)
+        streamer: another streamer (e.g. for text output) fed through timer.streamer
+        """
+        self.device = device
+        self.streamer = FirstTokenTimer(forward=streamer)
+        self.start = None
+        self.end = None
+
+    def __enter__(self):
+        if self.device == "cuda":
+            # Process-wide: concurrent calls on the same GPU share this peak
+            torch.cuda.reset_peak_memory_stats()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.end = time.perf_counter()
+        return False
+
+    def metrics(self, prompt_tokens, generated_tokens, max_new_tokens, visual_tokens=0,
+                cached_prefix_tokens=0, sequences=1):
+        """
+        prompt_tokens / generated_tokens: totals over the batch
+        generated_tokens hitting max_new_tokens * sequences means decoding was cut off
+        """
+        total = self.end - self.start
+        first = self.streamer.first_token_time
+        ttft = (first - self.start) if first is not None else total
+        decode_seconds = max(total - ttft, 0.0)
+        # The first token is produced by prefill; the rest by decode steps
+        decode_tokens = max(generated_tokens - sequences, 0)
+
+        peak_memory_mb = None
+        if self.device == "cuda":
+            peak_memory_mb = round(torch.cuda.max_memory_allocated() / 2**20, 1)
+
+        return {
+            "prompt_tokens": prompt_tokens,
+            "visual_tokens": visual_tokens,
+            "cached_prefix_tokens": cached_prefix_tokens,
+            "generated_tokens": generated_tokens,
+            "max_new_tokens": max_new_tokens,
+            "hit_max_tokens": generated_tokens >= max_new_tokens * sequences,
+            "ttft_seconds": round(ttft, 4),
+            "decode_seconds": round(decode_seconds, 4),
+            "decode_tokens_per_second": round(decode_tokens / decode_seconds, 2) if decode_seconds > 0 else None,
+            "total_seconds": round(total, 4),
+            "peak_memory_mb": peak_memory_mb
+        }
+
+
+def count_generated_tokens(sequences, pad_token_id):
+    """New tokens per sequence, ignoring the padding added after early-finishing rows"""
+    if pad_token_id is None:
+        return [len(ids) for ids in sequences]
+    return [int((ids != pad_token_id).sum()) for ids in sequences]
+
+
+RECORDED_FIELDS = (
+    "prompt_tokens", "visual_tokens", "generated_tokens", "ttft_seconds",
+    "decode_seconds", "decode_tokens_per_second", "peak_memory_mb"
+)
+
+
+def record_generation(prefix, metrics):
+    """Feed a call's metrics into the tracer histograms and annotate the current span"""
+    for field in RECORDED_FIELDS:
+        if metrics.get(field) is not None:
+            tracer.observe(f"{prefix}.{field}", metrics[field])
+    tracer.observe(f"{prefix}.hit_max_tokens", int(metrics["hit_max_tokens"]))
+
+    span = current_span()
+    if span is not None:
+        span.set(**{field: metrics[field] for field in RECORDED_FIELDS + ("hit_max_tokens",)})
@@ -1,6 +1,25 @@
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import AutoTokenizer, AutoModelForCausalLM, DynamicCache, TextStreamer
+from collections import OrderedDict
+import copy
+import threading
 import torch
 
+from models.generation_metrics import GenerationTimer, count_generated_tokens, record_generation
+from utils.tracing import traced
+
+
+class TextCallbackStreamer(TextStreamer):
+    """Decoded text deltas of the new tokens, passed to on_text(delta) as generate() runs"""
+
+    def __init__(self, tokenizer, on_text):
+        super().__init__(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        self.on_text = on_text
+
+    def on_finalized_text(self, text, stream_end=False):
+        if text:
+            self.on_text(text)
+
+
 class LLMHandler:
     def __init__(self, model_name="Qwen/Qwen2.5-4B-Instruct", quantization="4bit"):
         """
@@ -29,16 +48,29 @@ class LLMHandler:
             )
         
         self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        
+        # Prefilled KV caches of stable prompt prefixes (system prompt + history)
+        self._prefix_cache = OrderedDict()
+        self._prefix_pending = {}  # prefix text -> Event set when its in-flight prefill finishes
+        self._prefix_lock = threading.Lock()  # guards the two dicts only, never held across a forward pass
+        self.max_cached_prefixes = 4
+        self.prefix_wait_seconds = 10.0  # give up on a stuck in-flight prefill and prefill as usual
+        self.prefix_hits = 0
+        self.prefix_misses = 0
+        self.prefix_wait_timeouts = 0
         print("✅ LLM loaded successfully")
     
-    def generate(self, system_prompt, user_prompt, conversation_history=[], temperature=0.7, max_tokens=800):
+    @traced("llm.generate")
+    def generate(self, system_prompt, user_prompt, conversation_history=[], temperature=0.7, max_tokens=800,
+                 return_metrics=False, on_text=None):
         """
         Generate medically-grounded, empathetic response
+        return_metrics: also return token metrics (prompt/generated tokens, time to
+        first token, decode tokens/s, peak memory) - see models.generation_metrics
+        on_text: called with each decoded text delta while generating (streaming output);
+                 the full response is still returned at the end
         """
-        messages = [{"role": "system", "content": system_prompt}]
-        
-        # Add conversation history for context
-        messages.extend(conversation_history)
+        messages = self._prefix_messages(system_prompt, conversation_history)
         
         # Add current query
         messages.append({"role": "user", "content": user_prompt})
@@ -52,14 +84,22 @@ class LLMHandler:
         
         model_inputs = self.tokenizer([text], return_tensors="pt").to(self.device)
         
+        # Reuse a prefilled prefix (warmed while STT was still decoding) if one matches
+        prefix_cache = self._lookup_prefix(system_prompt, conversation_history, model_inputs.input_ids)
+        
+        cached_prefix_tokens = prefix_cache.get_seq_length() if prefix_cache is not None else 0
+        
         # Generate
-        with torch.no_grad():
+        timer = GenerationTimer(self.device, TextCallbackStreamer(self.tokenizer, on_text) if on_text else None)
+        with torch.no_grad(), timer:
             generated_ids = self.model.generate(
                 **model_inputs,
                 max_new_tokens=max_tokens,
                 temperature=temperature,
                 do_sample=True,
-                top_p=0.9
+                top_p=0.9,
+                past_key_values=prefix_cache,
+                streamer=timer.streamer
             )
         
         generated_ids = [
@@ -67,4 +107,116 @@ class LLMHandler:
         ]
         
         response = self.tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
-        return response
\ No newline at end of file
+        
+        metrics = timer.metrics(
+            prompt_tokens=model_inputs.input_ids.shape[1],
+            generated_tokens=count_generated_tokens(generated_ids, self.tokenizer.pad_token_id)[0],
+            max_new_tokens=max_tokens,
+            cached_prefix_tokens=cached_prefix_tokens
+        )
+        record_generation("llm", metrics)
+        
+        if return_metrics:
+            return response, metrics
+        return response
+    
+    def _prefix_messages(self, system_prompt, conversation_history):
+        """System prompt + conversation history: the part of the prompt known before the query"""
+        messages = [{"role": "system", "content": system_prompt}]
+        
+        # Add conversation history for context
+        messages.extend(conversation_history)
+        return messages
+    
+    def _prefix_text(self, system_prompt, conversation_history):
+        return self.tokenizer.apply_chat_template(
+            self._prefix_messages(system_prompt, conversation_history),
+            tokenize=False,
+            add_generation_prompt=False
+        )
+    
+    @traced("llm.warm_prefix")
+    def warm_prefix(self, system_prompt, conversation_history=[]):
+        """
+        Tokenize and prefill the stable prompt prefix ahead of time
+        (e.g. while the voice query is still being transcribed)
+        """
+        prefix_text = self._prefix_text(system_prompt, conversation_history)
+        
+        with self._prefix_lock:
+            if prefix_text in self._prefix_cache:
+                self._prefix_cache.move_to_end(prefix_text)
+                return
+            pending = self._prefix_pending.get(prefix_text)
+            owner = pending is None
+            if owner:
+                pending = self._prefix_pending[prefix_text] = threading.Event()
+        
+        if not owner:
+            # Same prefix already prefilling - wait for that one, not for every warm-up
+            if not pending.wait(self.prefix_wait_seconds):
+                with self._prefix_lock:
+                    self.prefix_wait_timeouts += 1
+            return
+        
+        try:
+            prefix_ids = self.tokenizer([prefix_text], return_tensors="pt").input_ids.to(self.device)
+            with torch.no_grad():
+                outputs = self.model(
+                    input_ids=prefix_ids,
+                    past_key_values=DynamicCache(),
+                    use_cache=True
+                )
+            
+            with self._prefix_lock:
+                self._prefix_cache[prefix_text] = (prefix_ids, outputs.past_key_values)
+                while len(self._prefix_cache) > self.max_cached_prefixes:
+                    self._prefix_cache.popitem(last=False)
+        finally:
+            with self._prefix_lock:
+                self._prefix_pending.pop(prefix_text, None)
+            pending.set()
+    
+    def _lookup_prefix(self, system_prompt, conversation_history, input_ids):
+        """
+        Copy of the prefilled cache for this prompt's prefix, or None
+        Waits for an in-flight warm_prefix of the same prefix instead of prefilling twice
+        """
+        prefix_text = self._prefix_text(system_prompt, conversation_history)
+        
+        with self._prefix_lock:
+            pending = self._prefix_pending.get(prefix_text)
+        timed_out = pending is not None and not pending.wait(self.prefix_wait_seconds)
+        
+        with self._prefix_lock:
+            if timed_out:
+                self.prefix_wait_timeouts += 1
+            entry = self._prefix_cache.get(prefix_text)
+            if entry is not None:
+                prefix_ids, cache = entry
+                length = prefix_ids.shape[1]
+                # Token boundaries must line up (the prefix ends on a special token)
+                hit = length < input_ids.shape[1] and torch.equal(input_ids[0, :length], prefix_ids[0])
+            else:
+                hit = False
+            if hit:
+                self.prefix_hits += 1
+            else:
+                self.prefix_misses += 1
+        
+        # Cached entries are never mutated, so the copy needs no lock
+        # (generate() extends the cache in place - keep the warm copy pristine)
+        return copy.deepcopy(cache) if hit else None
+    
+    def get_prefix_metrics(self):
+        """Prefix-cache hit rate for monitoring"""
+        with self._prefix_lock:
+            lookups = self.prefix_hits + self.prefix_misses
+            return {
+                "prefix_hits": self.prefix_hits,
+                "prefix_misses": self.prefix_misses,
+                "hit_rate": self.prefix_hits / lookups if lookups else 0.0,
+                "cached_prefixes": len(self._prefix_cache),
+                "pending_prefills": len(self._prefix_pending),
+                "wait_timeouts": self.prefix_wait_timeouts
+            }
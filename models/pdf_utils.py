@@ -0,0 +1,166 @@
+"""
+PDF page helpers for the VLM pipeline
+Decides which pages can be read from the text layer and which need the VLM
+"""
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+# Page paths reported by analyze_pdf
+PATH_TEXT = "text"      # Digital page: text layer extracted directly
+PATH_VLM = "vlm"        # Scanned / image-only page: rendered and sent to the VLM
+PATH_EMPTY = "empty"    # Nothing to extract
+
+
+def has_usable_text_layer(text, min_chars=50, min_alnum_ratio=0.5):
+    """
+    A text layer is usable when it has enough characters and is not
+    mostly garbage from broken font encodings
+    """
+    stripped = "".join(text.split())
+    if len(stripped) < min_chars:
+        return False
+
+    if stripped.count("�") > len(stripped) * 0.05:
+        return False
+
+    alnum = sum(1 for char in stripped if char.isalnum())
+    return alnum / len(stripped) >= min_alnum_ratio
+
+
+def classify_page(page, min_text_chars=50):
+    """
+    Classify a page as PATH_TEXT, PATH_VLM or PATH_EMPTY
+    Returns: (path, text) so the text layer is only read once
+    """
+    text = page.get_text("text")
+
+    if has_usable_text_layer(text, min_chars=min_text_chars):
+        return PATH_TEXT, text
+
+    if page.get_images() or text.strip() or page.get_drawings():
+        return PATH_VLM, text
+
+    return PATH_EMPTY, text
+
+
+def _table_to_markdown(rows):
+    """Render extracted table rows as a compact markdown table"""
+    lines = []
+    for i, row in enumerate(rows):
+        cells = [" ".join(str(cell).split()) if cell is not None else "" for cell in row]
+        lines.append("| " + " | ".join(cells) + " |")
+        if i == 0:
+            lines.append("|" + "---|" * len(cells))
+    return "\n".join(lines)
+
+
+def extract_page_text(page, extract_tables=True):
+    """
+    Extract a digital page's content from its text layer:
+    tables as markdown, remaining text blocks in reading order
+    """
+    table_rects = []
+    tables_md = []
+
+    if extract_tables and hasattr(page, "find_tables"):
+        try:
+            for table in page.find_tables().tables:
+                rows = table.extract()
+                if rows:
+                    table_rects.append(fitz.Rect(table.bbox))
+                    tables_md.append(_table_to_markdown(rows))
+        except Exception as e:
+            # Table detection is best effort - plain text is still usable
+            print(f"⚠️ Table extraction failed on page {page.number + 1}: {e}")
+            table_rects, tables_md = [], []
+
+    text_blocks = []
+    for block in page.get_text("blocks", sort=True):
+        x0, y0, x1, y1, block_text, _, block_type = block[:7]
+        if block_type != 0:  # Skip image blocks
+            continue
+        rect = fitz.Rect(x0, y0, x1, y1)
+        if any(rect.intersects(table_rect) for table_rect in table_rects):
+            continue
+        block_text = " ".join(block_text.split())
+        if block_text:
+            text_blocks.append(block_text)
+
+    return "\n".join(text_blocks + tables_md)
+
+
+def image_page_coverage(page, xref):
+    """Fraction of the page area covered by all placements of an image"""
+    page_area = abs(page.rect) or 1.0
+    try:
+        rects = page.get_image_rects(xref)
+    except Exception:
+        return 0.0
+    return min(1.0, sum(abs(rect & page.rect) for rect in rects) / page_area)
+
+
+def pixmap_to_image(pix):
+    """
+    Convert a PyMuPDF Pixmap to an RGB PIL image entirely in memory
+    - CMYK / indexed / gray colorspaces are converted to RGB by MuPDF
+    - Alpha channels are dropped
+    - Samples are read through the pixmap's memoryview (no PNG encode/decode)
+    """
+    if pix.colorspace is None or pix.colorspace.n != 3:
+        # Stencil masks, gray, CMYK, ... -> RGB
+        pix = fitz.Pixmap(fitz.csRGB, pix)
+    if pix.alpha:
+        pix = fitz.Pixmap(pix, 0)
+    
+    # RGB is not a mappable PIL mode, so this is a single raw decode
+    # straight from MuPDF's buffer - no intermediate bytes object
+    return Image.frombuffer(
+        "RGB", (pix.width, pix.height), pix.samples_mv, "raw", "RGB", pix.stride, 1
+    )
+
+
+def render_page_image(page, dpi=150):
+    """Render a full page to an RGB PIL image without touching disk"""
+    return pixmap_to_image(page.get_pixmap(dpi=dpi, alpha=False))
+
+
+def image_skip_reason(width, height, min_side=64, max_aspect=8.0):
+    """
+    Cheap geometry filter using the image's declared size (before decoding)
+    Returns a reason string for tiny or banner-shaped images, else None
+    """
+    if min(width, height) < min_side:
+        return f"too small ({width}x{height})"
+    aspect = max(width, height) / max(1, min(width, height))
+    if aspect > max_aspect:
+        return f"extreme aspect ratio ({aspect:.1f})"
+    return None
+
+
+def image_entropy(image, max_side=256):
+    """Grayscale histogram entropy in bits - logos and flat graphics score low"""
+    gray = image.convert("L")
+    if max(gray.size) > max_side:
+        gray = gray.reduce(max(1, max(gray.size) // max_side))
+    return gray.entropy()
+
+
+class ImageDeduplicator:
+    """Per-document memory of images already queued, by xref and by content hash"""
+    
+    def __init__(self):
+        self.xrefs = {}
+        self.hashes = {}
+    
+    def seen_xref(self, xref):
+        return self.xrefs.get(xref)
+    
+    def seen_content(self, digest):
+        return self.hashes.get(digest)
+    
+    def add(self, label, xref=None, digest=None):
+        if xref is not None:
+            self.xrefs[xref] = label
+        if digest is not None:
+            self.hashes[digest] = label
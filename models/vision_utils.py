@@ -0,0 +1,173 @@
+"""
+Vision helpers for Qwen2-VL inputs
+Visual token estimates, batch packing and pre-encoding image preprocessing,
+without loading the model
+"""
+
+import math
+
+import numpy as np
+from PIL import Image
+
+# Qwen2-VL: 14px patches merged 2x2 -> one visual token per 28x28 pixels
+IMAGE_FACTOR = 28
+MIN_PIXELS = 4 * 28 * 28
+MAX_PIXELS = 16384 * 28 * 28
+
+
+def smart_resize(height, width, factor=IMAGE_FACTOR, min_pixels=MIN_PIXELS, max_pixels=MAX_PIXELS):
+    """
+    Size the processor will resize an image to (mirrors qwen_vl_utils.smart_resize):
+    both sides divisible by factor, total pixels within [min_pixels, max_pixels]
+    """
+    h_bar = max(factor, round(height / factor) * factor)
+    w_bar = max(factor, round(width / factor) * factor)
+
+    if h_bar * w_bar > max_pixels:
+        beta = math.sqrt((height * width) / max_pixels)
+        h_bar = max(factor, math.floor(height / beta / factor) * factor)
+        w_bar = max(factor, math.floor(width / beta / factor) * factor)
+    elif h_bar * w_bar < min_pixels:
+        beta = math.sqrt(min_pixels / (height * width))
+        h_bar = math.ceil(height * beta / factor) * factor
+        w_bar = math.ceil(width * beta / factor) * factor
+
+    return h_bar, w_bar
+
+
+def estimate_visual_tokens(width, height, min_pixels=MIN_PIXELS, max_pixels=MAX_PIXELS):
+    """Number of visual tokens Qwen2-VL spends on an image of this size"""
+    h_bar, w_bar = smart_resize(height, width, min_pixels=min_pixels, max_pixels=max_pixels)
+    return (h_bar // IMAGE_FACTOR) * (w_bar // IMAGE_FACTOR)
+
+
+def plan_batches(token_counts, batch_size=4, max_visual_tokens=8192):
+    """
+    Group image indices into generate batches
+    - At most batch_size images per batch
+    - At most max_visual_tokens visual tokens per batch (an oversized image runs alone)
+    - Images of similar size are batched together to minimise padding
+    Returns: list of lists of indices into token_counts
+    """
+    order = sorted(range(len(token_counts)), key=lambda i: token_counts[i])
+    batches = []
+    current, current_tokens = [], 0
+
+    for i in order:
+        tokens = token_counts[i]
+        if current and (len(current) >= batch_size or current_tokens + tokens > max_visual_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+
+    if current:
+        batches.append(current)
+
+    return batches
+
+
+def _text_line_height(gray):
+    """
+    Estimate the typical text line height (px) from the horizontal ink profile
+    Returns None when no text-like rows are found
+    """
+    paper = np.median(gray)
+    ink = gray < paper - 60
+    row_ink = ink.mean(axis=1) > 0.002
+    
+    heights = []
+    run = 0
+    for is_text in row_ink:
+        if is_text:
+            run += 1
+        elif run:
+            heights.append(run)
+            run = 0
+    if run:
+        heights.append(run)
+    
+    # Ignore single-pixel rules and specks
+    heights = [h for h in heights if h >= 3]
+    if not heights:
+        return None
+    return float(np.median(heights))
+
+
+def detect_content_box(image, threshold=40, min_fill=0.004, pad_ratio=0.02):
+    """
+    Find the document / table region of a photo or screenshot:
+    pixels that differ from the border colour (desk, margins, background)
+    Returns: (left, top, right, bottom) in image coordinates, or None
+    """
+    # Work on a small copy - the box does not need full resolution
+    step = max(1, max(image.size) // 512)
+    gray = np.asarray(image.convert("L").reduce(step) if step > 1 else image.convert("L"), dtype=np.int16)
+    
+    border = np.concatenate([gray[0], gray[-1], gray[:, 0], gray[:, -1]])
+    background = np.median(border)
+    mask = np.abs(gray - background) > threshold
+    
+    rows = np.where(mask.mean(axis=1) > min_fill)[0]
+    cols = np.where(mask.mean(axis=0) > min_fill)[0]
+    if len(rows) == 0 or len(cols) == 0:
+        return None
+    
+    pad = int(max(gray.shape) * pad_ratio)
+    top = max(0, rows[0] - pad) * step
+    bottom = min(gray.shape[0], rows[-1] + 1 + pad) * step
+    left = max(0, cols[0] - pad) * step
+    right = min(gray.shape[1], cols[-1] + 1 + pad) * step
+    return int(left), int(top), int(min(right, image.size[0])), int(min(bottom, image.size[1]))
+
+
+def preprocess_image(image, min_pixels=256 * 28 * 28, max_pixels=1280 * 28 * 28,
+                     min_text_px=12, crop=True, min_crop_gain=0.05):
+    """
+    Shrink an image before VLM encoding
+    - crop: cut margins / background around the detected document region
+    - downscale to max_pixels, but never so far that text lines drop below min_text_px
+    Returns: (image, info) where info reports visual tokens before and after
+    """
+    image = image.convert("RGB")
+    width, height = image.size
+    info = {
+        "original_size": (width, height),
+        "tokens_before": estimate_visual_tokens(width, height),
+        "crop_box": None,
+        "scale": 1.0
+    }
+    
+    if crop:
+        box = detect_content_box(image)
+        if box:
+            box_area = (box[2] - box[0]) * (box[3] - box[1])
+            if box_area < (1 - min_crop_gain) * width * height:
+                image = image.crop(box)
+                info["crop_box"] = box
+                width, height = image.size
+    
+    scale = 1.0
+    if width * height > max_pixels:
+        scale = math.sqrt(max_pixels / (width * height))
+        
+        # Keep text legible: text lines must stay at least min_text_px tall
+        step = max(1, max(width, height) // 1024)
+        gray = np.asarray(image.convert("L").reduce(step) if step > 1 else image.convert("L"), dtype=np.int16)
+        line_height = _text_line_height(gray)
+        if line_height:
+            scale = max(scale, min(1.0, min_text_px / (line_height * step)))
+    
+    if scale < 1.0:
+        image = image.resize(
+            (max(IMAGE_FACTOR, round(width * scale)), max(IMAGE_FACTOR, round(height * scale))),
+            Image.LANCZOS
+        )
+        info["scale"] = scale
+    
+    width, height = image.size
+    info["size"] = (width, height)
+    info["tokens_after"] = estimate_visual_tokens(
+        width, height, min_pixels=min_pixels, max_pixels=max(max_pixels, width * height)
+    )
+    return image, info
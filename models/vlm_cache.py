@@ -0,0 +1,175 @@
+"""
+Persistent content-addressed cache for VLM extractions
+SQLite store shared by all workers on a machine:
+- Keyed by image content hash + prompt + model ID
+- LRU eviction once the stored text exceeds a size limit
+- File lock around every operation so several processes can share it
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from PIL import Image
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to SQLite's own locking
+    fcntl = None
+
+
+def hash_image(image):
+    """
+    Content hash of an image: PIL images hash their decoded pixels,
+    paths hash the file bytes (so renamed re-uploads still hit)
+    """
+    digest = hashlib.sha256()
+
+    if isinstance(image, Image.Image):
+        digest.update(f"{image.mode}:{image.size}".encode())
+        digest.update(image.tobytes())
+    else:
+        with open(image, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class VLMCache:
+    def __init__(self, path=".tanit_cache/vlm_cache.sqlite", max_mb=256):
+        """
+        path: SQLite file (a sibling .lock file is used for cross-process locking)
+        max_mb: size limit for stored extractions before LRU eviction
+        """
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._thread_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock_path = path + ".lock"
+
+        with self._locked() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS extractions ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_last_access ON extractions(last_access)"
+            )
+
+    @staticmethod
+    def make_key(content_hash, prompt, model_id):
+        """Cache key for one image/page + prompt + model"""
+        return hashlib.sha256(f"{content_hash}\0{prompt}\0{model_id}".encode()).hexdigest()
+
+    @contextmanager
+    def _locked(self):
+        """Thread + process lock around a short-lived SQLite connection"""
+        with self._thread_lock:
+            lock_file = open(self._lock_path, "a")
+            try:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                conn = sqlite3.connect(self.path, timeout=30)
+                try:
+                    with conn:
+                        yield conn
+                finally:
+                    conn.close()
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+    def get_many(self, keys):
+        """
+        Look up several keys at once
+        Returns: dict of key -> cached extraction for the hits
+        """
+        if not keys:
+            return {}
+
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._locked() as conn:
+            for start in range(0, len(unique_keys), 500):
+                chunk = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT key, value FROM extractions WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                found.update(rows)
+
+            if found:
+                now = time.time()
+                conn.executemany(
+                    "UPDATE extractions SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+
+            # Counters share the thread lock with the store, so concurrent lookups never lose counts
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def get(self, key):
+        """Single-key lookup, None on miss"""
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items):
+        """Store key -> extraction pairs, then evict least recently used entries"""
+        if not items:
+            return
+
+        now = time.time()
+        with self._locked() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO extractions (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                [(key, value, len(value.encode("utf-8")), now) for key, value in items.items()]
+            )
+            self._evict(conn)
+
+    def put(self, key, value):
+        self.put_many({key: value})
+
+    def _evict(self, conn):
+        """Drop least recently used entries until under the size limit"""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        excess = total - self.max_bytes
+        doomed = []
+        for key, size in conn.execute("SELECT key, size FROM extractions ORDER BY last_access"):
+            doomed.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM extractions WHERE key = ?", doomed)
+
+    def stats(self):
+        """Hit-rate and size statistics for monitoring"""
+        with self._locked() as conn:
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extractions"
+            ).fetchone()
+            hits, misses = self.hits, self.misses
+
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes
+        }
@@ -3,13 +3,34 @@ from qwen_vl_utils import process_vision_info
 import torch
 from PIL import Image
 import fitz  # PyMuPDF for PDF processing
+import time
+
+from models.vlm_cache import VLMCache, hash_image
+from models.generation_metrics import GenerationTimer, count_generated_tokens, record_generation
+from utils.lab_parser import LAB_JSON_PROMPT
+from utils.tracing import traced
+from models.vision_utils import plan_batches, preprocess_image
+from models.pdf_utils import (
+    PATH_TEXT, PATH_VLM, ImageDeduplicator, classify_page, extract_page_text,
+    image_entropy, image_page_coverage, image_skip_reason, pixmap_to_image, render_page_image
+)
 
 class VLMHandler:
-    def __init__(self, model_name="Qwen/Qwen2-VL-4B-Instruct", quantization="4bit"):
+    PDF_PROMPT = "Extract all visible medical data: hormone values, dates, reference ranges, measurements."
+    
+    def __init__(self, model_name="Qwen/Qwen2-VL-4B-Instruct", quantization="4bit",
+                 batch_size=4, max_visual_tokens=8192,
+                 cache_path=".tanit_cache/vlm_cache.sqlite", cache_max_mb=256,
+                 min_pixels=256 * 28 * 28, max_pixels=1280 * 28 * 28,
+                 min_text_px=12, crop_margins=True):
         """
         Qwen2-VL-4B: SOTA open-source VLM for medical document understanding
         - Perfect for hormone panels, ultrasounds, lab reports
         - 4-bit quantization for Kaggle GPU compatibility
+        - batch_size / max_visual_tokens bound each batched generate call
+        - cache_path: persistent extraction cache shared across sessions (None disables)
+        - min_pixels / max_pixels / min_text_px / crop_margins: image preprocessing
+          before encoding (see models.vision_utils.preprocess_image)
         """
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         
@@ -34,32 +55,164 @@ class VLMHandler:
             )
         
         self.processor = AutoProcessor.from_pretrained(model_name)
+        # Decoder-only batched generation needs left padding
+        self.processor.tokenizer.padding_side = "left"
+        
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_visual_tokens = max_visual_tokens
+        self.cache = VLMCache(cache_path, max_mb=cache_max_mb) if cache_path else None
+        self.min_pixels = min_pixels
+        self.max_pixels = max_pixels
+        self.min_text_px = min_text_px
+        self.crop_margins = crop_margins
         print("✅ VLM loaded successfully")
     
-    def analyze_image(self, image_path, prompt="Describe this medical image in detail."):
+    def analyze_image(self, image_path, prompt="Describe this medical image in detail.", return_metrics=False,
+                      json_mode=False):
         """
         Extract information from medical images:
         - Hormone lab panels
         - Ultrasound scans
         - Cycle tracking charts
+        
+        image_path may be a file path/URL or an in-memory PIL image
+        return_metrics: also return the image's report, including token metrics
+        ("generation"; absent when served from the cache)
+        json_mode: ask for lab results as a JSON array (LAB_JSON_PROMPT) instead of prose
+        """
+        if json_mode:
+            prompt = LAB_JSON_PROMPT
+        if not return_metrics:
+            return self.analyze_images([image_path], prompt=prompt)[0]
+        results, report = self.analyze_images([image_path], prompt=prompt, return_report=True)
+        return results[0], report["images"][0]
+    
+    @traced("vlm.analyze_images")
+    def analyze_images(self, images, prompt="Describe this medical image in detail.",
+                       batch_size=None, max_visual_tokens=None, max_new_tokens=512,
+                       return_report=False):
+        """
+        Analyze several images with batched generation
+        - images: file paths/URLs or PIL images
+        - prompt: one prompt for all images, or a list with one prompt per image
+        - batch_size / max_visual_tokens: override the handler defaults
+        Cached extractions are returned without touching the model; the rest are
+        cropped/downscaled before encoding
+        Returns: list of extractions in the same order as images
+                 (plus a report if return_report: per-image preprocessing and
+                 token metrics, and one "generation" entry per batched call)
+        """
+        if not images:
+            return ([], {"images": [], "generation": []}) if return_report else []
+        
+        batch_size = batch_size or self.batch_size
+        max_visual_tokens = max_visual_tokens or self.max_visual_tokens
+        prompts = prompt if isinstance(prompt, (list, tuple)) else [prompt] * len(images)
+        results = [None] * len(images)
+        
+        # Serve repeat uploads from the persistent cache
+        cache_keys = [self._cache_key(image, p, max_new_tokens) for image, p in zip(images, prompts)]
+        if self.cache:
+            cached = self.cache.get_many([key for key in cache_keys if key])
+            for i, key in enumerate(cache_keys):
+                if key in cached:
+                    results[i] = cached[key]
+        
+        pending = [i for i in range(len(images)) if results[i] is None]
+        image_reports = [{"cached": results[i] is not None} for i in range(len(images))]
+        prepared = {}
+        for i in pending:
+            prepared[i], info = self._prepare_image(images[i])
+            image_reports[i].update(info)
+        
+        token_counts = [image_reports[i]["tokens_after"] for i in pending]
+        if pending:
+            before = sum(image_reports[i]["tokens_before"] for i in pending)
+            print(f"🖼️ VLM preprocessing: {len(pending)} image(s), visual tokens {before} → {sum(token_counts)}")
+        new_entries = {}
+        batch_metrics = []
+        
+        for batch in plan_batches(token_counts, batch_size, max_visual_tokens):
+            batch = [pending[j] for j in batch]
+            outputs, metrics, per_image = self._generate_batch(
+                [prepared[i] for i in batch], [prompts[i] for i in batch], max_new_tokens
+            )
+            batch_metrics.append(metrics)
+            for i, output, image_metrics in zip(batch, outputs, per_image):
+                results[i] = output
+                # Images of a padded batch finish together: each gets an equal share of its wall time
+                image_metrics["seconds"] = round(metrics["total_seconds"] / len(batch), 4)
+                image_reports[i]["generation"] = image_metrics
+                if cache_keys[i]:
+                    new_entries[cache_keys[i]] = output
+        
+        if self.cache and new_entries:
+            self.cache.put_many(new_entries)
+        
+        if return_report:
+            return results, {"images": image_reports, "generation": batch_metrics}
+        return results
+    
+    def _cache_key(self, image, prompt, max_new_tokens):
+        """Content-addressed cache key, None when the image cannot be hashed (e.g. URLs)"""
+        if not self.cache:
+            return None
+        try:
+            content_hash = hash_image(image)
+        except (OSError, TypeError):
+            return None
+        settings = (
+            f"max_new_tokens={max_new_tokens}|pixels={self.min_pixels}-{self.max_pixels}"
+            f"|text_px={self.min_text_px}|crop={self.crop_margins}"
+        )
+        return VLMCache.make_key(content_hash, f"{prompt}|{settings}", self.model_name)
+    
+    def _prepare_image(self, image):
+        """Load, crop and downscale an image before encoding"""
+        if not isinstance(image, Image.Image):
+            image = Image.open(image)
+        return preprocess_image(
+            image,
+            min_pixels=self.min_pixels,
+            max_pixels=self.max_pixels,
+            min_text_px=self.min_text_px,
+            crop=self.crop_margins
+        )
+    
+    @traced("vlm.generate_batch")
+    def _generate_batch(self, images, prompts, max_new_tokens):
         """
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "image", "image": image_path},
-                    {"type": "text", "text": prompt}
-                ]
-            }
+        Run one padded generate call over a batch of images
+        Returns: (texts, batch metrics, per-image token counts)
+        """
+        messages_batch = [
+            [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "image",
+                            "image": image,
+                            "min_pixels": self.min_pixels,
+                            # Legibility may keep an image above max_pixels on purpose
+                            "max_pixels": max(self.max_pixels, image.size[0] * image.size[1])
+                        },
+                        {"type": "text", "text": prompt}
+                    ]
+                }
+            ]
+            for image, prompt in zip(images, prompts)
         ]
         
         # Process inputs
-        text = self.processor.apply_chat_template(
-            messages, tokenize=False, add_generation_prompt=True
-        )
-        image_inputs, video_inputs = process_vision_info(messages)
+        texts = [
+            self.processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+            for messages in messages_batch
+        ]
+        image_inputs, video_inputs = process_vision_info(messages_batch)
         inputs = self.processor(
-            text=[text],
+            text=texts,
             images=image_inputs,
             videos=video_inputs,
             padding=True,
@@ -67,43 +220,166 @@ class VLMHandler:
         ).to(self.device)
         
         # Generate
-        with torch.no_grad():
-            generated_ids = self.model.generate(**inputs, max_new_tokens=512)
-            generated_ids_trimmed = [
-                out_ids[len(in_ids):] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
-            ]
-            output_text = self.processor.batch_decode(
-                generated_ids_trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=False
-            )
+        timer = GenerationTimer(self.device)
+        with torch.no_grad(), timer:
+            generated_ids = self.model.generate(**inputs, max_new_tokens=max_new_tokens, streamer=timer.streamer)
+        generated_ids_trimmed = [
+            out_ids[len(in_ids):] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
+        ]
+        output_text = self.processor.batch_decode(
+            generated_ids_trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=False
+        )
+        
+        # Per image: real prompt tokens (minus left padding), merged 2x2 visual patches, new tokens
+        prompt_tokens = [int(mask.sum()) for mask in inputs.attention_mask]
+        merge = self.processor.image_processor.merge_size ** 2
+        visual_tokens = [int(grid.prod()) // merge for grid in inputs.image_grid_thw]
+        generated = count_generated_tokens(generated_ids_trimmed, self.processor.tokenizer.pad_token_id)
+        per_image = [
+            {"prompt_tokens": p, "visual_tokens": v, "generated_tokens": g,
+             "hit_max_tokens": g >= max_new_tokens}
+            for p, v, g in zip(prompt_tokens, visual_tokens, generated)
+        ]
+        
+        metrics = timer.metrics(
+            prompt_tokens=sum(prompt_tokens),
+            generated_tokens=sum(generated),
+            max_new_tokens=max_new_tokens,
+            visual_tokens=sum(visual_tokens),
+            sequences=len(images)
+        )
+        metrics["batch_size"] = len(images)
+        metrics["hit_max_tokens"] = any(image["hit_max_tokens"] for image in per_image)
+        record_generation("vlm", metrics)
         
-        return output_text[0]
+        return output_text, metrics, per_image
     
-    def analyze_pdf(self, pdf_path):
+    @traced("vlm.analyze_pdf")
+    def analyze_pdf(self, pdf_path, min_text_chars=50, render_dpi=150,
+                    figure_min_coverage=0.25, min_image_side=64, max_image_aspect=8.0,
+                    min_image_entropy=2.0, return_report=False, json_mode=False):
         """
-        Extract images and tables from PDF medical reports
+        Extract medical data from PDF reports page by page:
+        - Digital pages: read directly from the text layer (tables included)
+        - Scanned / image-only pages: rendered and analyzed by the VLM
+        - Large figures (e.g. ultrasounds) on digital pages still go to the VLM
+        - Tiny, banner-shaped, flat or repeated images are skipped and listed in the report
+        All VLM work for the document runs through one batched analyze_images call
+        json_mode: VLM pages return lab results as JSON arrays (LAB_JSON_PROMPT);
+                   text-layer pages stay prose, parse_lab_results reads both
         """
         doc = fitz.open(pdf_path)
-        full_analysis = ""
+        sections = []      # (label, text) in page order; VLM text filled in later
+        vlm_jobs = []      # (section index, image, page index)
+        report = {"pages": [], "vlm_calls": 0, "vlm_seconds": 0.0, "images": [], "generation": [], "skipped_images": []}
+        seen = ImageDeduplicator()
+        filters = {
+            "figure_min_coverage": figure_min_coverage,
+            "min_image_side": min_image_side,
+            "max_image_aspect": max_image_aspect,
+            "min_image_entropy": min_image_entropy
+        }
         
         for page_num in range(len(doc)):
             page = doc[page_num]
+            page_start = time.perf_counter()
+            path, _ = classify_page(page, min_text_chars=min_text_chars)
+            vlm_calls = 0
             
-            # Extract images from page
-            image_list = page.get_images()
-            for img_index, img in enumerate(image_list):
-                xref = img[0]
-                pix = fitz.Pixmap(doc, xref)
+            if path == PATH_TEXT:
+                sections.append((f"Page {page_num+1}, Text", extract_page_text(page)))
                 
-                if pix.n < 5:  # GRAY or RGB
-                    img_path = f"/tmp/page{page_num}_img{img_index}.png"
-                    pix.save(img_path)
+                # Digital reports can still embed figures worth reading;
+                # logos, signatures and letterhead are filtered before inference
+                for img_index, img in enumerate(page.get_images()):
+                    label = f"Page {page_num+1}, Image {img_index+1}"
+                    image, reason = self._screen_pdf_image(doc, page, img, label, seen, filters)
+                    if reason:
+                        report["skipped_images"].append({"page": page_num + 1, "xref": img[0], "reason": reason})
+                        continue
                     
-                    # Analyze extracted image
-                    analysis = self.analyze_image(
-                        img_path,
-                        prompt="Extract all visible medical data: hormone values, dates, reference ranges, measurements."
-                    )
-                    full_analysis += f"\n[Page {page_num+1}, Image {img_index+1}]: {analysis}"
+                    vlm_jobs.append((len(sections), image, page_num))
+                    sections.append((label, None))
+                    vlm_calls += 1
+            
+            elif path == PATH_VLM:
+                # Render the whole page so scanned text and figures are both visible
+                vlm_jobs.append((len(sections), render_page_image(page, dpi=render_dpi), page_num))
+                sections.append((f"Page {page_num+1}, Scan", None))
+                vlm_calls += 1
+            
+            prep_seconds = time.perf_counter() - page_start
+            report["pages"].append({
+                "page": page_num + 1,
+                "path": path,
+                "seconds": prep_seconds,       # prep + this page's share of the batched VLM time
+                "prep_seconds": prep_seconds,  # classification, text extraction, rendering
+                "vlm_seconds": 0.0,
+                "vlm_calls": vlm_calls
+            })
+            report["vlm_calls"] += vlm_calls
         
         doc.close()
-        return full_analysis
\ No newline at end of file
+        
+        if vlm_jobs:
+            vlm_start = time.perf_counter()
+            analyses, image_report = self.analyze_images(
+                [image for _, image, _ in vlm_jobs], prompt=LAB_JSON_PROMPT if json_mode else self.PDF_PROMPT,
+                return_report=True
+            )
+            report["vlm_seconds"] = time.perf_counter() - vlm_start
+            report["images"] = image_report["images"]
+            report["generation"] = image_report["generation"]
+            for (section_index, _, page_index), analysis, image in zip(vlm_jobs, analyses, image_report["images"]):
+                sections[section_index] = (sections[section_index][0], analysis)
+                # Cache hits cost no VLM time
+                page = report["pages"][page_index]
+                page["vlm_seconds"] += image.get("generation", {}).get("seconds", 0.0)
+                page["seconds"] = page["prep_seconds"] + page["vlm_seconds"]
+        
+        for page in report["pages"]:
+            print(f"📄 Page {page['page']}: {page['path']} path, {page['vlm_calls']} VLM image(s), "
+                  f"{page['seconds']*1000:.0f}ms ({page['prep_seconds']*1000:.0f}ms prep + {page['vlm_seconds']*1000:.0f}ms VLM share)")
+        if report["skipped_images"]:
+            print(f"🧹 Skipped {len(report['skipped_images'])} decorative/duplicate image(s)")
+        if vlm_jobs:
+            print(f"👁️ PDF VLM: {len(vlm_jobs)} image(s) in {report['vlm_seconds']:.2f}s (batched)")
+        
+        full_analysis = "".join(f"\n[{label}]: {text}" for label, text in sections)
+        
+        if return_report:
+            return full_analysis, report
+        return full_analysis
+
+    def _screen_pdf_image(self, doc, page, img, label, seen, filters):
+        """
+        Decide whether an embedded PDF image is worth a VLM call
+        Cheapest checks first: xref repeat, declared size, page coverage,
+        then decode for content-hash repeat and entropy
+        Returns: (PIL image, None) to analyze, or (None, skip reason)
+        """
+        xref, width, height = img[0], img[2], img[3]
+        
+        if seen.seen_xref(xref):
+            return None, f"duplicate of {seen.seen_xref(xref)}"
+        seen.add(label, xref=xref)
+        
+        reason = image_skip_reason(width, height, filters["min_image_side"], filters["max_image_aspect"])
+        if reason:
+            return None, reason
+        if image_page_coverage(page, xref) < filters["figure_min_coverage"]:
+            return None, "decorative (small on page)"
+        
+        try:
+            pix = fitz.Pixmap(doc, xref)
+            if seen.seen_content(pix.digest):
+                return None, f"duplicate of {seen.seen_content(pix.digest)}"
+            seen.add(label, digest=pix.digest)
+            image = pixmap_to_image(pix)
+        except Exception as e:
+            return None, f"unreadable ({e})"
+        
+        if image_entropy(image) < filters["min_image_entropy"]:
+            return None, "low entropy (flat graphic)"
+        
+        return image, None
@@ -0,0 +1,462 @@
+"""
+Tanit request pipeline - headless API
+Runs the multimodal pipeline (STT, VLM, GraphRAG, LLM, safety) without a UI and
+returns a structured result: answer, retrieved entities, sources and per-stage timings.
+The Gradio app (app.py) and the bulk JSONL runner (run_batch.py) are thin wrappers over it.
+
+Usage:
+    from pipeline import TanitPipeline, load_components
+    pipeline = TanitPipeline(**load_components())
+    result = pipeline.run(text="What does an AMH of 1.5 ng/mL mean at age 32?")
+
+    for event in pipeline.run_stream(text="..."):   # answer streamed as it is generated
+        print(event.get("delta", ""), end="")
+"""
+
+import os
+import queue
+import sys
+import threading
+import traceback
+import uuid
+from collections import Counter
+from contextlib import nullcontext
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.lab_parser import format_records, parse_lab_results
+from utils.speculation import SpeculationStats, SpeculativeRetriever
+from utils.stage_graph import StageGraph, check_cancelled
+from utils.admission import AdmissionController, AdmissionRejected
+from utils.tracing import tracer
+
+IMAGE_PROMPT = "You are analyzing a medical document. Extract all visible information including: hormone values with units, reference ranges, dates, patient age, and any medical measurements. Be precise and complete."
+
+NO_QUERY_MESSAGE = "⚠️ Please provide a question (text or voice) to get started."
+
+
+def load_components(vlm_model="Qwen/Qwen2-VL-2B-Instruct", llm_model="Qwen/Qwen2.5-3B-Instruct",
+                    stt_model_size="base", quantization="4bit", index_path="rag/graphrag_index"):
+    """
+    Load the production models
+    Returns: dict of components for TanitPipeline(**components)
+    """
+    from models.vlm_handler import VLMHandler
+    from models.llm_handler import LLMHandler
+    from voice.stt import STTHandler
+    from rag.graphrag_query import GraphRAGEngine
+    from utils.safety import SafetyGuardrails
+    from rag.kb_answers import KBAnswerEngine
+
+    print(f"1/5 Loading VLM ({vlm_model})...")
+    vlm = VLMHandler(model_name=vlm_model, quantization=quantization)
+
+    print(f"2/5 Loading LLM ({llm_model})...")
+    llm = LLMHandler(model_name=llm_model, quantization=quantization)
+
+    print(f"3/5 Loading STT (faster-whisper {stt_model_size})...")
+    stt = STTHandler(model_size=stt_model_size)
+
+    print("4/5 Loading GraphRAG knowledge base...")
+    graphrag = GraphRAGEngine(index_path=index_path)
+    kb_answers = KBAnswerEngine(graphrag.knowledge_base)
+
+    print("5/5 Initializing safety guardrails...")
+    safety = SafetyGuardrails()
+
+    return {"vlm": vlm, "llm": llm, "stt": stt, "graphrag": graphrag, "safety": safety, "kb_answers": kb_answers}
+
+
+class TanitPipeline:
+    def __init__(self, vlm, llm, stt, graphrag, safety, kb_answers=None, sessions=None, admission=None,
+                 speculation_stats=None, profiler=None, lab_json_mode=False, history_turns=2, temperature=0.7,
+                 max_tokens=800):
+        """
+        kb_answers: KBAnswerEngine answering plain KB lookups without the LLM (None: always generate)
+        sessions: SessionStore for per-session history (None: every request is stateless)
+        admission: AdmissionController for lane admission and per-stage limits
+                   (None: no admission control, stages run unlimited)
+        profiler: RequestProfiler for sampled / slow-request profiles (None: off)
+        lab_json_mode: ask the VLM for lab results as JSON (LAB_JSON_PROMPT) instead of prose
+        history_turns: previous user/assistant turns given to the LLM
+        """
+        self.vlm = vlm
+        self.llm = llm
+        self.stt = stt
+        self.graphrag = graphrag
+        self.safety = safety
+        self.kb_answers = kb_answers
+        self.sessions = sessions
+        self.admission = admission
+        self.speculation_stats = speculation_stats or SpeculationStats()
+        self.profiler = profiler
+        self.lab_json_mode = lab_json_mode
+        self.history_turns = history_turns
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.gate_counts = Counter()  # requests screened / short-circuited by the pre-inference gate
+        self._gate_lock = threading.Lock()
+
+    def run(self, text=None, audio=None, image=None, pdf=None, session_id="default", on_text=None):
+        """
+        Process one request
+        text: question; audio: file path, (sample_rate, samples) or samples;
+        image / pdf: file paths
+        on_text: called with safety-filtered answer deltas as the LLM generates
+                 (their concatenation is the final answer when status is "ok")
+        Returns: {
+            "request_id": ID shared by the trace, logs and any saved profile,
+            "status": "ok" | "no_query" | "rejected" | "error"
+                      | "invalid" | "crisis" | "urgent" (answered by the pre-inference gate),
+            "answer": response text (friendly message unless status is "ok"),
+            "route": "llm" | "kb" (templated knowledge-base answer, no LLM call) for status "ok",
+            "query": final query (transcript + visual context),
+            "transcript": STT output or None,
+            "entities": retrieved knowledge-base entity names,
+            "sources": medical sources behind the answer,
+            "lab_records": structured lab values parsed from uploads,
+            "timings": {"total", "stages", "offsets", "stage_sum", "overlap"} in seconds,
+            "generation": token metrics per model call {"llm", "image", "pdf"}
+                          (prompt/visual/generated tokens, time to first token, tokens/s, peak memory),
+            "error": error message (status "error" / "rejected")
+        }
+        """
+        input_type = AdmissionController.classify(text, audio, image, pdf)
+        request_id = uuid.uuid4().hex[:12]
+        profile = self.profiler.profile(request_id, input_type=input_type) if self.profiler else nullcontext()
+
+        with tracer.span("request", request_id=request_id, input_type=input_type) as span, profile as session:
+            # Invalid, crisis and urgent input is answered before any model or admission slot
+            result = self.screen(text, audio, image, pdf, span)
+            if result is None and self.admission is None:
+                result = self._run(text, audio, image, pdf, session_id, span, on_text)
+            elif result is None:
+                try:
+                    with self.admission.admit(input_type):
+                        result = self._run(text, audio, image, pdf, session_id, span, on_text)
+                except AdmissionRejected as e:
+                    print(f"🚦 Rejected {input_type} request ({e.reason}): {self.admission.get_metrics()[input_type]}")
+                    result = self._result("rejected", e.friendly_message(), error=str(e))
+            span.set(status=result["status"])
+            if session is not None:
+                session.metadata.update(status=result["status"], timings=result["timings"])
+            result["request_id"] = request_id
+            return result
+
+    def run_stream(self, text=None, audio=None, image=None, pdf=None, session_id="default"):
+        """
+        run() with the answer streamed: yields {"delta": text} events as the LLM
+        generates (already safety-filtered), then {"result": result}
+        """
+        events = queue.Queue()
+
+        def worker():
+            try:
+                result = self.run(text, audio, image, pdf, session_id, on_text=lambda delta: events.put({"delta": delta}))
+                events.put({"result": result})
+            except BaseException as e:
+                events.put({"error": e})
+
+        threading.Thread(target=worker, name="tanit-request", daemon=True).start()
+        while True:
+            event = events.get()
+            if "error" in event:
+                raise event["error"]
+            yield event
+            if "result" in event:
+                return
+
+    def screen(self, text, audio, image, pdf, request_span):
+        """
+        Pre-inference gate: input validation, then crisis / urgent-symptom detection on the text
+        Returns: canned result, or None to run the pipeline
+        """
+        with self._gate_lock:
+            self.gate_counts["screened"] += 1
+        valid, message = self.safety.validate_input(text, audio, image, pdf)
+        if not valid:
+            return self._short_circuit("invalid", f"⚠️ {message}", request_span)
+        return self._screen_text(text, request_span)
+
+    def _screen_text(self, text, request_span, transcript=None):
+        kind, response = self.safety.screen_input(text)
+        if kind is None:
+            return None
+        return self._short_circuit(kind, response.strip(), request_span, transcript=transcript)
+
+    def _short_circuit(self, status, answer, request_span, transcript=None):
+        with self._gate_lock:
+            self.gate_counts[status] += 1
+        request_span.set(short_circuit=status)
+        print(f"🛑 Request {request_span.attributes['request_id']} answered by the pre-inference gate ({status})")
+        return self._result(status, answer, transcript=transcript, timings={"total": request_span.elapsed_seconds()})
+
+    def get_gate_metrics(self):
+        with self._gate_lock:
+            counts = dict(self.gate_counts)
+        screened = counts.pop("screened", 0)
+        short_circuits = sum(counts.values())
+        return {
+            "screened": screened,
+            "short_circuits": short_circuits,
+            "short_circuit_rate": short_circuits / screened if screened else 0.0,
+            **{status: counts.get(status, 0) for status in ("invalid", "crisis", "urgent")}
+        }
+
+    def _stage(self, name):
+        if self.admission:
+            return self.admission.stage(name)
+        check_cancelled()
+        return nullcontext()
+
+    @staticmethod
+    def _result(status, answer, query="", transcript=None, rag_context=None, lab_records=(),
+                timings=None, generation=None, error=None, route=None):
+        rag_context = rag_context or {}
+        return {
+            "status": status,
+            "answer": answer,
+            "route": route,
+            "query": query,
+            "transcript": transcript,
+            "entities": [node["name"] for node in rag_context.get("nodes", [])],
+            "sources": list(rag_context.get("sources", [])),
+            "lab_records": [record.to_dict() for record in lab_records],
+            "timings": timings or {},
+            "generation": generation or {},
+            "error": error
+        }
+
+    def transcribe_with_speculation(self, audio, speculation):
+        """
+        STT stage: stream segments and start retrieval on each partial transcript,
+        so retrieval does not wait for decoding to finish
+        """
+        segments = []
+        with self._stage("stt"):
+            for segment in self.stt.transcribe_stream(audio):
+                segments.append(segment["text"])
+                speculation.update(" ".join(segments))
+        transcript = " ".join(segments).strip()
+        print(f"📝 Transcribed: {transcript[:100]}...")
+        return transcript
+
+    def analyze_image(self, image, generation):
+        with self._stage("vlm"):
+            visual_context, image_report = self.vlm.analyze_image(image, prompt=IMAGE_PROMPT, return_metrics=True,
+                                                                 json_mode=self.lab_json_mode)
+        if "generation" in image_report:
+            generation["image"] = image_report["generation"]
+        print(f"👁️ VLM extracted: {visual_context[:200]}...")
+        return visual_context
+
+    def analyze_pdf(self, pdf, generation):
+        with self._stage("vlm"):
+            pdf_analysis, pdf_report = self.vlm.analyze_pdf(pdf, return_report=True, json_mode=self.lab_json_mode)
+        if pdf_report.get("generation"):
+            generation["pdf"] = pdf_report["generation"]
+        text_pages = sum(1 for page in pdf_report["pages"] if page["path"] == "text")
+        print(f"📄 PDF: {text_pages}/{len(pdf_report['pages'])} pages from text layer, {pdf_report['vlm_calls']} VLM call(s)")
+        return pdf_analysis
+
+    def warm_llm_prefix(self, system_prompt, history):
+        with self._stage("llm"):
+            self.llm.warm_prefix(system_prompt, history)
+
+    @staticmethod
+    def build_visual_context(image=None, pdf=None):
+        """
+        Merge visual branches; compact typed lab records replace the raw VLM prose downstream
+        Returns: (visual_context, lab_records)
+        """
+        visual_context = image or ""
+        if pdf:
+            visual_context += "\n\n" + pdf
+
+        lab_records = parse_lab_results(visual_context) if visual_context else []
+        if lab_records and not all(record.confident for record in lab_records):
+            # An ambiguous parse must not put made-up values or flags in front of the LLM
+            print(f"🧪 Lab parse unsure for {sum(not record.confident for record in lab_records)} value(s), keeping raw VLM text")
+            lab_records = []
+        if lab_records:
+            visual_context = format_records(lab_records)
+            print(f"🧪 Parsed {len(lab_records)} lab value(s)")
+        return visual_context, lab_records
+
+    @staticmethod
+    def build_user_prompt(text_input, visual_context, lab_records, rag_context):
+        if lab_records:
+            visual_section = f"Lab Results (structured, from uploads):\n{visual_context}"
+        elif visual_context:
+            visual_section = f"Visual Analysis (VLM extracted data): {visual_context}"
+        else:
+            visual_section = ""
+
+        return f"""Patient Query: {text_input}
+
+{visual_section}
+
+Relevant Medical Knowledge (GraphRAG):
+{rag_context['formatted_context']}
+
+Instructions:
+- Provide a warm, empathetic, evidence-based response
+- Explain medical terms in plain language
+- Reference the knowledge sources you're drawing from
+- Give actionable next steps when appropriate
+- Include appropriate medical disclaimers
+- Be encouraging and supportive"""
+
+    def _run(self, text_input, audio_input, image_input, pdf_input, session_id, request_span, on_text=None):
+        """
+        Main processing pipeline, run as a dependency graph:
+
+            stt ─────────┐
+            image ───────┼──> context ──> rag ──> llm ──> safety
+            pdf ─────────┘                 ▲       ▲
+            text_rag ──────────────────────┘       │   (typed text + uploads: retrieval overlaps the VLM)
+            prefix ────────────────────────────────┘   (LLM prompt-prefix prefill)
+
+        Independent branches run concurrently; retrieval started on the text alone
+        is reused, or refined once visual data adds new entities. On an early
+        return the graph is cancelled so branches still queued never reach a model
+        """
+        system_prompt = self.safety.get_medical_system_prompt()
+        history = self.sessions.get_history(session_id, last_n=2 * self.history_turns) if self.sessions else []
+        graph = StageGraph()
+        speculation = SpeculativeRetriever(self.graphrag, stats=self.speculation_stats)
+        transcript = None
+        generation = {}  # token metrics filled in by the model stages
+
+        try:
+            # Lookups without uploads ("normal AMH at 38") are answered straight from the knowledge base;
+            # typed ones before any stage starts
+            kb_eligible = self.kb_answers is not None and image_input is None and pdf_input is None
+            if kb_eligible and audio_input is None and text_input and text_input.strip():
+                kb_answer = self.kb_answers.answer(text_input)
+                if kb_answer is not None:
+                    return self._kb_result(kb_answer, text_input, transcript, session_id, graph, request_span, on_text)
+
+            # Nothing to answer: return before any model runs on the uploads
+            if audio_input is None and (not text_input or not text_input.strip()):
+                return self._result("no_query", NO_QUERY_MESSAGE)
+
+            # Step 1: Independent branches start immediately
+            if audio_input is not None:
+                graph.add("stt", lambda: self.transcribe_with_speculation(audio_input, speculation))
+
+            if image_input is not None:
+                graph.add("image", lambda: self.analyze_image(image_input, generation))
+            if pdf_input is not None:
+                graph.add("pdf", lambda: self.analyze_pdf(pdf_input, generation))
+
+            if not graph.has("stt") and (graph.has("image") or graph.has("pdf")):
+                # Retrieval on the typed text overlaps the VLM; without uploads there is nothing to overlap
+                graph.add("text_rag", lambda: speculation.prefetch(text_input))
+
+            if graph.has("stt") or graph.has("image") or graph.has("pdf"):
+                # Prefill the stable prompt prefix while the slow branches run
+                graph.add("prefix", lambda: self.warm_llm_prefix(system_prompt, history))
+
+            if graph.has("stt"):
+                transcript = text_input = graph.result("stt")
+                # Spoken crisis / urgent messages skip retrieval and generation too
+                gated = self._screen_text(transcript, request_span, transcript=transcript)
+                if gated is not None:
+                    return gated
+                if kb_eligible and transcript:
+                    kb_answer = self.kb_answers.answer(transcript)
+                    if kb_answer is not None:
+                        return self._kb_result(kb_answer, transcript, transcript, session_id, graph, request_span, on_text)
+
+            if not text_input or text_input.strip() == "":
+                return self._result("no_query", NO_QUERY_MESSAGE, transcript=transcript)
+
+            # Step 2: Fan in visual branches, then retrieval and generation
+            visual_branches = tuple(name for name in ("image", "pdf") if graph.has(name))
+            graph.add("context", self.build_visual_context, after=visual_branches)
+
+            def retrieve(context, **_):
+                visual_context, _ = context
+                query = text_input + " " + visual_context if visual_context else text_input
+                rag_context = speculation.resolve(query)
+                print(f"📚 Retrieved medical knowledge from GraphRAG (speculation: {self.speculation_stats.get_report()})")
+                return query, rag_context
+
+            def generate(context, rag, **_):
+                visual_context, lab_records = context
+                # Streaming: the safety filter runs on the deltas, disclaimers follow the last one
+                stream = self.safety.stream_filter(rag[1], query_type="fertility") if on_text else None
+
+                def emit(delta):
+                    text = stream.feed(delta)
+                    if text:
+                        on_text(text)
+
+                with self._stage("llm"):
+                    response, generation["llm"] = self.llm.generate(
+                        system_prompt=system_prompt,
+                        user_prompt=self.build_user_prompt(text_input, visual_context, lab_records, rag[1]),
+                        conversation_history=history,
+                        temperature=self.temperature,
+                        max_tokens=self.max_tokens,
+                        return_metrics=True,
+                        on_text=emit if stream else None
+                    )
+                if stream is not None:
+                    on_text(stream.finish())
+                return response, stream
+
+            # resolve() reuses the text_rag prefetch when the visual data adds no new entities
+            graph.add("rag", retrieve, after=("context",) + (("text_rag",) if graph.has("text_rag") else ()))
+            graph.add("llm", generate, after=("context", "rag") + (("prefix",) if graph.has("prefix") else ()))
+
+            response, stream = graph.result("llm")
+            query, rag_context = graph.result("rag")
+            _, lab_records = graph.result("context")
+
+            # Step 3: Safety post-processing (already applied to the deltas when streaming)
+            if stream is not None:
+                response = stream.text
+            else:
+                response = self.safety.post_process(response, rag_context, query_type="fertility")
+
+            # Update conversation history
+            if self.sessions:
+                self.sessions.append(session_id, "user", query[:500])
+                self.sessions.append(session_id, "assistant", response[:500])
+                print(f"🗂️ Sessions: {self.sessions.get_metrics()}")
+
+            stage_report = graph.get_report()
+            timings = dict(stage_report, total=request_span.elapsed_seconds())
+            print(f"⚡ Total latency: {timings['total']:.2f}s ({stage_report['stage_sum']:.2f}s of stage work, {stage_report['overlap']:.1f}x overlap)")
+
+            return self._result("ok", response, query=query, transcript=transcript,
+                                rag_context=rag_context, lab_records=lab_records, timings=timings,
+                                generation=generation, route="llm")
+
+        except Exception as e:
+            print(f"❌ Error in request {request_span.attributes['request_id']}: {str(e)}")
+            traceback.print_exc()
+            timings = dict(graph.get_report(), total=request_span.elapsed_seconds())
+            return self._result("error", self.safety.get_error_message(), transcript=transcript,
+                                timings=timings, generation=generation, error=str(e))
+        finally:
+            # Early returns (gate, KB answer, no query, error) leave visual / prefix branches behind
+            graph.cancel()
+
+    def _kb_result(self, kb_answer, query, transcript, session_id, graph, request_span, on_text=None):
+        """Result for a templated knowledge-base answer (same safety post-processing as the LLM path)"""
+        response = self.safety.post_process(kb_answer.text, kb_answer.rag_context, query_type="fertility")
+        if on_text:
+            on_text(response)
+        if self.sessions:
+            self.sessions.append(session_id, "user", query[:500])
+            self.sessions.append(session_id, "assistant", response[:500])
+
+        request_span.set(route="kb", kb_intent=kb_answer.intent.name)
+        timings = dict(graph.get_report(), total=request_span.elapsed_seconds())
+        print(f"📗 Answered from the knowledge base ({kb_answer.intent.name}) in {timings['total'] * 1000:.1f}ms")
+        return self._result("ok", response, query=query, transcript=transcript, rag_context=kb_answer.rag_context,
+                            timings=timings, route="kb")
@@ -7,6 +7,8 @@ import json
 import os
 from typing import Dict, List
 
+from utils.tracing import traced
+
 class GraphRAGEngine:
     def __init__(self, index_path="rag/graphrag_index"):
         """
@@ -26,31 +28,31 @@ class GraphRAGEngine:
         
         print(f"✅ GraphRAG loaded: {len(self.knowledge_base)} entities")
     
-    def query(self, query_text: str, top_k: int = 5, include_subgraph: bool = True) -> Dict:
+    # Keywords for entity matching
+    KEYWORD_MAP = {
+        "amh": ["amh_levels"],
+        "anti-müllerian": ["amh_levels"],
+        "ovarian reserve": ["amh_levels", "fsh_levels"],
+        "pcos": ["pcos", "amh_levels"],
+        "polycystic": ["pcos"],
+        "fsh": ["fsh_levels"],
+        "follicle stimulating": ["fsh_levels"],
+        "cycle": ["cycle_tracking"],
+        "ovulation": ["cycle_tracking"],
+        "fertile window": ["cycle_tracking"],
+        "tracking": ["cycle_tracking"]
+    }
+    
+    def match_entities(self, query_text: str) -> frozenset:
         """
-        Query the knowledge base using keyword matching
-        Returns relevant entities and formatted context
+        Entities a query retrieves - the query result depends only on this set,
+        so two queries with the same matched entities share a result
         """
         query_lower = query_text.lower()
         
-        # Keywords for entity matching
-        keyword_map = {
-            "amh": ["amh_levels"],
-            "anti-müllerian": ["amh_levels"],
-            "ovarian reserve": ["amh_levels", "fsh_levels"],
-            "pcos": ["pcos", "amh_levels"],
-            "polycystic": ["pcos"],
-            "fsh": ["fsh_levels"],
-            "follicle stimulating": ["fsh_levels"],
-            "cycle": ["cycle_tracking"],
-            "ovulation": ["cycle_tracking"],
-            "fertile window": ["cycle_tracking"],
-            "tracking": ["cycle_tracking"]
-        }
-        
         # Find relevant entities
         relevant_entities = set()
-        for keyword, entities in keyword_map.items():
+        for keyword, entities in self.KEYWORD_MAP.items():
             if keyword in query_lower:
                 relevant_entities.update(entities)
         
@@ -58,12 +60,26 @@ class GraphRAGEngine:
         if not relevant_entities:
             relevant_entities = set(list(self.knowledge_base.keys())[:2])
         
+        return frozenset(relevant_entities)
+    
+    def query(self, query_text: str, top_k: int = 5, include_subgraph: bool = True) -> Dict:
+        """
+        Query the knowledge base using keyword matching
+        Returns relevant entities and formatted context
+        """
+        return self.query_entities(self.match_entities(query_text))
+    
+    @traced("rag.query_entities")
+    def query_entities(self, relevant_entities) -> Dict:
+        """
+        Build the retrieval result for an already matched entity set
+        """
         # Build response
         nodes = []
         relationships = []
         sources = set()
         
-        for entity_key in relevant_entities:
+        for entity_key in sorted(relevant_entities):
             if entity_key in self.knowledge_base:
                 entity_data = self.knowledge_base[entity_key]
                 
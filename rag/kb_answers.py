@@ -0,0 +1,387 @@
+"""
+Knowledge-base fast path for pure lookup questions
+Questions like "what is a normal FSH on day 3?" or "normal AMH at 38" are
+answered exactly by knowledge_base.json. A rule-based intent classifier picks
+out high-confidence lookups and answers them from reviewed templates filled
+with KB values, with no LLM call. Anything personal, ambiguous or outside the
+KB data falls through to the full pipeline.
+
+Usage:
+    kb = KBAnswerEngine(graphrag.knowledge_base)
+    answer = kb.answer("What is a normal AMH at 38?")   # KBAnswer or None
+"""
+
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict
+
+from utils.lab_parser import CONVERSIONS, UNITS, normalize_unit
+
+# Query wording -> KB entity (only entities the templates know how to answer)
+ENTITY_ALIASES = {
+    "amh_levels": ("amh", "anti-müllerian hormone", "anti-mullerian hormone"),
+    "fsh_levels": ("fsh", "follicle stimulating hormone", "follicle-stimulating hormone"),
+    "pcos": ("pcos", "polycystic ovary syndrome", "polycystic ovarian syndrome"),
+    "cycle_tracking": ("fertile window", "cycle tracking"),
+}
+
+LABELS = {"amh_levels": "AMH", "fsh_levels": "FSH", "pcos": "PCOS", "cycle_tracking": "cycle tracking"}
+
+_ALIAS_RE = {
+    entity: re.compile(r"(?<!\w)(?:" + "|".join(re.escape(alias) for alias in aliases) + r")(?!\w)")
+    for entity, aliases in ENTITY_ALIASES.items()
+}
+# Explicit age cues only - "FSH at 12" or "AMH came back at 15" are values, not ages
+_AGE_RE = re.compile(r"\b(?:age|aged|i'm|i am)\s+(\d{2})\b(?!\s*(?:[a-zµμ]+/|%))|\b(\d{2})[\s-]*(?:years?[\s-]old|yo|y/o)\b")
+_CYCLE_DAY_RE = re.compile(r"\b(?:cycle\s+)?day\s+(\d+)(?:\s*-\s*(\d+))?\b")
+_KB_DAY_WINDOW_RE = re.compile(r"\bday\s+(\d+)\s*-\s*(\d+)")
+# The KB ranges are for women; male / partner questions go to the LLM
+_MALE_RE = re.compile(r"\b(?:man|men|male|males|husband|boyfriend|partner|partner's|his|he|he's|son|sperm|semen|testic\w*)\b")
+_VALUE_RE = re.compile(r"(?<![\w.])(\d+(?:\.\d+)?)\s*([a-zµμ]+/[a-z]+)?(?![\w.])")
+_RANGE_CUE_RE = re.compile(r"\b(?:normal|range|reference|typical|average|healthy|good level|expected)\b")
+_DEFINITION_RE = re.compile(r"^(?:what(?:'s| is| are)|define|explain|tell me about)\b")
+_FERTILE_WINDOW_RE = re.compile(r"\b(?:what|when)(?:'s| is| are)\b")
+
+# Signs the question needs reasoning about a person's situation, not a lookup
+_COMPLEXITY_RE = re.compile(
+    r"\b(?:should i|worried|worry|scared|treatment|ivf|iui|chances?|odds|why|how (?:can|do) i|"
+    r"what (?:can|should) i do|pregnan\w*|miscarr\w*|medication|supplements?|improve|increase|"
+    r"lower|raise|cause[sd]?|symptoms?|but|also)\b"
+)
+# A second clause or question joined to the first ("what is PCOS and is it genetic?")
+_SECOND_CLAUSE_RE = re.compile(
+    r"\b(?:and|or)\s+(?:is|are|was|does|do|did|can|could|will|would|how|what|when|where|which|who|it|it's|its|i|i'm|my)\b"
+    r"|[?.!;]\s*[a-z]"
+)
+
+INTERPRETATION_RE = re.compile(r"^\s*([<>]=?)?\s*(\d+(?:\.\d+)?)(?:\s*-\s*(\d+(?:\.\d+)?))?\s*(.*)$")
+_UNIT_RE = re.compile(r"\d\s*([a-zA-Zµ]+/[a-zA-Z]+)")
+
+# Values outside these bounds (in the KB unit) are more likely a different unit or a typo
+PLAUSIBLE_VALUES = {"amh_levels": (0.01, 25.0), "fsh_levels": (0.1, 150.0)}
+
+CLOSING = ("According to {sources}, a single value is best read together with your age, "
+           "your other hormone results and an ultrasound follicle count, so your reproductive "
+           "endocrinologist can explain what your own numbers mean for you.")
+
+# Reviewed answer templates, filled only with knowledge-base values
+TEMPLATES = {
+    "normal_range_age": (
+        "It's completely natural to want to know where you stand. For women aged {age_band}, "
+        "the typical {label} reference range is **{value}**.\n\n{description}.\n\n{notes}\n\n" + CLOSING
+    ),
+    "normal_range_all": (
+        "It's completely natural to want to know where you stand. {description}, and the "
+        "typical {label} reference range depends on age:\n\n{ranges}\n\n{notes}\n\n" + CLOSING
+    ),
+    "normal_range": (
+        "It's completely natural to want to know where you stand. The typical {label} "
+        "reference range is **{value}**.\n\n{description}.\n\n{notes}\n\n" + CLOSING
+    ),
+    "value_interpretation": (
+        "Thank you for sharing your result. An {label} of **{value}** falls in the "
+        "*{band}* band of the clinical interpretation ranges: a value {bound} {meaning}.\n\n"
+        "{reference}\n\n{notes}\n\n" + CLOSING
+    ),
+    "fertile_window": (
+        "Knowing your fertile window can make trying to conceive feel a little more in your "
+        "hands. The fertile window is the **{value}**.\n\nSigns that ovulation is approaching:\n"
+        "{signs}\n\nAccording to {sources}:\n{tips}"
+    ),
+    "definition": (
+        "Good question! {label}: {description}.\n\n{details}\n\nAccording to {sources}, your "
+        "reproductive endocrinologist can explain how this applies to your own situation."
+    ),
+}
+
+
+@dataclass
+class Intent:
+    name: str                 # normal_range | value_interpretation | fertile_window | definition
+    entity: str
+    confidence: float
+    slots: Dict = field(default_factory=dict)
+
+
+@dataclass
+class KBAnswer:
+    text: str
+    intent: Intent
+    rag_context: Dict         # same shape as GraphRAGEngine.query_entities (nodes, sources)
+
+
+def classify_intent(query):
+    """
+    Lookup intent of a query, or None when it is not a single-entity lookup
+    Confidence drops for each sign of a personal or multi-part question
+    """
+    text = " ".join(query.lower().split()).replace("’", "'")
+    entities = [entity for entity, regex in _ALIAS_RE.items() if regex.search(text)]
+    if len(entities) != 1:
+        return None
+    entity = entities[0]
+    if _MALE_RE.search(text):
+        return None
+
+    slots = {}
+    age = _AGE_RE.search(text)
+    if age:
+        slots["age"] = int(age.group(1) or age.group(2))
+        text = text[:age.start()] + text[age.end():]
+    cycle_day = _CYCLE_DAY_RE.search(text)
+    if cycle_day:
+        first, last = cycle_day.group(1), cycle_day.group(2) or cycle_day.group(1)
+        slots["cycle_day"] = (int(first), int(last))
+        text = text[:cycle_day.start()] + text[cycle_day.end():]
+
+    confidence = 1.0
+    confidence -= 0.3 * len(_COMPLEXITY_RE.findall(text))
+    confidence -= 0.3 * len(_SECOND_CLAUSE_RE.findall(text.strip()))
+    confidence -= 0.2 if len(text.split()) > 20 else 0.0
+
+    values = _VALUE_RE.findall(text)
+    if entity in ("amh_levels", "fsh_levels"):
+        if len(values) == 1:
+            value, unit = values[0]
+            slots["value"] = float(value)
+            if unit:
+                slots["unit"] = normalize_unit(unit)
+            return Intent("value_interpretation", entity, confidence, slots)
+        if values:
+            return None
+        if _RANGE_CUE_RE.search(text):
+            return Intent("normal_range", entity, confidence, slots)
+    if values:
+        return None
+    if entity == "cycle_tracking" and _FERTILE_WINDOW_RE.search(text) and "fertile window" in text:
+        return Intent("fertile_window", entity, confidence, slots)
+    if _DEFINITION_RE.search(text) and len(text.split()) <= 8:
+        return Intent("definition", entity, confidence, slots)
+    return None
+
+
+@dataclass
+class Band:
+    name: str
+    low: float
+    high: float
+    meaning: str
+    low_inclusive: bool = True
+    high_inclusive: bool = True
+
+    def contains(self, value):
+        above_low = value >= self.low if self.low_inclusive else value > self.low
+        below_high = value <= self.high if self.high_inclusive else value < self.high
+        return above_low and below_high
+
+
+def parse_interpretation(band, description):
+    """'<1.0 may indicate ...' -> Band (strict for '<' / '>', inclusive for 'a-b'); None if not a numeric band"""
+    match = INTERPRETATION_RE.match(description)
+    if not match or not match.group(4):
+        return None
+    comparator, first, second, meaning = match.groups()
+    if comparator in ("<", "<="):
+        return Band(band, float("-inf"), float(first), meaning, high_inclusive=comparator == "<=")
+    if comparator in (">", ">="):
+        return Band(band, float(first), float("inf"), meaning, low_inclusive=comparator == ">=")
+    if second is not None:
+        return Band(band, float(first), float(second), meaning)
+    return None
+
+
+def _bullets(items):
+    return "\n".join(f"- {item}" for item in items)
+
+
+def _age_band(key):
+    """'age_31_35' -> (31, 35)"""
+    parts = key.split("_")
+    return int(parts[1]), int(parts[2])
+
+
+class KBAnswerEngine:
+    def __init__(self, knowledge_base, min_confidence=0.75):
+        """
+        knowledge_base: the GraphRAG knowledge_base.json dict
+        min_confidence: intents below this fall through to the LLM
+        """
+        self.knowledge_base = knowledge_base
+        self.min_confidence = min_confidence
+        self._lock = threading.Lock()
+        self.counts = Counter()  # queries / answered:<intent> / fallthrough:<reason>
+
+    def answer(self, query):
+        """Templated KB answer for a high-confidence lookup, or None to use the LLM"""
+        intent = classify_intent(query) if query else None
+        if intent is None:
+            return self._record("fallthrough:no_intent")
+        if intent.confidence < self.min_confidence:
+            return self._record("fallthrough:low_confidence")
+        data = self.knowledge_base.get(intent.entity)
+        if not data:
+            return self._record("fallthrough:no_data")
+        reason = self._unanswerable(intent, data)
+        if reason:
+            return self._record(f"fallthrough:{reason}")
+        text = self._render(intent, data)
+        if text is None:
+            return self._record("fallthrough:no_data")
+
+        rag_context = {
+            "nodes": [{"name": intent.entity.replace("_", " ").title(), "description": data.get("description", ""),
+                       "data": data}],
+            "relationships": [],
+            "sources": list(data.get("sources", [])),
+            "formatted_context": ""
+        }
+        self._record(f"answered:{intent.name}")
+        return KBAnswer(text=text, intent=intent, rag_context=rag_context)
+
+    def _record(self, key):
+        with self._lock:
+            self.counts["queries"] += 1
+            self.counts[key] += 1
+        return None
+
+    def get_coverage(self):
+        """Share of queries answered from the KB, by intent and fall-through reason"""
+        with self._lock:
+            counts = dict(self.counts)
+        queries = counts.pop("queries", 0)
+        answered = {key.split(":", 1)[1]: n for key, n in counts.items() if key.startswith("answered:")}
+        fallthrough = {key.split(":", 1)[1]: n for key, n in counts.items() if key.startswith("fallthrough:")}
+        return {
+            "queries": queries,
+            "answered": sum(answered.values()),
+            "coverage": sum(answered.values()) / queries if queries else 0.0,
+            "by_intent": answered,
+            "fallthrough": fallthrough
+        }
+
+    def _render(self, intent, data):
+        label = LABELS[intent.entity]
+        sources = " and ".join(data.get("sources", [])) or "current clinical guidelines"
+        description = data.get("description", "").rstrip(".")
+        notes = _bullets(data.get("clinical_notes", []))
+
+        if intent.name == "normal_range":
+            if "normal_ranges" in data:
+                age = intent.slots.get("age")
+                if age is None:
+                    ranges = _bullets(
+                        f"Age {low}-{high}: {value}"
+                        for (low, high), value in ((_age_band(key), value) for key, value in data["normal_ranges"].items())
+                    )
+                    return TEMPLATES["normal_range_all"].format(
+                        label=label, description=description, ranges=ranges, notes=notes, sources=sources)
+                for key, value in data["normal_ranges"].items():
+                    low, high = _age_band(key)
+                    if low <= age <= high:
+                        return TEMPLATES["normal_range_age"].format(
+                            age_band=f"{low}-{high}", label=label, value=value, description=description,
+                            notes=notes, sources=sources)
+                return None  # age outside the KB's bands
+            if "normal_range" in data:
+                return TEMPLATES["normal_range"].format(
+                    label=label, value=data["normal_range"], description=description, notes=notes, sources=sources)
+            return None
+
+        if intent.name == "value_interpretation":
+            return self._render_value(intent, data, label, notes, sources)
+
+        if intent.name == "fertile_window":
+            if "fertile_window" not in data:
+                return None
+            return TEMPLATES["fertile_window"].format(
+                value=data["fertile_window"], signs=_bullets(data.get("ovulation_signs", [])),
+                tips=_bullets(data.get("timing_recommendations", [])), sources=sources)
+
+        if intent.name == "definition":
+            details = [f"{data['diagnosis_criteria']}"] if "diagnosis_criteria" in data else []
+            details += data.get("clinical_notes", []) or data.get("fertility_impact", [])
+            return TEMPLATES["definition"].format(
+                label=label, description=description, details=_bullets(details), sources=sources)
+        return None
+
+    def _unanswerable(self, intent, data):
+        """Fall-through reason when the KB cannot safely answer this intent, else None"""
+        cycle_day = intent.slots.get("cycle_day")
+        window = _KB_DAY_WINDOW_RE.search(f"{data.get('description', '')} {data.get('normal_range', '')}")
+        if cycle_day and window and not (int(window.group(1)) <= cycle_day[0] <= cycle_day[1] <= int(window.group(2))):
+            return "cycle_day"  # e.g. FSH is only read on day 2-3
+        if intent.name == "value_interpretation":
+            if not intent.slots.get("unit"):
+                return "no_unit"  # "AMH 12" could be ng/mL or pmol/L
+            value, _ = self._value_in_kb_unit(intent, data)
+            if value is None:
+                return "unit"
+            low, high = PLAUSIBLE_VALUES.get(intent.entity, (0.0, float("inf")))
+            if not low <= value <= high:
+                return "implausible_value"
+        return None
+
+    @staticmethod
+    def _kb_unit(data):
+        ranges = data.get("normal_ranges") or {}
+        unit_match = _UNIT_RE.search(" ".join(list(ranges.values()) + [data.get("normal_range", "")]))
+        return normalize_unit(unit_match.group(1)) if unit_match else ""
+
+    def _value_in_kb_unit(self, intent, data):
+        """(value in the KB unit, text shown to the patient), or (None, None) for a unit the KB is not in"""
+        kb_unit = self._kb_unit(data)
+        value, unit = intent.slots["value"], intent.slots["unit"]
+        if unit == kb_unit:
+            return value, f"{value:g} {kb_unit}"
+        conversion = CONVERSIONS.get((LABELS[intent.entity], unit))
+        if unit not in UNITS.values() or not conversion or conversion[0] != kb_unit:
+            return None, None
+        converted = round(value * conversion[1], 2)
+        return converted, f"{value:g} {unit} (about {converted:g} {kb_unit})"
+
+    def _render_value(self, intent, data, label, notes, sources):
+        ranges = data.get("normal_ranges")
+        value, shown = self._value_in_kb_unit(intent, data)
+
+        bands = [parsed for band, text in data.get("interpretation", {}).items()
+                 if (parsed := parse_interpretation(band, text))]
+        matching = [band for band in bands if band.contains(value)]
+        if not matching:
+            return None  # e.g. between the KB's bands: leave it to the LLM
+
+        def tightness(band):
+            if band.low == float("-inf"):
+                return band.high - value
+            if band.high == float("inf"):
+                return value - band.low
+            return band.high - band.low
+
+        band = min(matching, key=tightness)
+        if band.low == float("-inf"):
+            bound = f"{'at or ' if band.high_inclusive else ''}below {band.high:g}"
+        elif band.high == float("inf"):
+            bound = f"{'at or ' if band.low_inclusive else ''}above {band.low:g}"
+        else:
+            bound = f"between {band.low:g} and {band.high:g}"
+
+        age = intent.slots.get("age")
+        reference = None
+        if ranges and age is not None:
+            for key, range_value in ranges.items():
+                low_age, high_age = _age_band(key)
+                if low_age <= age <= high_age:
+                    reference = f"For women aged {low_age}-{high_age}, the typical reference range is {range_value}."
+        elif ranges:
+            reference = "Typical reference ranges by age: " + "; ".join(
+                f"{low_age}-{high_age}: {range_value}"
+                for (low_age, high_age), range_value in ((_age_band(key), v) for key, v in ranges.items())
+            ) + "."
+        elif "normal_range" in data:
+            reference = f"The typical reference range is {data['normal_range']}."
+
+        return TEMPLATES["value_interpretation"].format(
+            label=label, value=shown, band=band.name.replace("_", " "),
+            bound=bound, meaning=band.meaning, reference=reference or "", notes=notes, sources=sources
+        )
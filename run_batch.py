@@ -0,0 +1,182 @@
+"""
+Bulk JSONL runner for the Tanit pipeline (offline evaluation, bulk triage)
+Reads one request per line, processes them concurrently through the headless
+pipeline and writes one JSON result per line plus a throughput summary
+
+Input lines (paths are resolved relative to the input file):
+    {"id": "q1", "text": "What does an AMH of 1.5 ng/mL mean at age 32?"}
+    {"id": "q2", "text": "Explain my results", "image": "panels/amh.png"}
+    {"id": "q3", "audio": "notes/q3.wav", "pdf": "reports/q3.pdf", "session_id": "patient-7"}
+
+Usage:
+    python run_batch.py requests.jsonl --output results.jsonl --workers 4
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pipeline import TanitPipeline, load_components
+from utils.admission import AdmissionController
+from utils.session_store import SessionStore
+
+INPUT_FIELDS = ("audio", "image", "pdf")
+
+
+def load_requests(path):
+    """Parse the JSONL file; media paths are made relative to its directory"""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    requests = []
+    with open(path, "r") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            request.setdefault("id", str(line_number))
+            for field in INPUT_FIELDS:
+                value = request.get(field)
+                if value and not os.path.isabs(value):
+                    request[field] = os.path.join(base_dir, value)
+            requests.append(request)
+    return requests
+
+
+def run_request(pipeline, request):
+    start = time.perf_counter()
+    result = pipeline.run(
+        text=request.get("text"),
+        audio=request.get("audio"),
+        image=request.get("image"),
+        pdf=request.get("pdf"),
+        # Requests sharing a session_id are answered with their shared history
+        session_id=request.get("session_id", request["id"])
+    )
+    result["id"] = request["id"]
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def run_batch(pipeline, requests, workers=4):
+    """
+    Process requests concurrently
+    Yields results as they finish (failures are reported per request, not raised)
+    """
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as executor:
+        futures = {executor.submit(run_request, pipeline, request): request for request in requests}
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                yield {"id": futures[future]["id"], "status": "error", "error": str(e)}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+def summarize(results, wall_seconds):
+    """Throughput, latency percentiles and mean per-stage time over a batch"""
+    latencies = [r["seconds"] for r in results if r.get("status") == "ok"]
+    statuses = {}
+    routes = {}
+    stage_totals = {}
+    for result in results:
+        statuses[result.get("status", "error")] = statuses.get(result.get("status", "error"), 0) + 1
+        if result.get("route"):
+            routes[result["route"]] = routes.get(result["route"], 0) + 1
+        for stage, seconds in result.get("timings", {}).get("stages", {}).items():
+            stage_totals[stage] = stage_totals.get(stage, 0.0) + seconds
+
+    return {
+        "requests": len(results),
+        "statuses": statuses,
+        "routes": routes,
+        "wall_seconds": round(wall_seconds, 3),
+        "requests_per_second": round(len(results) / wall_seconds, 3) if wall_seconds else 0.0,
+        "latency_p50": round(percentile(latencies, 50), 3),
+        "latency_p95": round(percentile(latencies, 95), 3),
+        "latency_max": round(max(latencies), 3) if latencies else 0.0,
+        "mean_stage_seconds": {
+            stage: round(total / len(results), 3) for stage, total in sorted(stage_totals.items())
+        }
+    }
+
+
+def batch_admission(workers, stage_limits):
+    """
+    Admission for offline runs: the worker pool already bounds concurrency,
+    so lanes never reject; only the per-stage model limits apply
+    """
+    lanes = ("text", "audio", "image", "pdf")
+    return AdmissionController(
+        lane_limits={lane: {"concurrency": workers, "max_queue": workers} for lane in lanes},
+        stage_limits=stage_limits,
+        max_wait_seconds=None
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Tanit pipeline over a JSONL file of requests")
+    parser.add_argument("input", help="JSONL file of requests")
+    parser.add_argument("--output", type=str, default="results.jsonl", help="JSONL results file")
+    parser.add_argument("--summary", type=str, default=None, help="Optional JSON file for the throughput summary")
+    parser.add_argument("--workers", type=int, default=4, help="Requests processed concurrently")
+    parser.add_argument("--stt_limit", type=int, default=2, help="Concurrent STT calls")
+    parser.add_argument("--vlm_limit", type=int, default=2, help="Concurrent VLM calls")
+    parser.add_argument("--llm_limit", type=int, default=2, help="Concurrent LLM calls")
+    parser.add_argument("--vlm_model", type=str, default="Qwen/Qwen2-VL-2B-Instruct")
+    parser.add_argument("--llm_model", type=str, default="Qwen/Qwen2.5-3B-Instruct")
+    parser.add_argument("--stt_model_size", type=str, default="base")
+    parser.add_argument("--lab_json_mode", action="store_true", help="Ask the VLM for lab results as JSON")
+    args = parser.parse_args()
+
+    requests = load_requests(args.input)
+    if not requests:
+        print("❌ No requests found")
+        sys.exit(1)
+
+    components = load_components(
+        vlm_model=args.vlm_model,
+        llm_model=args.llm_model,
+        stt_model_size=args.stt_model_size
+    )
+    stage_limits = {"stt": args.stt_limit, "vlm": args.vlm_limit, "llm": args.llm_limit}
+    pipeline = TanitPipeline(
+        **components,
+        sessions=SessionStore(),
+        admission=batch_admission(args.workers, stage_limits),
+        lab_json_mode=args.lab_json_mode
+    )
+
+    print(f"📦 Processing {len(requests)} request(s) with {args.workers} worker(s)...")
+    start = time.perf_counter()
+    results = []
+
+    with open(args.output, "w") as out:
+        for result in run_batch(pipeline, requests, workers=args.workers):
+            results.append(result)
+            out.write(json.dumps(result) + "\n")
+            mark = "✅" if result.get("status") == "ok" else "❌"
+            print(f"{mark} [{len(results)}/{len(requests)}] {result['id']}: {result.get('status')} "
+                  f"({result.get('seconds', 0):.2f}s)")
+
+    summary = summarize(results, time.perf_counter() - start)
+    print(f"\n📊 {json.dumps(summary, indent=2)}")
+    print(f"💾 Results written to {args.output}")
+    if args.summary:
+        with open(args.summary, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""
+Tests for admission limits configured from the environment
+"""
+
+from utils.admission import DEFAULT_LANE_LIMITS, DEFAULT_STAGE_LIMITS, AdmissionController
+
+
+def test_from_env_overrides_defaults(monkeypatch):
+    monkeypatch.setenv("TANIT_ADMISSION_TEXT_CONCURRENCY", "16")
+    monkeypatch.setenv("TANIT_ADMISSION_PDF_QUEUE", "2")
+    monkeypatch.setenv("TANIT_ADMISSION_STT_LIMIT", "3")
+    monkeypatch.setenv("TANIT_ADMISSION_MAX_WAIT_SECONDS", "off")
+    monkeypatch.setenv("TANIT_ADMISSION_OVERFLOW_QUEUE", "40")
+
+    admission = AdmissionController.from_env(max_wait_seconds=30.0)
+    assert (admission.lanes["text"].concurrency, admission.lanes["text"].max_queue) == (16, 32)
+    assert admission.lanes["pdf"].max_queue == 2
+    assert admission.lanes["audio"].concurrency == DEFAULT_LANE_LIMITS["audio"]["concurrency"]
+    assert admission.stage_limits == dict(DEFAULT_STAGE_LIMITS, stt=3)
+    assert (admission.max_wait_seconds, admission.overflow_queue) == (None, 40)
+
+
+def test_from_env_keeps_defaults_without_overrides():
+    admission = AdmissionController.from_env(max_wait_seconds=30.0)
+    assert admission.total_capacity() == sum(l["concurrency"] + l["max_queue"] for l in DEFAULT_LANE_LIMITS.values())
+    assert (admission.max_wait_seconds, admission.overflow_queue) == (30.0, 16)
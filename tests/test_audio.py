@@ -0,0 +1,30 @@
+"""
+Tests for in-memory audio conversion to Whisper's 16 kHz mono float32
+"""
+
+import numpy as np
+
+from voice.audio import WHISPER_SAMPLE_RATE, to_whisper_audio
+
+
+def test_resampling_filters_content_above_the_new_nyquist():
+    rate = 48000
+    t = np.arange(rate) / rate
+    speech_band = to_whisper_audio(np.sin(2 * np.pi * 440 * t).astype(np.float32), rate)
+    too_high = to_whisper_audio(np.sin(2 * np.pi * 10000 * t).astype(np.float32), rate)  # would alias to 6 kHz
+
+    assert len(speech_band) == len(too_high) == WHISPER_SAMPLE_RATE
+    assert speech_band.dtype == np.float32
+    assert np.abs(speech_band[1000:-1000]).max() > 0.95
+    assert np.abs(too_high[1000:-1000]).max() < 0.01
+
+
+def test_integer_pcm_is_scaled_and_centred():
+    tone = np.sin(2 * np.pi * 440 * np.arange(1600) / WHISPER_SAMPLE_RATE)
+    signed = to_whisper_audio((tone * 32767).astype(np.int16), WHISPER_SAMPLE_RATE)
+    unsigned = to_whisper_audio((tone * 127 + 128).astype(np.uint8), WHISPER_SAMPLE_RATE)
+
+    assert np.allclose(signed, tone, atol=1e-3)
+    assert np.allclose(unsigned, tone, atol=2 / 128)   # 8-bit quantization
+    stereo = np.stack([signed, signed], axis=1)
+    assert np.allclose(to_whisper_audio(stereo, WHISPER_SAMPLE_RATE), signed)
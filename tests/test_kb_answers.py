@@ -0,0 +1,92 @@
+"""
+Tests for the knowledge-base fast path: lookup intents are answered from
+templates without the LLM, everything else falls through
+"""
+
+from benchmarks.mock_backends import MockGraphRAG, MockLLM, MockSTT, MockVLM
+from pipeline import TanitPipeline
+from rag.graphrag_query import GraphRAGEngine
+from rag.kb_answers import KBAnswerEngine, classify_intent
+from utils.safety import SafetyGuardrails
+
+
+def test_classifies_lookups_and_rejects_personal_questions():
+    assert classify_intent("What is a normal FSH on day 3?").name == "normal_range"
+    normal_amh = classify_intent("normal AMH at age 38")
+    assert (normal_amh.name, normal_amh.entity, normal_amh.slots["age"]) == ("normal_range", "amh_levels", 38)
+    value = classify_intent("What does an AMH of 1.5 ng/mL mean at age 32?")
+    assert (value.name, value.slots) == ("value_interpretation", {"age": 32, "value": 1.5, "unit": "ng/mL"})
+    assert classify_intent("When is the fertile window?").name == "fertile_window"
+    assert classify_intent("I have PCOS and my AMH is 6, should I worry about IVF?") is None
+    assert classify_intent("What is the link between AMH and FSH?") is None
+    assert classify_intent("What is PCOS?").confidence == 1.0
+    assert classify_intent("What is PCOS and is it genetic?").confidence < 0.75
+    assert classify_intent("What is PCOS? Is it genetic?").confidence < 0.75
+
+
+def test_answers_from_kb_values_and_reports_coverage():
+    engine = GraphRAGEngine()
+    kb = KBAnswerEngine(engine.knowledge_base)
+
+    answer = kb.answer("normal AMH at age 38")
+    assert "36-40" in answer.text and "1.0-3.5 ng/mL" in answer.text
+    assert "ASRM 2023 Guidelines" in answer.rag_context["sources"]
+    assert "borderline" in kb.answer("My FSH is 12 mIU/mL").text
+    assert kb.answer("Is an AMH of 1.2 ng/mL ok?") is None   # between the KB's interpretation bands
+    assert kb.answer("normal AMH at age 50") is None             # outside the age bands
+    assert kb.answer("What is a normal AMH if I want to try IVF?") is None
+
+    coverage = kb.get_coverage()
+    assert (coverage["queries"], coverage["answered"]) == (5, 2)
+    assert coverage["fallthrough"] == {"no_data": 2, "low_confidence": 1}
+
+
+def test_band_boundaries_and_units():
+    kb = KBAnswerEngine(GraphRAGEngine().knowledge_base)
+
+    assert kb.answer("My AMH is 1.0 ng/mL") is None                 # "<1.0" is strict, 1.5-4.0 starts above
+    assert "*normal* band" in kb.answer("My AMH is 4.0 ng/mL").text
+    assert "*borderline* band" in kb.answer("My FSH is 10 mIU/mL").text
+    assert "*borderline* band" in kb.answer("My FSH is 15 mIU/mL").text
+    assert "*elevated* band" in kb.answer("My FSH is 15.5 mIU/mL").text
+
+    assert kb.answer("What does an AMH of 8 pmol/L mean?") is None   # about 1.1 ng/mL, between bands
+    converted = kb.answer("My AMH is 25 pmol/L").text
+    assert "25 pmol/L (about 3.5 ng/mL)" in converted and "*normal* band" in converted
+    assert kb.answer("My AMH is 2 mg/dL") is None
+    assert kb.answer("my amh is 12") is None                  # ng/mL or pmol/L? leave it to the LLM
+    assert kb.answer("My AMH is 80 ng/mL") is None            # implausible in ng/mL
+
+
+def test_values_are_not_ages_and_context_is_respected():
+    fsh = classify_intent("is FSH at 12 normal?")
+    assert fsh.slots == {"value": 12.0} and "age" not in fsh.slots
+    assert classify_intent("my AMH came back at 15").slots == {"value": 15.0}
+    assert classify_intent("I'm 38, what is a normal AMH?").slots == {"age": 38}
+    assert classify_intent("normal AMH for a 38-year-old").slots == {"age": 38}
+    assert classify_intent("What does an FSH of 9 mIU/mL mean for a man?") is None
+    assert classify_intent("my husband's FSH is 9 mIU/mL") is None
+
+    kb = KBAnswerEngine(GraphRAGEngine().knowledge_base)
+    assert kb.answer("is FSH at 12 normal?") is None
+    assert kb.answer("FSH of 8 mIU/mL on day 21") is None      # FSH is read on day 2-3
+    assert kb.answer("What is a normal FSH on day 21?") is None
+    assert "*normal* band" in kb.answer("FSH of 8 mIU/mL on day 3").text
+    assert kb.get_coverage()["fallthrough"] == {"no_unit": 1, "cycle_day": 2}
+
+
+def test_pipeline_fast_path_skips_llm():
+    engine = GraphRAGEngine()
+    pipeline = TanitPipeline(
+        vlm=MockVLM(time_scale=0.01), llm=MockLLM(time_scale=0.01), stt=MockSTT(time_scale=0.01),
+        graphrag=MockGraphRAG(engine, time_scale=0.01), safety=SafetyGuardrails(),
+        kb_answers=KBAnswerEngine(engine.knowledge_base)
+    )
+
+    lookup = pipeline.run(text="What is a normal FSH on day 3?")
+    assert (lookup["status"], lookup["route"]) == ("ok", "kb")
+    assert "3-10 mIU/mL" in lookup["answer"] and "**Important Note:**" in lookup["answer"]
+    assert pipeline.llm.calls == pipeline.graphrag.calls == 0
+
+    question = pipeline.run(text="Could my AMH of 1.1 ng/mL explain why IVF failed?")
+    assert question["route"] == "llm" and pipeline.llm.calls == 1
@@ -0,0 +1,94 @@
+"""
+Tests for structured lab-value extraction
+"""
+
+from benchmarks.mock_backends import MockGraphRAG, MockLLM, MockSTT, MockVLM
+from pipeline import TanitPipeline
+from rag.graphrag_query import GraphRAGEngine
+from utils.lab_parser import format_records, parse_lab_json, parse_lab_results
+from utils.safety import SafetyGuardrails
+
+
+def test_parses_vlm_prose_with_document_date():
+    text = """
+Extracted from hormone panel:
+- AMH: 1.1 ng/mL (slightly below average for age 34)
+- FSH: 8.2 mIU/mL (day 3) - normal range
+Test date: 2024-12-01
+"""
+    records = parse_lab_results(text)
+    assert [(r.analyte, r.value, r.unit) for r in records] == [
+        ("AMH", 1.1, "ng/mL"),
+        ("FSH", 8.2, "mIU/mL"),
+    ]
+    assert all(r.date == "2024-12-01" for r in records)
+
+
+def test_reference_range_sets_flag():
+    records = parse_lab_results("FSH 15.3 mIU/mL Ref: 3.0-10.0 LH 6.7 mIU/mL Ref: 2.0-10.0")
+    assert [(r.analyte, r.reference_range, r.flag) for r in records] == [
+        ("FSH", "3-10", "H"),
+        ("LH", "2-10", None),
+    ]
+
+
+def test_converts_pmol_amh_from_table_row():
+    (record,) = parse_lab_results("| AMH | 7.8 | pmol/L | 10.7-28.6 |")
+    assert record.unit == "ng/mL"
+    assert record.value == 1.09
+    assert record.flag == "L"
+
+
+def test_alias_and_decimal_comma():
+    (record,) = parse_lab_results("Anti-Müllerian Hormone 3,2 ng/ml")
+    assert (record.analyte, record.value) == ("AMH", 3.2)
+
+
+def test_json_mode_output():
+    text = 'Sure: [{"analyte": "amh", "value": "1.2", "unit": "ng/ml", "reference_range": "1.5-4.0", "date": "2024-01-02"}]'
+    (record,) = parse_lab_json(text)
+    assert record.compact() == "AMH 1.2 ng/mL (ref 1.5-4) L @2024-01-02"
+
+
+def test_json_pages_and_text_pages_in_one_pdf():
+    text = (
+        "\n[Page 1, Text]: TSH: 2.1 mIU/L"
+        '\n[Page 2, Scan]: [{"analyte": "FSH", "value": 8.2, "unit": "mIU/mL", "reference_range": "3-10"}]'
+        '\n[Page 3, Scan]: ```json\n[{"analyte": "AMH", "value": 7.8, "unit": "pmol/L"}]\n```'
+    )
+    assert [(r.analyte, r.value, r.unit) for r in parse_lab_results(text)] == [
+        ("FSH", 8.2, "mIU/mL"), ("AMH", 1.09, "ng/mL"), ("TSH", 2.1, "mIU/L")
+    ]
+
+
+def test_pipeline_json_mode_prompts_for_json():
+    pipeline = TanitPipeline(
+        vlm=MockVLM(time_scale=0.01), llm=MockLLM(time_scale=0.01), stt=MockSTT(time_scale=0.01),
+        graphrag=MockGraphRAG(GraphRAGEngine(), time_scale=0.01), safety=SafetyGuardrails(), lab_json_mode=True
+    )
+    result = pipeline.run(text="What do these results mean?", image="panel.png", pdf="report.pdf")
+    assert [(r["analyte"], r["value"]) for r in result["lab_records"]] == [("AMH", 1.1), ("FSH", 8.2)]
+
+
+def test_format_records_is_compact():
+    records = parse_lab_results("TSH: 2.1 mIU/L\nProgesterone 18.5 ng/mL Ref: >10")
+    assert format_records(records) == "- TSH 2.1 mIU/L\n- Progesterone 18.5 ng/mL (ref >10)"
+
+
+def test_skips_qualifiers_before_the_value():
+    (record,) = parse_lab_results("FSH (Day 3): 8.2 mIU/mL")
+    assert (record.analyte, record.value, record.unit, record.confident) == ("FSH", 8.2, "mIU/mL", True)
+
+
+def test_cycle_days_and_dates_are_not_reference_ranges():
+    (estradiol,) = parse_lab_results("Estradiol 180 pg/mL (cycle day 2-3), reference 3-10")
+    assert (estradiol.reference_range, estradiol.ref_low, estradiol.ref_high) == ("3-10", 3.0, 10.0)
+
+    (dated,) = parse_lab_results("Estradiol: 45 pg/mL 2024-01-05")
+    assert (dated.value, dated.reference_range, dated.flag, dated.date) == (45.0, None, None, "2024-01-05")
+
+
+def test_ambiguous_text_falls_back_to_raw_vlm_prose():
+    raw = "FSH 8 mIU/mL 3-10\nAMH 2.5"
+    assert not any(record.confident for record in parse_lab_results(raw))
+    assert TanitPipeline.build_visual_context(image=raw) == (raw, [])
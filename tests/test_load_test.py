@@ -0,0 +1,40 @@
+"""
+Smoke test for the mock-backend load benchmark: the real pipeline under
+concurrent mixed load completes every request and scales with concurrency
+"""
+
+import json
+
+from benchmarks.load_test import main
+
+
+def test_load_test_scales_with_concurrency(tmp_path):
+    output = tmp_path / "load.json"
+    exit_code = main([
+        "--levels", "1,4",
+        "--requests", "12",
+        "--time_scale", "0.01",
+        "--output", str(output),
+    ])
+    assert exit_code == 0
+
+    report = json.loads(output.read_text())
+    serial, concurrent = report["levels"]
+    assert serial["outcomes"] == {"ok": 12}
+    assert concurrent["outcomes"] == {"ok": 12}
+    assert concurrent["throughput_rps"] > serial["throughput_rps"] * 1.5
+    assert set(concurrent["queue_wait"]) >= {"llm", "lane:text"}
+
+
+def test_baseline_regression_fails(tmp_path):
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps({"levels": [
+        {"concurrency": 1, "throughput_rps": 1000.0, "latency": {"p95": 0.001}}
+    ]}))
+    exit_code = main([
+        "--levels", "1",
+        "--requests", "4",
+        "--time_scale", "0.01",
+        "--baseline", str(baseline),
+    ])
+    assert exit_code == 1
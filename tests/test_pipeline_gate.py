@@ -0,0 +1,55 @@
+"""
+Tests for the pre-inference gate: invalid, crisis and urgent input is answered
+without touching any model
+"""
+
+from benchmarks.mock_backends import MockGraphRAG, MockLLM, MockSTT, MockVLM
+from pipeline import TanitPipeline
+from rag.graphrag_query import GraphRAGEngine
+from utils.safety import CRISIS_RESPONSE, URGENT_RESPONSE, SafetyGuardrails
+
+
+def build_pipeline():
+    return TanitPipeline(
+        vlm=MockVLM(time_scale=0.01), llm=MockLLM(time_scale=0.01), stt=MockSTT(time_scale=0.01),
+        graphrag=MockGraphRAG(GraphRAGEngine(), time_scale=0.01), safety=SafetyGuardrails()
+    )
+
+
+def test_gate_short_circuits_before_any_model():
+    pipeline = build_pipeline()
+
+    crisis = pipeline.run(text="I feel like there's no reason to live anymore")
+    urgent = pipeline.run(text="I'm 6 weeks pregnant and I'm in severe pain on one side")
+    invalid = pipeline.run(text="x" * 50000)
+    empty = pipeline.run()
+
+    assert (crisis["status"], crisis["answer"]) == ("crisis", CRISIS_RESPONSE.strip())
+    assert (urgent["status"], urgent["answer"]) == ("urgent", URGENT_RESPONSE.strip())
+    assert invalid["status"] == empty["status"] == "invalid"
+    assert pipeline.llm.calls == pipeline.graphrag.calls == 0
+
+    metrics = pipeline.get_gate_metrics()
+    assert metrics["screened"] == 4 and metrics["short_circuits"] == 4
+    assert (metrics["crisis"], metrics["urgent"], metrics["invalid"]) == (1, 1, 2)
+
+
+def test_gate_screens_transcript_and_passes_questions():
+    pipeline = build_pipeline()
+    pipeline.stt.SEGMENTS = ["I passed out", "and I'm bleeding heavily"]
+
+    spoken = pipeline.run(audio=(16000, [0.0]))
+    question = pipeline.run(text="What causes heavy bleeding with an AMH of 1.1 ng/mL?")
+
+    assert spoken["status"] == "urgent" and spoken["transcript"].startswith("I passed out")
+    assert question["status"] == "ok"
+    assert pipeline.get_gate_metrics()["short_circuits"] == 1
+
+
+def test_gate_catches_urgent_variants_but_not_questions():
+    safety = SafetyGuardrails()
+    for text in ("I'm bleeding a lot and soaking through pads every hour",
+                 "I have really bad pain and feel faint",
+                 "I think I'm fainting"):
+        assert safety.screen_input(text)[0] == "urgent", text
+    assert safety.screen_input("How many pads a day is normal bleeding after a transfer?") == (None, None)
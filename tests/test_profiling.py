@@ -0,0 +1,109 @@
+"""
+Tests for sampled / latency-triggered request profiling
+"""
+
+import json
+import os
+import threading
+import time
+
+from utils.profiling import RequestProfiler
+from utils.stage_graph import StageGraph
+
+
+def busy_stage(seconds):
+    end = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < end:
+        total += 1
+    return total
+
+
+def test_sampled_request_profiles_stage_threads(tmp_path):
+    profiler = RequestProfiler(sample_rate=1.0, output_dir=str(tmp_path), interval=0.002)
+    with profiler.profile("req1", input_type="text") as session:
+        graph = StageGraph()
+        graph.add("work", lambda: busy_stage(0.1))
+        graph.result("work")
+        session.metadata["status"] = "ok"
+
+    (profile_dir,) = os.listdir(tmp_path)
+    assert profile_dir.endswith("_req1")
+    meta = json.loads((tmp_path / profile_dir / "meta.json").read_text())
+    assert meta["trigger"] == "sampled" and meta["status"] == "ok"
+    assert "busy_stage" in (tmp_path / profile_dir / "stacks.txt").read_text()
+    assert "busy_stage" in (tmp_path / profile_dir / "summary.txt").read_text()
+
+
+def unrelated_work(stop):
+    while not stop.is_set():
+        busy_stage(0.01)
+
+
+def blocked_stage(release):
+    release.wait(1)
+
+
+def test_samples_only_the_requests_busy_threads(tmp_path):
+    stop, release = threading.Event(), threading.Event()
+    other_request = threading.Thread(target=unrelated_work, args=(stop,))
+    other_request.start()
+    profiler = RequestProfiler(sample_rate=1.0, output_dir=str(tmp_path), interval=0.002)
+    try:
+        with profiler.profile("req1"):
+            graph = StageGraph()
+            graph.add("blocked", lambda: blocked_stage(release))
+            graph.add("work", lambda: busy_stage(0.1))
+            graph.result("work")
+            release.set()
+            graph.result("blocked")
+    finally:
+        stop.set()
+        other_request.join()
+
+    (profile_dir,) = os.listdir(tmp_path)
+    stacks = (tmp_path / profile_dir / "stacks.txt").read_text()
+    assert "busy_stage" in stacks
+    assert "unrelated_work" not in stacks and "blocked_stage" not in stacks
+
+
+def wait(seconds):
+    """Busy application code that happens to share a name with threading's blocking calls"""
+    end = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < end:
+        total += 1
+    return total
+
+
+def test_idle_frames_match_module_and_function(tmp_path):
+    profiler = RequestProfiler(sample_rate=1.0, output_dir=str(tmp_path), interval=0.002)
+    with profiler.profile("req1"):
+        graph = StageGraph()
+        graph.add("work", lambda: wait(0.1))
+        graph.result("work")
+
+    (profile_dir,) = os.listdir(tmp_path)
+    assert "wait (test_profiling.py" in (tmp_path / profile_dir / "stacks.txt").read_text()
+
+
+def test_latency_trigger_keeps_only_slow_requests(tmp_path):
+    profiler = RequestProfiler(latency_threshold=0.05, output_dir=str(tmp_path))
+    with profiler.profile("fast"):
+        pass
+    with profiler.profile("slow"):
+        busy_stage(0.08)
+    assert [name.split("_")[-1] for name in os.listdir(tmp_path)] == ["slow"]
+
+
+def test_disabled_profiler_and_rotation(tmp_path):
+    with RequestProfiler(output_dir=str(tmp_path)).profile("off") as session:
+        assert session is None
+
+    profiler = RequestProfiler(sample_rate=1.0, output_dir=str(tmp_path), max_profiles=2)
+    for i in range(4):
+        with profiler.profile(f"r{i}"):
+            pass
+        time.sleep(0.01)
+    assert sorted(name.split("_")[-1] for name in os.listdir(tmp_path)) == ["r2", "r3"]
+    assert profiler.configure(latency_threshold="off", sample_rate="0")["sample_rate"] == 0.0
@@ -0,0 +1,35 @@
+"""
+Tests for the GraphRAG retrieval benchmark (benchmarks/retrieval_benchmark.py)
+"""
+
+import json
+
+from benchmarks.retrieval_benchmark import GOLDEN_QUERIES, evaluate_golden, main, score_ranking
+from rag.graphrag_query import GraphRAGEngine
+
+
+def test_scores_rankings_and_golden_set():
+    scores = score_ranking(["pcos", "amh_levels"], ["amh_levels", "fsh_levels"])
+    assert (scores["recall@1"], scores["recall@3"], scores["rr"]) == (0.0, 0.5, 0.5)
+
+    golden = evaluate_golden(GraphRAGEngine())
+    assert golden["queries"] == len(GOLDEN_QUERIES)
+    assert 0.5 < golden["mrr"] <= 1.0 and golden["recall@5"] >= golden["recall@1"]
+    assert all(miss["retrieved"] for miss in golden["misses"])
+
+
+def test_scaling_report_and_regression_check(tmp_path):
+    output = tmp_path / "retrieval.json"
+    args = ["--sizes", "10,300", "--queries", "20"]
+    assert main(args + ["--output", str(output)]) == 0
+
+    report = json.loads(output.read_text())
+    small, large = report["sizes"]
+    assert (small["entities"], large["entities"]) == (10, 300)
+    assert large["keywords"] > small["keywords"] and large["memory_mb"] > small["memory_mb"]
+    assert small["synthetic_recall"] == large["synthetic_recall"] == 1.0
+    assert large["query_latency_ms"]["count"] == 20
+
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps(dict(report, golden=dict(report["golden"], mrr=1.5))))
+    assert main(args + ["--baseline", str(baseline)]) == 1
@@ -0,0 +1,75 @@
+"""
+Tests for the compiled safety rule engine and SafetyGuardrails post-processing
+"""
+
+from utils.safety import HORMONE_NOTE, SOURCE_ATTRIBUTION, SafetyGuardrails
+from utils.safety_rules import EMERGENCY, NUMBER, REWRITE, SafetyRuleEngine
+
+
+def test_rewrites_respect_word_boundaries_and_case():
+    engine = SafetyRuleEngine()
+    result = engine.scan("This is PCOS. You must rest, but this isn't urgent and you haven't failed.")
+    assert result.text == ("This may be PCOS. It's often recommended to rest, "
+                           "but this isn't urgent and you haven't failed.")
+    assert result.categories[REWRITE] == 2
+
+
+def test_longest_phrase_wins_across_line_breaks():
+    result = SafetyRuleEngine().scan("Based on this, you need to\ntake folic acid")
+    assert result.text == "Based on this, your doctor might recommend folic acid"
+
+
+def test_single_scan_collects_every_category():
+    result = SafetyRuleEngine().scan("Heavy bleeding with AMH 0.5 ng/mL", rewrite=False)
+    assert result.has(EMERGENCY) and result.categories[NUMBER] == 2
+    assert result.text == "Heavy bleeding with AMH 0.5 ng/mL"
+
+
+def test_post_process_matches_disclaimers_and_grounding():
+    safety = SafetyGuardrails()
+    response = "You have an AMH of 0.8 ng/ml. Seek care for severe pain."
+    rag_context = {"nodes": [{"id": "AMH"}]}
+
+    processed = safety.post_process(response, rag_context, query_type="fertility")
+    assert processed.startswith("This may suggest an AMH of 0.8 ng/ml.")
+    assert "🚨 **IMPORTANT:**" in processed
+    assert processed.endswith(SOURCE_ATTRIBUTION + HORMONE_NOTE)
+    staged = safety.check_hallucination(safety.apply_disclaimers(response, "fertility"), rag_context)
+    assert processed == staged
+
+    grounded = safety.post_process("According to ASRM, 1.2 ng/ml is in the normal range.", rag_context)
+    assert SOURCE_ATTRIBUTION not in grounded and HORMONE_NOTE not in grounded
+
+
+def test_custom_rules_and_crisis_detection():
+    safety = SafetyGuardrails(rules=[
+        {"name": "soften_cure", "category": REWRITE, "phrases": ["will cure"], "replacement": "may help with"},
+        {"name": "crisis", "category": "crisis", "phrases": ["give up on life"]},
+    ])
+    assert safety.post_process("This will cure it", {}, "general").startswith("This may help with it")
+    assert safety.detect_crisis("I want to give up  on life")[0]
+    assert not SafetyGuardrails().detect_crisis("I want to diet before IVF")[0]
+    assert SafetyGuardrails().detect_crisis("My suicidal thoughts")[0]   # "suicidal" is a crisis phrase
+    assert SafetyGuardrails().detect_crisis("I think about suicide")[0]
+
+
+def test_streaming_filter_matches_post_process_for_any_chunking():
+    safety = SafetyGuardrails()
+    response = ("This is common. You need to\ntake care: AMH 0.8 ng/ml, you must\nrest. "
+                "Seek help for heavy bleeding; this isn't a diagnosis")
+    expected = safety.post_process(response, {"nodes": [{"id": "AMH"}]})
+
+    for size in (1, 2, 3, 7, len(response)):
+        stream = safety.stream_filter({"nodes": [{"id": "AMH"}]})
+        shown = "".join(stream.feed(response[i:i + size]) for i in range(0, len(response), size))
+        assert stream.has(EMERGENCY)
+        assert shown + stream.finish() == expected == stream.text
+
+
+def test_streaming_filter_holds_back_only_possible_matches():
+    stream = SafetyGuardrails().stream_filter({})
+    assert stream.feed("Thank you for asking. ") == "Thank you for asking. "
+    assert stream.feed("You") == ""
+    assert stream.feed(" have") == ""
+    assert stream.feed(" options") == "This may suggest options"
+    assert stream.feed(" at 3") == " at "
@@ -0,0 +1,42 @@
+"""
+Tests for the session store spill file: ceiling evictions are resumable,
+idle-expired sessions are not, and the spill table stays capped
+"""
+
+import sqlite3
+import time
+
+from utils.session_store import SessionStore
+
+
+def spilled_rows(path):
+    conn = sqlite3.connect(path)
+    try:
+        return dict(conn.execute("SELECT session_id, last_access FROM sessions").fetchall())
+    finally:
+        conn.close()
+
+
+def test_ceiling_evictions_resume_and_spill_is_capped(tmp_path):
+    path = str(tmp_path / "sessions.sqlite")
+    store = SessionStore(max_sessions=1, spill_path=path, max_spilled_sessions=2)
+    for session_id in ("a", "b", "c", "d"):
+        store.append(session_id, "user", f"hello from {session_id}")
+
+    assert set(spilled_rows(path)) == {"b", "c"}  # "a" pruned by the row cap, "d" in memory
+    assert store.get_history("c") == [{"role": "user", "content": "hello from c"}]
+    assert store.get_history("a") == []
+    assert store.get_metrics()["resumed"] == 1
+    store.close()
+
+
+def test_idle_sessions_are_not_resumable(tmp_path):
+    path = str(tmp_path / "sessions.sqlite")
+    store = SessionStore(idle_ttl_seconds=60, max_sessions=1, spill_path=path)
+    store.append("old", "user", "stale")
+    store._sessions["old"]["last_access"] = time.time() - 120
+    store.append("new", "user", "fresh")
+
+    assert spilled_rows(path) == {}
+    assert store.get_history("old") == []
+    store.close()
@@ -0,0 +1,60 @@
+"""
+Tests for the request stage graph: retrieval runs once per typed query, and
+stages of a request that returned early never reach a model
+"""
+
+import threading
+from concurrent.futures import CancelledError
+
+import pytest
+
+from benchmarks.mock_backends import MockGraphRAG, MockLLM, MockSTT, MockVLM
+from pipeline import TanitPipeline
+from rag.graphrag_query import GraphRAGEngine
+from utils.safety import SafetyGuardrails
+from utils.stage_graph import StageGraph, check_cancelled
+
+
+def build_pipeline():
+    return TanitPipeline(
+        vlm=MockVLM(time_scale=0.01), llm=MockLLM(time_scale=0.01), stt=MockSTT(time_scale=0.01),
+        graphrag=MockGraphRAG(GraphRAGEngine(), time_scale=0.01), safety=SafetyGuardrails()
+    )
+
+
+def test_typed_query_retrieves_once():
+    pipeline = build_pipeline()
+    for _ in range(3):
+        assert pipeline.run(text="Could my AMH of 1.1 ng/mL explain why IVF failed?")["status"] == "ok"
+    assert pipeline.graphrag.calls == 3
+
+    pipeline.run(text="Could my AMH of 1.1 ng/mL explain why IVF failed?", image="hormone_panel.png")
+    stats = pipeline.speculation_stats.get_report()
+    assert stats["launched"] == 1 and stats["hits"] + stats["misses"] == 1
+
+
+def test_no_query_skips_visual_stages():
+    pipeline = build_pipeline()
+    result = pipeline.run(image="hormone_panel.png")
+    assert result["status"] == "no_query" and pipeline.vlm.calls == 0
+
+
+def test_cancel_skips_pending_and_waiting_stages():
+    graph = StageGraph()
+    release = threading.Event()
+    reached = []
+
+    def waiting():
+        release.wait(5)
+        check_cancelled()  # as before taking an admission slot
+        reached.append("waiting")
+
+    graph.add("waiting", waiting)
+    graph.add("dependent", lambda waiting: reached.append("dependent"), after=("waiting",))
+    graph.cancel()
+    release.set()
+
+    for name in ("waiting", "dependent"):
+        with pytest.raises(CancelledError):
+            graph.result(name, timeout=5)
+    assert reached == []
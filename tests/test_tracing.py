@@ -0,0 +1,65 @@
+"""
+Tests for span tracing, histograms and metrics export
+"""
+
+import threading
+
+from utils.stage_graph import StageGraph
+from utils.tracing import Tracer, tracer
+
+
+def test_spans_nest_and_feed_histograms():
+    t = Tracer()
+
+    @t.traced("inner")
+    def inner():
+        return 42
+
+    with t.span("request", input_type="text") as root:
+        assert inner() == 42
+        with t.span("other"):
+            pass
+
+    assert [child.name for child in root.children] == ["inner", "other"]
+    assert root.end_ns >= root.children[-1].end_ns
+    snapshot = t.snapshot(include_traces=True)
+    assert snapshot["spans"]["inner"]["count"] == 1
+    assert snapshot["recent_traces"][-1]["attributes"] == {"input_type": "text"}
+
+
+def test_generator_spans_cover_iteration():
+    t = Tracer()
+
+    @t.traced("stream")
+    def stream():
+        yield 1
+        yield 2
+
+    with t.span("request") as root:
+        assert list(stream()) == [1, 2]
+    assert [child.name for child in root.children] == ["stream"]
+    assert root.children[0].end_ns is not None
+
+
+def test_percentiles_and_prometheus_export():
+    t = Tracer(window=100)
+    for value in range(1, 101):
+        t.observe("llm.generated_tokens", value)
+    t.register_collector("admission", lambda: {"text": {"active": 2, "rejected": 0}})
+
+    summary = t.snapshot()["metrics"]["llm.generated_tokens"]
+    assert (summary["p50"], summary["p95"], summary["p99"]) == (51, 96, 100)
+
+    text = t.to_prometheus()
+    assert 'tanit_llm_generated_tokens{quantile="0.95"} 96' in text
+    assert "tanit_llm_generated_tokens_count 100" in text
+    assert "tanit_admission_text_active 2.0" in text
+
+
+def test_stage_graph_spans_nest_under_request():
+    with tracer.span("request") as root:
+        graph = StageGraph()
+        graph.add("a", lambda: threading.current_thread().name)
+        graph.add("b", lambda a: a, after=("a",))
+        graph.result("b")
+    assert sorted(child.name for child in root.children) == ["stage.a", "stage.b"]
@@ -0,0 +1,209 @@
+"""
+Admission control and backpressure for the request pipeline
+- Per-input-type lanes: concurrency limit + bounded wait queue
+- Estimated wait from recent service times; requests that would wait too long
+  are rejected immediately with a friendly message
+- Per-stage concurrency limits (GPU-bound VLM/LLM, CPU-bound STT)
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.stage_graph import check_cancelled
+
+DEFAULT_LANE_LIMITS = {
+    "text": {"concurrency": 8, "max_queue": 32},
+    "audio": {"concurrency": 4, "max_queue": 16},
+    "image": {"concurrency": 2, "max_queue": 8},
+    "pdf": {"concurrency": 1, "max_queue": 4},
+}
+
+DEFAULT_STAGE_LIMITS = {
+    "stt": 2,
+    "vlm": 2,
+    "llm": 2,
+}
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, input_type, estimated_wait, reason):
+        self.input_type = input_type
+        self.estimated_wait = estimated_wait
+        self.reason = reason
+        super().__init__(f"{input_type} request rejected: {reason}")
+
+    def friendly_message(self):
+        wait = f" (current wait is about {self.estimated_wait:.0f}s)" if self.estimated_wait else ""
+        return (
+            f"💜 I'm helping a lot of people right now{wait}, so I couldn't take your request "
+            "without keeping you waiting too long.\n\n"
+            "Please try again in a minute. Text-only questions are answered fastest."
+        )
+
+
+class _Lane:
+    def __init__(self, concurrency, max_queue, initial_service_seconds):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.slots = threading.Semaphore(concurrency)
+        self.active = 0
+        self.waiting = 0
+        self.avg_service = initial_service_seconds
+        self.admitted = 0
+        self.rejected = 0
+
+
+class AdmissionController:
+    def __init__(self, lane_limits=None, stage_limits=None, max_wait_seconds=30.0,
+                 initial_service_seconds=None, overflow_queue=16):
+        """
+        lane_limits: {input_type: {"concurrency": n, "max_queue": m}} overrides
+        stage_limits: {stage: max concurrent calls} overrides
+        max_wait_seconds: reject when the estimated queue wait exceeds this
+                          (None: wait for a slot however long it takes)
+        overflow_queue: requests a front end may hold beyond total_capacity() (e.g. Gradio's queue)
+        """
+        limits = {name: dict(values) for name, values in DEFAULT_LANE_LIMITS.items()}
+        for name, values in (lane_limits or {}).items():
+            limits.setdefault(name, {}).update(values)
+
+        service = {"text": 2.0, "audio": 4.0, "image": 6.0, "pdf": 10.0}
+        service.update(initial_service_seconds or {})
+
+        self.max_wait_seconds = max_wait_seconds
+        self.overflow_queue = overflow_queue
+        self._lock = threading.Lock()
+        self.lanes = {
+            name: _Lane(values["concurrency"], values["max_queue"], service.get(name, 5.0))
+            for name, values in limits.items()
+        }
+
+        stage_limits = dict(DEFAULT_STAGE_LIMITS, **(stage_limits or {}))
+        self.stage_limits = stage_limits
+        self._stage_slots = {name: threading.Semaphore(limit) for name, limit in stage_limits.items()}
+
+    @classmethod
+    def from_env(cls, **defaults):
+        """
+        Limits from DEFAULT_LANE_LIMITS / DEFAULT_STAGE_LIMITS with overrides from
+        TANIT_ADMISSION_<LANE>_CONCURRENCY / _<LANE>_QUEUE, TANIT_ADMISSION_<STAGE>_LIMIT,
+        TANIT_ADMISSION_MAX_WAIT_SECONDS ("off": no limit) and TANIT_ADMISSION_OVERFLOW_QUEUE
+        """
+        settings = dict(defaults)
+        lane_limits = {name: dict(values) for name, values in DEFAULT_LANE_LIMITS.items()}
+        for name, values in (settings.get("lane_limits") or {}).items():
+            lane_limits.setdefault(name, {}).update(values)
+        for name, values in lane_limits.items():
+            prefix = f"TANIT_ADMISSION_{name.upper()}"
+            values["concurrency"] = int(os.environ.get(f"{prefix}_CONCURRENCY", values["concurrency"]))
+            values["max_queue"] = int(os.environ.get(f"{prefix}_QUEUE", values["max_queue"]))
+        stage_limits = dict(DEFAULT_STAGE_LIMITS, **(settings.get("stage_limits") or {}))
+        for name, limit in stage_limits.items():
+            stage_limits[name] = int(os.environ.get(f"TANIT_ADMISSION_{name.upper()}_LIMIT", limit))
+
+        max_wait = os.environ.get("TANIT_ADMISSION_MAX_WAIT_SECONDS")
+        if max_wait is not None:
+            settings["max_wait_seconds"] = None if max_wait.lower() in ("off", "none", "") else float(max_wait)
+        overflow = os.environ.get("TANIT_ADMISSION_OVERFLOW_QUEUE")
+        if overflow is not None:
+            settings["overflow_queue"] = int(overflow)
+        settings["lane_limits"] = lane_limits
+        settings["stage_limits"] = stage_limits
+        return cls(**settings)
+
+    @staticmethod
+    def classify(text_input, audio_input, image_input, pdf_input):
+        """Lane for a request: its most expensive input"""
+        if pdf_input is not None:
+            return "pdf"
+        if image_input is not None:
+            return "image"
+        if audio_input is not None:
+            return "audio"
+        return "text"
+
+    def estimated_wait(self, input_type):
+        """Seconds a new request of this type would wait for a slot"""
+        lane = self.lanes[input_type]
+        with self._lock:
+            return self._estimated_wait(lane)
+
+    def _estimated_wait(self, lane):
+        if lane.active < lane.concurrency:
+            return 0.0
+        # Everyone queued ahead plus us, served concurrency-at-a-time
+        return (lane.waiting + 1) * lane.avg_service / lane.concurrency
+
+    @contextmanager
+    def admit(self, input_type):
+        """
+        Hold a lane slot for the duration of a request
+        Raises AdmissionRejected immediately when the queue is full or the
+        estimated wait exceeds max_wait_seconds
+        """
+        lane = self.lanes[input_type]
+
+        with self._lock:
+            wait = self._estimated_wait(lane)
+            if lane.active >= lane.concurrency and lane.waiting >= lane.max_queue:
+                lane.rejected += 1
+                raise AdmissionRejected(input_type, wait, "queue full")
+            if self.max_wait_seconds is not None and wait > self.max_wait_seconds:
+                lane.rejected += 1
+                raise AdmissionRejected(input_type, wait, "estimated wait too long")
+            lane.waiting += 1
+
+        acquired = lane.slots.acquire(timeout=self.max_wait_seconds)
+        with self._lock:
+            lane.waiting -= 1
+            if not acquired:
+                lane.rejected += 1
+                raise AdmissionRejected(input_type, self._estimated_wait(lane), "timed out in queue")
+            lane.active += 1
+            lane.admitted += 1
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                lane.active -= 1
+                # Exponentially weighted service time feeds the wait estimate
+                lane.avg_service = 0.8 * lane.avg_service + 0.2 * elapsed
+            lane.slots.release()
+
+    @contextmanager
+    def stage(self, name):
+        """Limit concurrent calls into one pipeline stage (no-op for unlisted stages)"""
+        check_cancelled()
+        slots = self._stage_slots.get(name)
+        if slots is None:
+            yield
+            return
+        with slots:
+            # The request may have returned while this stage waited for a slot
+            check_cancelled()
+            yield
+
+    def total_capacity(self):
+        """Requests that may be inside the app at once (running + queued)"""
+        return sum(lane.concurrency + lane.max_queue for lane in self.lanes.values())
+
+    def get_metrics(self):
+        with self._lock:
+            return {
+                name: {
+                    "active": lane.active,
+                    "waiting": lane.waiting,
+                    "concurrency": lane.concurrency,
+                    "max_queue": lane.max_queue,
+                    "avg_service_seconds": round(lane.avg_service, 3),
+                    "estimated_wait_seconds": round(self._estimated_wait(lane), 2),
+                    "admitted": lane.admitted,
+                    "rejected": lane.rejected
+                }
+                for name, lane in self.lanes.items()
+            }
@@ -0,0 +1,362 @@
+"""
+Structured lab-value extraction
+Turns VLM / PDF extractions into compact typed records
+(analyte, value, unit, reference range, date, flag) for RAG and the LLM
+"""
+
+import json
+import re
+from dataclasses import asdict, dataclass
+from typing import List, Optional
+
+# Prompt for JSON-mode extraction (VLMHandler json_mode=True) - parse_lab_results accepts either output
+LAB_JSON_PROMPT = (
+    "Extract every lab result in this document as a JSON array. "
+    "Each item: {\"analyte\": str, \"value\": number, \"unit\": str, "
+    "\"reference_range\": str or null, \"date\": \"YYYY-MM-DD\" or null, \"flag\": \"H\", \"L\" or null}. "
+    "Output only the JSON array."
+)
+
+# Canonical analyte name -> aliases as they appear on reports
+ANALYTES = {
+    "AMH": ["amh", "anti-m[uü]llerian hormone", "anti-mullerian hormone", "mullerian inhibiting substance"],
+    "FSH": ["fsh", "follicle[- ]stimulating hormone"],
+    "LH": ["lh", "luteini[sz]ing hormone"],
+    "Estradiol": ["estradiol", "oestradiol", "e2"],
+    "Progesterone": ["progesterone", "p4"],
+    "TSH": ["tsh", "thyroid[- ]stimulating hormone"],
+    "Free T4": ["free t4", "ft4"],
+    "Prolactin": ["prolactin", "prl"],
+    "Testosterone": ["total testosterone", "testosterone"],
+    "DHEA-S": ["dhea-?s", "dhea sulfate"],
+    "SHBG": ["shbg"],
+    "hCG": ["beta[- ]?hcg", "b-?hcg", "hcg"],
+    "Inhibin B": ["inhibin b"],
+    "AFC": ["afc", "antral follicle count"],
+    "Vitamin D": ["vitamin d", "25-oh vitamin d"],
+    "Glucose": ["fasting glucose", "glucose"],
+    "Insulin": ["fasting insulin", "insulin"],
+}
+
+# Lowercased unit spelling -> canonical unit
+UNITS = {
+    "ng/ml": "ng/mL",
+    "pg/ml": "pg/mL",
+    "miu/ml": "mIU/mL",
+    "iu/l": "mIU/mL",        # 1 IU/L == 1 mIU/mL
+    "miu/l": "mIU/L",
+    "uiu/ml": "mIU/L",       # 1 µIU/mL == 1 mIU/L
+    "µiu/ml": "mIU/L",
+    "μiu/ml": "mIU/L",
+    "pmol/l": "pmol/L",
+    "nmol/l": "nmol/L",
+    "ng/dl": "ng/dL",
+    "ug/dl": "µg/dL",
+    "µg/dl": "µg/dL",
+    "μg/dl": "µg/dL",
+    "mg/dl": "mg/dL",
+    "mmol/l": "mmol/L",
+    "follicles": "follicles",
+}
+
+# (analyte, unit) -> (preferred unit, factor) so values compare against KB ranges
+CONVERSIONS = {
+    ("AMH", "pmol/L"): ("ng/mL", 1 / 7.14),
+    ("Estradiol", "pmol/L"): ("pg/mL", 1 / 3.671),
+    ("Progesterone", "nmol/L"): ("ng/mL", 1 / 3.18),
+    ("Testosterone", "nmol/L"): ("ng/dL", 28.84),
+    ("Prolactin", "mIU/L"): ("ng/mL", 1 / 21.2),
+}
+
+_NUMBER = r"\d+(?:[.,]\d+)?"
+
+_ANALYTE_LOOKUP = {}
+for _name, _aliases in ANALYTES.items():
+    for _alias in _aliases:
+        _ANALYTE_LOOKUP[_alias] = _name
+
+_ANALYTE_PATTERN = re.compile(
+    r"(?<![A-Za-z0-9])(?P<analyte>"
+    + "|".join(sorted((alias for aliases in ANALYTES.values() for alias in aliases), key=len, reverse=True))
+    + r")(?![A-Za-z0-9])",
+    re.IGNORECASE
+)
+
+# Parenthesized / bracketed qualifiers and cycle days between the analyte and its value, e.g. "FSH (Day 3): 8.2"
+_QUALIFIER = r"\([^)\n]{0,30}\)|\[[^\]\n]{0,30}\]|(?:cycle\s+)?day\s*\d+(?:\s*(?:-|–|to)\s*\d+)?(?![\d.,])"
+
+_VALUE_PATTERN = re.compile(
+    rf"^(?:{_QUALIFIER}|(?!(?:cycle\s+)?day\s*\d)[^\d\n(\[])" r"{0,40}?"
+    rf"(?P<value>{_NUMBER})(?P<range_shaped>\s*(?:-|–)\s*\d)?\s*(?:\|\s*)?(?P<unit>"
+    + "|".join(re.escape(unit) for unit in sorted(UNITS, key=len, reverse=True))
+    + r")?(?![A-Za-z0-9])",
+    re.IGNORECASE
+)
+
+_RANGE = rf"{_NUMBER}\s*(?:-|–|to)\s*{_NUMBER}|[<>]=?\s*{_NUMBER}"
+
+_RANGE_PATTERN = re.compile(
+    rf"(?P<low>{_NUMBER})\s*(?:-|–|to)\s*(?P<high>{_NUMBER})|(?P<op>[<>]=?)\s*(?P<bound>{_NUMBER})"
+)
+
+# A reference range is only taken after a cue word, or from parentheses / brackets / table cells holding nothing else
+_REFERENCE_PATTERN = re.compile(
+    rf"(?<![A-Za-z])(?:ref(?:erence)?|normal|range)(?![A-Za-z])[^\d<>\n]{{0,20}}?(?P<cued>{_RANGE})"
+    rf"|[(\[]\s*(?P<enclosed>{_RANGE})\s*[)\]]"
+    rf"|\|\s*(?P<cell>{_RANGE})\s*(?=\||$)",
+    re.IGNORECASE
+)
+
+# Spans that look like ranges but never are: dates and cycle days
+_NOT_A_RANGE = re.compile(
+    r"\d{4}-\d{1,2}(?:-\d{1,2})?(?!\d)|\d{1,2}[/.]\d{1,2}[/.]\d{2,4}|(?:cycle\s+)?day\s*\d+\s*(?:-|–|to)\s*\d+",
+    re.IGNORECASE
+)
+
+_RANGE_SHAPE = re.compile(rf"{_NUMBER}\s*(?:-|–)\s*{_NUMBER}")
+
+_FLAG_PATTERN = re.compile(r"(?<![A-Za-z])(?P<flag>H|L|high|low|abnormal)(?![A-Za-z])", re.IGNORECASE)
+
+_MONTHS = "jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec"
+_DATE_PATTERN = re.compile(
+    r"(?P<iso>\d{4}-\d{2}-\d{2})"
+    r"|(?P<dmy>\d{1,2}[/.]\d{1,2}[/.]\d{4})"
+    rf"|(?P<text>(?:{_MONTHS})[a-z]*\.?\s+\d{{1,2}},?\s+\d{{4}})",
+    re.IGNORECASE
+)
+
+
+@dataclass
+class LabRecord:
+    analyte: str
+    value: float
+    unit: Optional[str] = None
+    reference_range: Optional[str] = None
+    ref_low: Optional[float] = None
+    ref_high: Optional[float] = None
+    date: Optional[str] = None
+    flag: Optional[str] = None  # "H", "L" or None (within range / unknown)
+    confident: bool = True      # False when the text was ambiguous (no unit, unclaimed range-like numbers)
+
+    def compact(self) -> str:
+        """One short line for prompts, e.g. 'AMH 1.1 ng/mL (ref 1.5-4.0) L'"""
+        text = f"{self.analyte} {self.value:g}"
+        if self.unit:
+            text += f" {self.unit}"
+        if self.reference_range:
+            text += f" (ref {self.reference_range})"
+        if self.flag:
+            text += f" {self.flag}"
+        if self.date:
+            text += f" @{self.date}"
+        return text
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _to_float(number: str) -> float:
+    return float(number.replace(",", "."))
+
+
+def normalize_unit(unit: Optional[str]) -> Optional[str]:
+    if not unit:
+        return None
+    return UNITS.get(unit.strip().lower().replace(" ", ""), unit.strip())
+
+
+def normalize_date(text: Optional[str]) -> Optional[str]:
+    """Return the first date in text as YYYY-MM-DD when unambiguous, else as written"""
+    if not text:
+        return None
+    match = _DATE_PATTERN.search(text)
+    if not match:
+        return None
+    if match.group("iso"):
+        return match.group("iso")
+    if match.group("dmy"):
+        day, month, year = re.split(r"[/.]", match.group("dmy"))
+        if int(day) > 12:  # Unambiguous day-first
+            return f"{year}-{int(month):02d}-{int(day):02d}"
+        if int(month) > 12:  # Unambiguous month-first
+            return f"{year}-{int(day):02d}-{int(month):02d}"
+    return match.group(0)
+
+
+def _parse_range(text: str):
+    """Parse '1.5-4.0', '<10' or '>10' into (label, low, high)"""
+    match = _RANGE_PATTERN.search(text)
+    if not match:
+        return None, None, None
+    if match.group("low"):
+        low, high = _to_float(match.group("low")), _to_float(match.group("high"))
+        return f"{low:g}-{high:g}", low, high
+    bound = _to_float(match.group("bound"))
+    if match.group("op").startswith("<"):
+        return f"<{bound:g}", None, bound
+    return f">{bound:g}", bound, None
+
+
+def _finalize(record: LabRecord) -> LabRecord:
+    """Convert to preferred units and derive the flag from the reference range"""
+    conversion = CONVERSIONS.get((record.analyte, record.unit))
+    if conversion:
+        unit, factor = conversion
+        record.value = round(record.value * factor, 2)
+        record.ref_low = round(record.ref_low * factor, 2) if record.ref_low is not None else None
+        record.ref_high = round(record.ref_high * factor, 2) if record.ref_high is not None else None
+        if record.reference_range:
+            low = f"{record.ref_low:g}" if record.ref_low is not None else ""
+            high = f"{record.ref_high:g}" if record.ref_high is not None else ""
+            record.reference_range = f"{low}-{high}" if low and high else (f">{low}" if low else f"<{high}")
+        record.unit = unit
+
+    if record.flag is None:
+        if record.ref_low is not None and record.value < record.ref_low:
+            record.flag = "L"
+        elif record.ref_high is not None and record.value > record.ref_high:
+            record.flag = "H"
+    return record
+
+
+def parse_lab_text(text: str) -> List[LabRecord]:
+    """
+    Regex extraction from free text (VLM prose, PDF text layer, markdown tables)
+    One record per analyte mention that is followed by a value
+    """
+    if not text:
+        return []
+
+    records = []
+    document_date = normalize_date(text)
+
+    for line in text.splitlines():
+        date = normalize_date(line) or document_date
+        # Dates and cycle days are never values or reference ranges
+        line = _NOT_A_RANGE.sub(" ", line)
+        for match in _ANALYTE_PATTERN.finditer(line):
+            rest = line[match.end():]
+            value_match = _VALUE_PATTERN.match(rest)
+            if not value_match:
+                continue
+
+            after_value = rest[value_match.end():]
+            # Stop at the next analyte so ranges are not borrowed from neighbours
+            next_analyte = _ANALYTE_PATTERN.search(after_value)
+            if next_analyte:
+                after_value = after_value[:next_analyte.start()]
+
+            label, low, high = None, None, None
+            reference = _REFERENCE_PATTERN.search(after_value)
+            if reference:
+                label, low, high = _parse_range(reference.group("cued") or reference.group("enclosed") or reference.group("cell"))
+                after_value = after_value[:reference.start()] + " " + after_value[reference.end():]
+
+            flag_match = _FLAG_PATTERN.search(_RANGE_PATTERN.sub(" ", after_value))
+            flag = None
+            if flag_match:
+                word = flag_match.group("flag").lower()
+                flag = "H" if word in ("h", "high") else "L" if word in ("l", "low") else None
+
+            records.append(_finalize(LabRecord(
+                analyte=_canonical_analyte(match.group("analyte")),
+                value=_to_float(value_match.group("value")),
+                unit=normalize_unit(value_match.group("unit")),
+                reference_range=label,
+                ref_low=low,
+                ref_high=high,
+                date=date,
+                flag=flag,
+                confident=bool(value_match.group("unit")) and not value_match.group("range_shaped")
+                and not _RANGE_SHAPE.search(after_value)
+            )))
+
+    return _dedupe(records)
+
+
+def _canonical_analyte(raw: str) -> str:
+    """Map an alias matched by a regex alternative (e.g. 'Anti-Müllerian Hormone') to its name"""
+    lowered = raw.lower()
+    if lowered in _ANALYTE_LOOKUP:
+        return _ANALYTE_LOOKUP[lowered]
+    for alias, name in _ANALYTE_LOOKUP.items():
+        if re.fullmatch(alias, lowered):
+            return name
+    return raw
+
+
+def _json_arrays(text: str):
+    """(start, end, items) of every JSON array of objects in text - a PDF holds one per VLM page"""
+    decoder = json.JSONDecoder()
+    arrays = []
+    start = text.find("[")
+    while start != -1:
+        try:
+            items, end = decoder.raw_decode(text, start)
+        except json.JSONDecodeError:
+            items, end = None, start + 1
+        if isinstance(items, list) and all(isinstance(item, dict) for item in items):
+            arrays.append((start, end, items))
+        else:
+            end = start + 1
+        start = text.find("[", end)
+    return arrays
+
+
+def parse_lab_json(text: str) -> List[LabRecord]:
+    """Parse output of LAB_JSON_PROMPT; returns [] if no valid JSON array is found"""
+    records = []
+    for item in (item for _, _, items in _json_arrays(text) for item in items):
+        if not isinstance(item, dict) or "analyte" not in item:
+            continue
+        try:
+            value = _to_float(str(item.get("value")))
+        except ValueError:
+            continue
+        label, low, high = _parse_range(str(item.get("reference_range") or ""))
+        flag = str(item.get("flag") or "").upper()[:1] or None
+        raw_analyte = str(item["analyte"])
+        records.append(_finalize(LabRecord(
+            analyte=_canonical_analyte(raw_analyte),
+            value=value,
+            unit=normalize_unit(item.get("unit")),
+            reference_range=label,
+            ref_low=low,
+            ref_high=high,
+            date=normalize_date(item.get("date")),
+            flag=flag if flag in ("H", "L") else None
+        )))
+    return _dedupe(records)
+
+
+def parse_lab_results(text: str) -> List[LabRecord]:
+    """
+    Parse a VLM extraction: JSON-mode arrays are read as JSON, and any prose
+    around them (e.g. PDF text-layer pages) goes through the regex parser
+    """
+    arrays = _json_arrays(text)
+    if not arrays:
+        return parse_lab_text(text)
+    prose, last = [], 0
+    for start, end, _ in arrays:
+        prose.append(text[last:start])
+        last = end
+    prose.append(text[last:])
+    return _dedupe(parse_lab_json(text) + parse_lab_text("\n".join(prose)))
+
+
+def _dedupe(records: List[LabRecord]) -> List[LabRecord]:
+    """Drop repeats of the same analyte/value/date (e.g. a PDF table echoed in prose)"""
+    seen = set()
+    unique = []
+    for record in records:
+        key = (record.analyte, record.value, record.date)
+        if key not in seen:
+            seen.add(key)
+            unique.append(record)
+    return unique
+
+
+def format_records(records: List[LabRecord]) -> str:
+    """Compact multi-line summary for retrieval queries and LLM prompts"""
+    return "\n".join(f"- {record.compact()}" for record in records)
@@ -0,0 +1,328 @@
+"""
+Opt-in sampled profiling for the request pipeline
+A request is profiled when it is picked by the sample rate, or kept after the
+fact when it ran longer than a latency threshold. The profile is a sampling
+stack profile of the threads the request is running on: its own thread plus
+the stage threads working for it (the pipeline spreads a request over stage
+threads, so a single-thread cProfile would only see the request waiting).
+Threads parked in a blocking call are idle and not counted.
+An armed latency_threshold samples every request (every 5 ms by default), but
+only the threads working for that request are walked, so the cost grows with a
+request's own stage threads, not with server load.
+Sampled requests can also record a torch profiler trace around the model calls.
+
+Each kept profile goes to its own directory, named by time and request ID:
+    .tanit_cache/profiles/20260101-120000_<request_id>/
+        meta.json         request ID, trigger, latency, status
+        stacks.txt        collapsed stacks (flamegraph.pl / speedscope input)
+        summary.txt       top functions by self and inclusive samples
+        torch_trace.json  chrome trace (optional)
+Only the newest max_profiles directories are kept.
+
+Settings can be changed at runtime with configure() (app.py exposes it on the
+local metrics endpoint), so profiling needs no redeploy.
+"""
+
+import concurrent.futures.thread
+import contextvars
+import json
+import os
+import queue
+import random
+import selectors
+import shutil
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# A thread whose innermost Python frame is one of these (module file, function) pairs
+# is blocked, not busy: Condition/Event.wait, Semaphore.acquire, Thread.join, queue
+# get/put, selectors and idle ThreadPoolExecutor workers (their C-level SimpleQueue.get
+# has no frame). Matching the file keeps application functions named e.g. "wait" busy.
+IDLE_LEAF_FUNCTIONS = {
+    (threading.__file__, "wait"),
+    (threading.__file__, "acquire"),
+    (threading.__file__, "join"),
+    (threading.__file__, "_wait_for_tstate_lock"),
+    (queue.__file__, "get"),
+    (queue.__file__, "put"),
+    (selectors.__file__, "select"),
+    (concurrent.futures.thread.__file__, "_worker"),
+}
+
+# Session of the request whose context this code runs in (stage threads inherit it)
+_active_session = contextvars.ContextVar("tanit_profile_session", default=None)
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame):
+    """Root-first 'a;b;c' stack of a frame, or None for idle threads"""
+    if (frame.f_code.co_filename, frame.f_code.co_name) in IDLE_LEAF_FUNCTIONS:
+        return None
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class ProfileSession:
+    """Samples collected for one request"""
+
+    def __init__(self, request_id, sampled, metadata):
+        self.request_id = request_id
+        self.sampled = sampled
+        self.metadata = metadata
+        self.stacks = Counter()
+        self.samples = 0
+        self.started = time.time()
+        self._threads = Counter()  # thread id -> nesting depth of track_thread() blocks
+        self._lock = threading.Lock()
+
+    def enter_thread(self):
+        with self._lock:
+            self._threads[threading.get_ident()] += 1
+
+    def exit_thread(self):
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._threads[thread_id] -= 1
+            if self._threads[thread_id] <= 0:
+                del self._threads[thread_id]
+
+    def thread_ids(self):
+        with self._lock:
+            return set(self._threads)
+
+
+@contextmanager
+def track_thread():
+    """
+    Count the current thread towards the profile of the request it works for
+    (if any) while the block runs - StageGraph wraps every stage in this
+    """
+    session = _active_session.get()
+    if session is None:
+        yield
+        return
+    session.enter_thread()
+    try:
+        yield
+    finally:
+        session.exit_thread()
+
+
+class _StackSampler:
+    """One background thread sampling the sessions' threads while any session is active"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._sessions = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, session):
+        with self._lock:
+            self._sessions.add(session)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+
+    def remove(self, session):
+        with self._lock:
+            self._sessions.discard(session)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._sessions:
+                    self._thread = None
+                    return
+                threads = {session: session.thread_ids() for session in self._sessions}
+
+            # Only the threads working for a profiled request are collapsed
+            frames = sys._current_frames()
+            stacks = {
+                thread_id: _collapse(frames[thread_id])
+                for thread_id in set().union(*threads.values()) if thread_id in frames
+            }
+
+            with self._lock:
+                # Updated under the lock so a removed session is never written to again
+                for session in self._sessions:
+                    session.stacks.update(
+                        stacks[thread_id] for thread_id in threads.get(session, ()) if stacks.get(thread_id)
+                    )
+                    session.samples += 1
+            time.sleep(self.interval)
+
+
+class RequestProfiler:
+    def __init__(self, sample_rate=0.0, latency_threshold=None, output_dir=".tanit_cache/profiles",
+                 max_profiles=50, interval=0.005, torch_trace=False):
+        """
+        sample_rate: fraction of requests profiled up front (0 disables)
+        latency_threshold: seconds; every request is sampled and kept only if slower
+                           (None disables). While armed the sampler runs every interval
+                           for every request, limited to that request's own threads
+        max_profiles: newest profile directories kept in output_dir
+        interval: seconds between stack samples
+        torch_trace: also record a torch profiler trace for sample-rate picks
+                     (threshold-only requests are not known to be slow in advance)
+        """
+        self.sample_rate = sample_rate
+        self.latency_threshold = latency_threshold
+        self.output_dir = output_dir
+        self.max_profiles = max_profiles
+        self.torch_trace = torch_trace
+        self._sampler = _StackSampler(interval)
+        self._torch_lock = threading.Lock()  # the torch profiler is process-global
+        self._rng = random.Random()
+        self.profiled = 0
+        self.kept = 0
+
+    @classmethod
+    def from_env(cls, **defaults):
+        """Settings from TANIT_PROFILE_SAMPLE_RATE / _LATENCY_SECONDS / _TORCH / _DIR"""
+        threshold = os.environ.get("TANIT_PROFILE_LATENCY_SECONDS")
+        settings = dict(defaults)
+        settings["sample_rate"] = float(os.environ.get("TANIT_PROFILE_SAMPLE_RATE", settings.get("sample_rate", 0.0)))
+        settings["latency_threshold"] = float(threshold) if threshold else settings.get("latency_threshold")
+        settings["torch_trace"] = os.environ.get("TANIT_PROFILE_TORCH", "") == "1" or settings.get("torch_trace", False)
+        settings["output_dir"] = os.environ.get("TANIT_PROFILE_DIR", settings.get("output_dir", ".tanit_cache/profiles"))
+        return cls(**settings)
+
+    def configure(self, sample_rate=None, latency_threshold=None, torch_trace=None):
+        """
+        Change settings at runtime; returns the current settings
+        Values may be strings (from the metrics endpoint); latency_threshold="off" disarms the trigger
+        """
+        if sample_rate is not None:
+            self.sample_rate = float(sample_rate)
+        if latency_threshold is not None:
+            off = str(latency_threshold).lower() in ("off", "none", "")
+            self.latency_threshold = None if off else float(latency_threshold)
+        if torch_trace is not None:
+            self.torch_trace = str(torch_trace).lower() in ("1", "true", "yes", "on")
+        return self.get_settings()
+
+    def get_settings(self):
+        return {
+            "sample_rate": self.sample_rate,
+            "latency_threshold": self.latency_threshold,
+            "torch_trace": self.torch_trace,
+            "output_dir": self.output_dir,
+            "max_profiles": self.max_profiles,
+            "profiled": self.profiled,
+            "kept": self.kept
+        }
+
+    @contextmanager
+    def profile(self, request_id, **metadata):
+        """
+        Profile one request if it is picked or a latency trigger is armed
+        Yields the session (None when not profiled); set session.metadata["status"]
+        etc. before the block ends to have it written to meta.json
+        """
+        sampled = self.sample_rate > 0 and self._rng.random() < self.sample_rate
+        if not sampled and self.latency_threshold is None:
+            yield None
+            return
+
+        session = ProfileSession(request_id, sampled, dict(metadata))
+        self.profiled += 1
+        torch_profile = self._start_torch() if sampled and self.torch_trace else None
+        token = _active_session.set(session)
+        session.enter_thread()
+        self._sampler.add(session)
+        start = time.perf_counter()
+        try:
+            yield session
+        finally:
+            elapsed = time.perf_counter() - start
+            self._sampler.remove(session)
+            session.exit_thread()
+            _active_session.reset(token)
+            if torch_profile is not None:
+                torch_profile.__exit__(None, None, None)
+                self._torch_lock.release()
+
+            slow = self.latency_threshold is not None and elapsed >= self.latency_threshold
+            if sampled or slow:
+                trigger = "sampled" if sampled else f"latency >= {self.latency_threshold}s"
+                self._write(session, trigger, elapsed, torch_profile)
+
+    def _start_torch(self):
+        if not self._torch_lock.acquire(blocking=False):
+            return None
+        try:
+            import torch
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            torch_profile = torch.profiler.profile(activities=activities, record_shapes=True)
+            torch_profile.__enter__()
+            return torch_profile
+        except Exception as e:
+            print(f"⚠️ Torch profiler unavailable: {e}")
+            self._torch_lock.release()
+            return None
+
+    def _write(self, session, trigger, elapsed, torch_profile=None):
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(session.started))
+        path = os.path.join(self.output_dir, f"{stamp}_{session.request_id}")
+        os.makedirs(path, exist_ok=True)
+
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(dict(session.metadata, request_id=session.request_id, trigger=trigger,
+                           seconds=round(elapsed, 4), samples=session.samples,
+                           interval=self._sampler.interval), f, indent=2)
+        with open(os.path.join(path, "stacks.txt"), "w") as f:
+            for stack, count in session.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(os.path.join(path, "summary.txt"), "w") as f:
+            f.write(summarize_stacks(session.stacks, session.samples, self._sampler.interval))
+        if torch_profile is not None:
+            try:
+                torch_profile.export_chrome_trace(os.path.join(path, "torch_trace.json"))
+            except Exception as e:
+                print(f"⚠️ Could not export torch trace: {e}")
+
+        self.kept += 1
+        self._rotate()
+        print(f"🔬 Profile for request {session.request_id} ({trigger}, {elapsed:.2f}s) written to {path}")
+
+    def _rotate(self):
+        """Delete the oldest profile directories beyond max_profiles"""
+        entries = sorted(
+            (entry for entry in os.scandir(self.output_dir) if entry.is_dir()),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        for entry in entries[:max(0, len(entries) - self.max_profiles)]:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def summarize_stacks(stacks, samples, interval, top=25):
+    """Text table of the hottest functions by self (leaf) and inclusive samples"""
+    own = Counter()
+    inclusive = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        for frame in set(frames):
+            inclusive[frame] += count
+
+    total = sum(stacks.values()) or 1
+    lines = [f"{samples} samples every {interval * 1000:.0f}ms across the request's busy threads ({total} thread-samples)", ""]
+    for title, counter in (("Self", own), ("Inclusive", inclusive)):
+        lines.append(f"{title} samples:")
+        for frame, count in counter.most_common(top):
+            lines.append(f"  {count:>7} {100 * count / total:5.1f}%  {frame}")
+        lines.append("")
+    return "\n".join(lines)
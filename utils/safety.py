@@ -3,17 +3,72 @@ Medical Safety Guardrails for Tanit Fertility Assistant
 Ensures responses are educational, non-diagnostic, and appropriately cautious
 """
 
+from collections import Counter
+
+from utils.safety_rules import (
+    CRISIS, EMERGENCY, HORMONE_UNIT, NUMBER, RANGE_CONTEXT, REWRITE, SOURCE, URGENT, SafetyRuleEngine, ScanResult
+)
+
+DISCLAIMERS = {
+    "fertility": "\n\n💡 **Important Note:** This information is for educational purposes. Your individual situation requires personalized evaluation by a reproductive endocrinologist who can review your complete medical history, perform examinations, and order appropriate tests.",
+
+    "lab_results": "\n\n⚕️ **Medical Disclaimer:** Lab value interpretation depends on your specific medical context, testing methods, and complete hormonal profile. Please discuss these results with your healthcare provider for personalized guidance.",
+
+    "treatment": "\n\n⚠️ **Treatment Information:** Treatment decisions should be made with your reproductive endocrinologist based on your complete medical evaluation. This information helps you understand options, not choose treatment.",
+
+    "general": "\n\n💡 **Important:** This is educational information only. Always consult with your reproductive endocrinologist for medical advice specific to your situation."
+}
+
+EMERGENCY_NOTICE = "\n\n🚨 **IMPORTANT:** If you're experiencing severe symptoms like heavy bleeding, severe pain, or other emergency symptoms, please seek immediate medical attention by calling emergency services or going to the nearest emergency room.\n"
+
+SOURCE_ATTRIBUTION = "\n\n📚 *This response is based on established clinical guidelines and medical research from reproductive health organizations.*"
+
+CRISIS_RESPONSE = """
+
+🆘 **Crisis Support:**
+
+If you're having thoughts of suicide or self-harm, please reach out for immediate help:
+
+**United States:**
+- National Suicide Prevention Lifeline: 988 or 1-800-273-8255
+- Crisis Text Line: Text HOME to 741741
+
+**International:**
+- Find your country's helpline: https://findahelpline.com
+
+You don't have to go through this alone. Please talk to someone who can help right now.
+
+For fertility-related emotional support, consider:
+- RESOLVE: The National Infertility Association
+- Fertility counseling services
+- Support groups in your area
+
+Your life matters. Please reach out for help. 💜"""
+
+URGENT_RESPONSE = """
+
+🚨 **Please Seek Medical Care Now:**
+
+What you're describing can be a sign of a medical emergency, such as an ectopic pregnancy, heavy blood loss or ovarian torsion, and it needs to be checked in person right away.
+
+- Call your local emergency number (911 in the United States, 112 in Europe)
+- Or go to the nearest emergency room
+- If you're in fertility treatment, also call your clinic's after-hours line
+
+Please don't wait for symptoms to pass. Once you're safe, I'm here to help you understand what the doctors tell you. 💜"""
+
+HORMONE_NOTE = "\n\n📊 *Note: Interpretation of hormone values depends on age, cycle day, testing method, and individual circumstances.*"
+
+
 class SafetyGuardrails:
-    def __init__(self):
-        self.emergency_keywords = [
-            "severe pain", "heavy bleeding", "hemorrhage", "ectopic", 
-            "emergency", "can't breathe", "chest pain", "suicidal"
-        ]
-        
-        self.diagnosis_keywords = [
-            "you have", "you are diagnosed", "you definitely", 
-            "this is", "you need to take", "you must"
-        ]
+    def __init__(self, rules=None):
+        """
+        rules: Rule objects or dicts (see utils/safety_rules.py, load_rules for JSON);
+               default: DEFAULT_RULES
+        """
+        self.engine = SafetyRuleEngine(rules)
+        self.emergency_keywords = [p for rule in self.engine.rules_in(EMERGENCY) for p in rule.phrases]
+        self.diagnosis_keywords = [p for rule in self.engine.rules_in(REWRITE) for p in rule.phrases]
     
     def get_medical_system_prompt(self):
         """
@@ -46,84 +101,53 @@ TONE GUIDELINES:
 
 Remember: You're a supportive educational companion, not a replacement for medical care."""
     
+    def post_process(self, response, rag_context, query_type="fertility"):
+        """
+        Softening, disclaimers and grounding notes from a single scan of the response
+        (same output as apply_disclaimers followed by check_hallucination)
+        """
+        scan = self.engine.scan(response)
+        return scan.text + self._disclaimer(scan, query_type) + self._grounding_notes(scan, rag_context)
+
+    def stream_filter(self, rag_context, query_type="fertility"):
+        """Incremental post_process for a response streamed as text deltas"""
+        return StreamingSafetyFilter(self, rag_context, query_type)
+
     def apply_disclaimers(self, response, query_type="general"):
         """
         Add appropriate medical disclaimers based on query type
         """
-        # Check if response inappropriately gives medical advice
-        response_lower = response.lower()
-        
-        # Warning if response sounds too definitive
-        if any(phrase in response_lower for phrase in self.diagnosis_keywords):
-            response = self._soften_language(response)
-        
-        # Choose appropriate disclaimer
-        disclaimers = {
-            "fertility": "\n\n💡 **Important Note:** This information is for educational purposes. Your individual situation requires personalized evaluation by a reproductive endocrinologist who can review your complete medical history, perform examinations, and order appropriate tests.",
-            
-            "lab_results": "\n\n⚕️ **Medical Disclaimer:** Lab value interpretation depends on your specific medical context, testing methods, and complete hormonal profile. Please discuss these results with your healthcare provider for personalized guidance.",
-            
-            "treatment": "\n\n⚠️ **Treatment Information:** Treatment decisions should be made with your reproductive endocrinologist based on your complete medical evaluation. This information helps you understand options, not choose treatment.",
-            
-            "general": "\n\n💡 **Important:** This is educational information only. Always consult with your reproductive endocrinologist for medical advice specific to your situation."
-        }
-        
-        disclaimer = disclaimers.get(query_type, disclaimers["general"])
-        
-        # Add emergency guidance if needed
-        if any(keyword in response_lower for keyword in self.emergency_keywords):
-            disclaimer = "\n\n🚨 **IMPORTANT:** If you're experiencing severe symptoms like heavy bleeding, severe pain, or other emergency symptoms, please seek immediate medical attention by calling emergency services or going to the nearest emergency room.\n" + disclaimer
-        
-        return response + disclaimer
+        scan = self.engine.scan(response)
+        return scan.text + self._disclaimer(scan, query_type)
     
     def _soften_language(self, response):
         """
         Soften overly definitive language in responses
         """
-        replacements = {
-            "you have": "this may suggest",
-            "you are diagnosed": "you may have been diagnosed",
-            "you definitely": "this could indicate",
-            "this is": "this may be",
-            "you need to take": "your doctor might recommend",
-            "you must": "it's often recommended to"
-        }
-        
-        for definitive, softer in replacements.items():
-            response = response.replace(definitive, softer)
-        
-        return response
+        return self.engine.scan(response).text
     
     def check_hallucination(self, response, rag_context):
         """
         Basic hallucination check: ensure key claims are grounded in RAG context
         """
-        response_lower = response.lower()
-        
-        # Check if response references provided sources
-        source_indicators = [
-            "according to", "studies show", "research indicates", 
-            "guidelines recommend", "asrm", "eshre", "clinical"
-        ]
-        
-        sources_mentioned = any(
-            indicator in response_lower for indicator in source_indicators
-        )
-        
+        return response + self._grounding_notes(self.engine.scan(response, rewrite=False), rag_context)
+
+    def _disclaimer(self, scan, query_type):
+        disclaimer = DISCLAIMERS.get(query_type, DISCLAIMERS["general"])
+        # Add emergency guidance if needed
+        if scan.has(EMERGENCY):
+            disclaimer = EMERGENCY_NOTICE + disclaimer
+        return disclaimer
+
+    def _grounding_notes(self, scan, rag_context):
+        notes = ""
         # If no sources mentioned but RAG returned results, add attribution
-        if not sources_mentioned and rag_context.get("nodes") and len(rag_context["nodes"]) > 0:
-            response += "\n\n📚 *This response is based on established clinical guidelines and medical research from reproductive health organizations.*"
-        
-        # Check for specific numbers/claims without context
-        if any(char.isdigit() for char in response):
-            # If numbers are mentioned, ensure they're contextualized
-            if "reference range" not in response_lower and "normal range" not in response_lower:
-                if "ng/ml" in response_lower or "miu/ml" in response_lower:
-                    # Hormone values mentioned without ranges - add note
-                    if "interpretation depends on" not in response_lower:
-                        response += "\n\n📊 *Note: Interpretation of hormone values depends on age, cycle day, testing method, and individual circumstances.*"
-        
-        return response
+        if not scan.has(SOURCE) and rag_context.get("nodes"):
+            notes += SOURCE_ATTRIBUTION
+        # Hormone values mentioned without ranges - add note
+        if scan.has(NUMBER) and scan.has(HORMONE_UNIT) and not scan.has(RANGE_CONTEXT):
+            notes += HORMONE_NOTE
+        return notes
     
     def get_error_message(self):
         """
@@ -145,13 +169,13 @@ If the problem persists, please let me know what you were trying to do and I'll
 
 I'm here to support you through your fertility journey! 💜"""
     
-    def validate_input(self, text_input, audio_input, image_input):
+    def validate_input(self, text_input, audio_input, image_input, pdf_input=None):
         """
         Validate user inputs before processing
         Returns: (is_valid, error_message)
         """
         # Check if at least one input is provided
-        if not text_input and not audio_input and not image_input:
+        if not text_input and audio_input is None and image_input is None and pdf_input is None:
             return False, "Please provide a question via text, voice, or upload an image."
         
         # Check text length
@@ -160,38 +184,81 @@ I'm here to support you through your fertility journey! 💜"""
         
         return True, None
     
+    def screen_input(self, text):
+        """
+        Pre-inference check of user text (typed or transcribed), one scan for both:
+        Returns: ("crisis" | "urgent", canned response) or (None, None)
+        """
+        if not text:
+            return None, None
+        scan = self.engine.scan(text, rewrite=False)
+        if scan.has(CRISIS):
+            return "crisis", CRISIS_RESPONSE
+        if scan.has(URGENT):
+            return "urgent", URGENT_RESPONSE
+        return None, None
+
     def detect_crisis(self, text):
         """
         Detect if user might be in crisis
         """
-        crisis_keywords = [
-            "want to die", "kill myself", "end it all", "suicide",
-            "no reason to live", "better off dead"
-        ]
+        if text and self.engine.scan(text, rewrite=False).has(CRISIS):
+            return True, CRISIS_RESPONSE
         
-        text_lower = text.lower() if text else ""
-        
-        if any(keyword in text_lower for keyword in crisis_keywords):
-            return True, """
+        return False, None
 
-🆘 **Crisis Support:**
 
-If you're having thoughts of suicide or self-harm, please reach out for immediate help:
+class StreamingSafetyFilter:
+    """
+    post_process for streamed responses:
+        stream = safety.stream_filter(rag_context)
+        for delta in deltas:
+            show(stream.feed(delta))   # softened text, possibly ""
+        show(stream.finish())          # held-back text + disclaimers
+    Rewrites and detection run as deltas arrive; only the shortest suffix that
+    could still match a rule is held back (at most one phrase). The streamed
+    output equals post_process() on the full response.
+    """
 
-**United States:**
-- National Suicide Prevention Lifeline: 988 or 1-800-273-8255
-- Crisis Text Line: Text HOME to 741741
+    def __init__(self, guardrails, rag_context, query_type="fertility"):
+        self.guardrails = guardrails
+        self.engine = guardrails.engine
+        self.rag_context = rag_context
+        self.query_type = query_type
+        self.categories = Counter()  # rule category -> matches so far
+        self._pending = ""           # raw text not yet emitted
+        self._context = ""           # last emitted raw character (word-boundary context)
+        self._output = []
 
-**International:**
-- Find your country's helpline: https://findahelpline.com
+    @property
+    def text(self):
+        """Everything emitted so far"""
+        return "".join(self._output)
 
-You don't have to go through this alone. Please talk to someone who can help right now.
+    def has(self, category):
+        """Whether a rule category (e.g. EMERGENCY) has matched so far"""
+        return self.categories[category] > 0
 
-For fertility-related emotional support, consider:
-- RESOLVE: The National Infertility Association
-- Fertility counseling services
-- Support groups in your area
+    def feed(self, delta):
+        """Add a text delta; returns the part of the response that is now final"""
+        self._pending += delta
+        return self._commit(self.engine.pending_start(self._pending))
 
-Your life matters. Please reach out for help. 💜"""
-        
-        return False, None
\ No newline at end of file
+    def finish(self):
+        """Flush the held-back text and append the disclaimers and grounding notes"""
+        text = self._commit(len(self._pending))
+        scan = ScanResult(text="", categories=dict(self.categories))
+        notes = (self.guardrails._disclaimer(scan, self.query_type)
+                 + self.guardrails._grounding_notes(scan, self.rag_context))
+        self._output.append(notes)
+        return text + notes
+
+    def _commit(self, end):
+        if end <= 0:
+            return ""
+        scan = self.engine.scan(self._context + self._pending[:end], start=len(self._context))
+        self._context = self._pending[end - 1]
+        self._pending = self._pending[end:]
+        self.categories.update(scan.categories)
+        self._output.append(scan.text)
+        return scan.text
@@ -0,0 +1,232 @@
+"""
+Data-driven safety rules, compiled once into a single-pass matcher
+- Phrase rules are merged into one word-level trie regex (case-insensitive,
+  whitespace-tolerant, anchored on word boundaries), so adding phrases does not
+  add passes over the text
+- Pattern rules (e.g. numbers) join the same alternation as named groups
+- scan() walks the text once and returns every finding plus the rewritten text
+- pending_start() tells a streaming caller how much of a partial text is final
+"""
+
+import json
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# Rule categories used by SafetyGuardrails
+REWRITE = "rewrite"            # definitive language, replaced by softer wording
+EMERGENCY = "emergency"        # urgent symptoms: add emergency guidance
+CRISIS = "crisis"              # self-harm language in user input
+URGENT = "urgent"              # user describing urgent symptoms right now
+SOURCE = "source"              # response already cites guidelines/evidence
+HORMONE_UNIT = "hormone_unit"  # hormone values mentioned
+RANGE_CONTEXT = "range_context"  # values already put in context
+NUMBER = "number"
+
+
+@dataclass
+class Rule:
+    name: str
+    category: str
+    phrases: Tuple[str, ...] = ()
+    pattern: Optional[str] = None      # raw regex, for rules that are not phrase lists
+    replacement: Optional[str] = None  # rewrite rules only
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            name=data["name"],
+            category=data["category"],
+            phrases=tuple(data.get("phrases", ())),
+            pattern=data.get("pattern"),
+            replacement=data.get("replacement")
+        )
+
+
+DEFAULT_RULES = [
+    # Softening: definitive phrasing -> educational phrasing
+    Rule("soften_you_have", REWRITE, ("you have",), replacement="this may suggest"),
+    Rule("soften_diagnosed", REWRITE, ("you are diagnosed",), replacement="you may have been diagnosed"),
+    Rule("soften_definitely", REWRITE, ("you definitely",), replacement="this could indicate"),
+    Rule("soften_this_is", REWRITE, ("this is",), replacement="this may be"),
+    Rule("soften_need_to_take", REWRITE, ("you need to take",), replacement="your doctor might recommend"),
+    Rule("soften_must", REWRITE, ("you must",), replacement="it's often recommended to"),
+
+    Rule("emergency_symptoms", EMERGENCY, (
+        "severe pain", "heavy bleeding", "hemorrhage", "ectopic",
+        "emergency", "can't breathe", "chest pain", "suicidal"
+    )),
+    Rule("crisis_language", CRISIS, (
+        "want to die", "kill myself", "end it all", "suicide", "suicidal",
+        "no reason to live", "better off dead"
+    )),
+    # First-person phrasing only: questions about a symptom ("what causes
+    # heavy bleeding?") still get a full answer
+    Rule("urgent_symptoms", URGENT, (
+        "i'm bleeding heavily", "i am bleeding heavily", "i'm bleeding a lot", "i am bleeding a lot",
+        "i've been bleeding a lot", "soaking a pad", "soaking through a pad", "soaking pads",
+        "soaking through pads", "soaking through my pads", "i'm in severe pain", "i am in severe pain", "i have severe pain", "i'm having severe pain",
+        "i am having severe pain", "i can't breathe", "i cannot breathe", "i have chest pain",
+        "i'm having chest pain", "i am having chest pain", "i fainted", "i passed out",
+        "i'm fainting", "i am fainting", "feel faint", "feeling faint", "i'm going to faint",
+        "i think it's ectopic", "i think i have an ectopic"
+    )),
+
+    Rule("source_indicators", SOURCE, (
+        "according to", "studies show", "research indicates",
+        "guidelines recommend", "asrm", "eshre", "clinical"
+    )),
+    Rule("hormone_units", HORMONE_UNIT, ("ng/ml", "miu/ml")),
+    Rule("range_context", RANGE_CONTEXT, ("reference range", "normal range", "interpretation depends on")),
+    Rule("numbers", NUMBER, pattern=r"\d+"),
+]
+
+
+def load_rules(path):
+    """Rules from a JSON list of {"name", "category", "phrases" | "pattern", "replacement"}"""
+    with open(path, "r") as f:
+        return [Rule.from_dict(item) for item in json.load(f)]
+
+
+def _normalize(phrase):
+    return " ".join(phrase.lower().split())
+
+
+# Positions where a phrase match could begin: a word boundary before a non-space
+_MATCH_START = re.compile(r"(?<!\w)(?=\S)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _trie_pattern(node):
+    """Alternation over a word trie: longest words first, shared prefixes matched once"""
+    branches = [
+        re.escape(word) + _continuation(child)
+        for word, child in sorted(((w, c) for w, c in node.items() if w), key=lambda item: -len(item[0]))
+    ]
+    return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+
+
+def _continuation(node):
+    rest = {word: child for word, child in node.items() if word}
+    if not rest:
+        return ""
+    tail = r"\s+" + _trie_pattern(rest)
+    # "" marks a phrase ending here - the longer phrase is optional
+    return f"(?:{tail})?" if "" in node else tail
+
+
+@dataclass
+class Finding:
+    rule: str
+    category: str
+    start: int
+    end: int
+    text: str
+
+
+@dataclass
+class ScanResult:
+    text: str                                   # text with rewrite rules applied
+    findings: List[Finding] = field(default_factory=list)
+    categories: Dict[str, int] = field(default_factory=dict)  # category -> match count
+
+    def has(self, category):
+        return self.categories.get(category, 0) > 0
+
+
+class SafetyRuleEngine:
+    def __init__(self, rules=None):
+        """rules: Rule objects or dicts (default: DEFAULT_RULES); compiled once here"""
+        rules = [rule if isinstance(rule, Rule) else Rule.from_dict(rule) for rule in (rules or DEFAULT_RULES)]
+        self.rules = rules
+        self._phrase_rules = defaultdict(list)  # normalized phrase -> rules
+        self._pattern_groups = {}                # group name -> rule
+        self._phrase_prefixes = set()            # every prefix of every normalized phrase
+
+        trie = {}
+        for rule in rules:
+            for phrase in rule.phrases:
+                key = _normalize(phrase)
+                self._phrase_rules[key].append(rule)
+                self._phrase_prefixes.update(key[:n] for n in range(1, len(key) + 1))
+                node = trie
+                for word in key.split(" "):
+                    node = node.setdefault(word, {})
+                node[""] = {}
+
+        alternatives = []
+        if trie:
+            alternatives.append(rf"(?P<phrase>(?<!\w){_trie_pattern(trie)}(?!\w))")
+        for i, rule in enumerate(rule for rule in rules if rule.pattern):
+            group = f"p{i}"
+            self._pattern_groups[group] = rule
+            alternatives.append(f"(?P<{group}>{rule.pattern})")
+
+        self.regex = re.compile("|".join(alternatives) or r"(?!)", re.IGNORECASE)
+        self.max_phrase_length = max((len(key) for key in self._phrase_rules), default=0)
+
+    def rules_in(self, category):
+        return [rule for rule in self.rules if rule.category == category]
+
+    def scan(self, text, rewrite=True, start=0):
+        """
+        One pass over text: collect findings for every rule and, if rewrite,
+        apply rewrite rules (matched case-insensitively, first letter's case kept)
+        start: scan and return text[start:] only; text[:start] is context for word boundaries
+        """
+        findings = []
+        categories = defaultdict(int)
+        pieces = []
+        position = start
+
+        for match in self.regex.finditer(text, start):
+            if match.lastgroup == "phrase":
+                matched_rules = self._phrase_rules[_normalize(match.group())]
+            else:
+                matched_rules = [self._pattern_groups[match.lastgroup]]
+
+            for rule in matched_rules:
+                findings.append(Finding(rule.name, rule.category, match.start(), match.end(), match.group()))
+                categories[rule.category] += 1
+
+            replacement = next((rule.replacement for rule in matched_rules if rule.replacement is not None), None)
+            if rewrite and replacement is not None:
+                if match.group()[0].isupper():
+                    replacement = replacement[0].upper() + replacement[1:]
+                pieces.append(text[position:match.start()])
+                pieces.append(replacement)
+                position = match.end()
+
+        if pieces:
+            pieces.append(text[position:])
+            text = "".join(pieces)
+        else:
+            text = text[start:]
+        return ScanResult(text=text, findings=findings, categories=dict(categories))
+
+    def pending_start(self, text):
+        """
+        Start of the shortest suffix of a partial text that could still become (part of)
+        a match once more text arrives. Scanning text[:pending_start(text)] gives the
+        same result whatever follows; the held suffix is at most one phrase long
+        (plus any match still touching the end, e.g. a number)
+        """
+        hold = len(text)
+        # A match touching the end may grow (pattern rules) or fail its word-boundary check
+        for match in self.regex.finditer(text):
+            if match.end() == len(text):
+                hold = match.start()
+                break
+
+        # A suffix that is a prefix of some phrase may complete into a match
+        suffix_start = None
+        for candidate in reversed([m.start() for m in _MATCH_START.finditer(text)]):
+            suffix = _WHITESPACE.sub(" ", text[candidate:].lower())
+            if len(suffix) > self.max_phrase_length:
+                break
+            if suffix in self._phrase_prefixes:
+                suffix_start = candidate
+        if suffix_start is not None:
+            hold = min(hold, suffix_start)
+        return hold
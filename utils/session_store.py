@@ -0,0 +1,222 @@
+"""
+Bounded per-session conversation store
+Keeps each patient's history separate and the server's memory flat:
+- Per-session turn and byte caps
+- Idle TTL and LRU eviction under a global memory ceiling
+- Optional spill of evicted sessions to SQLite so they can be resumed
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def _message_bytes(message):
+    return len(message["content"].encode("utf-8")) + len(message["role"]) + 64
+
+
+class SessionStore:
+    def __init__(self, max_messages=20, max_session_bytes=32 * 1024,
+                 idle_ttl_seconds=2 * 3600, max_total_bytes=64 * 1024 * 1024,
+                 max_sessions=10000, spill_path=None, max_spilled_sessions=100000):
+        """
+        max_messages / max_session_bytes: cap on each session (oldest messages dropped)
+        idle_ttl_seconds: sessions untouched this long are evicted (and not resumable)
+        max_total_bytes / max_sessions: global ceiling, enforced by LRU eviction
+        spill_path: SQLite file for evicted sessions (None: evicted history is dropped)
+        max_spilled_sessions: row cap on the spill file, oldest rows pruned first
+        """
+        self.max_messages = max_messages
+        self.max_session_bytes = max_session_bytes
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_total_bytes = max_total_bytes
+        self.max_sessions = max_sessions
+        self.spill_path = spill_path
+        self.max_spilled_sessions = max_spilled_sessions
+
+        self._sessions = OrderedDict()  # session_id -> {"messages", "bytes", "last_access"}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.resumed = 0
+
+        # SQLite I/O happens outside self._lock, serialised on one connection by
+        # self._spill_lock (always taken before self._lock, never after)
+        self._spill_lock = threading.Lock()
+        self._spilling = {}  # session_id -> evicted session not yet written
+        self._conn = None
+        if spill_path:
+            os.makedirs(os.path.dirname(os.path.abspath(spill_path)), exist_ok=True)
+            self._conn = sqlite3.connect(spill_path, timeout=10, check_same_thread=False)
+            with self._conn:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS sessions ("
+                    " session_id TEXT PRIMARY KEY,"
+                    " messages TEXT NOT NULL,"
+                    " last_access REAL NOT NULL)"
+                )
+                self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access)")
+
+    def close(self):
+        with self._spill_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def get_history(self, session_id, last_n=None):
+        """Copy of a session's messages (resumed from the spill file if evicted)"""
+        self._resume(session_id)
+        with self._lock:
+            self._expire_idle()
+            session = self._sessions.get(session_id)
+            if session is None:
+                messages = []
+            else:
+                session["last_access"] = time.time()
+                self._sessions.move_to_end(session_id)
+                self._enforce_ceiling(keep=session_id)
+                messages = session["messages"]
+                messages = list(messages[-last_n:] if last_n else messages)
+        self._flush_spills()
+        return messages
+
+    def append(self, session_id, role, content):
+        """Add a message, then enforce the per-session and global caps"""
+        message = {"role": role, "content": content}
+        self._resume(session_id)
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = {"messages": [], "bytes": 0, "last_access": time.time()}
+                self._sessions[session_id] = session
+
+            session["messages"].append(message)
+            session["bytes"] += _message_bytes(message)
+            self._total_bytes += _message_bytes(message)
+            session["last_access"] = time.time()
+            self._sessions.move_to_end(session_id)
+
+            # Per-session cap: drop oldest messages, always keeping the newest
+            while len(session["messages"]) > 1 and (
+                len(session["messages"]) > self.max_messages
+                or session["bytes"] > self.max_session_bytes
+            ):
+                dropped = session["messages"].pop(0)
+                session["bytes"] -= _message_bytes(dropped)
+                self._total_bytes -= _message_bytes(dropped)
+
+            self._expire_idle()
+            self._enforce_ceiling(keep=session_id)
+        self._flush_spills()
+
+    def clear(self, session_id):
+        with self._spill_lock:
+            with self._lock:
+                session = self._sessions.pop(session_id, None)
+                if session:
+                    self._total_bytes -= session["bytes"]
+                self._spilling.pop(session_id, None)
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def _resume(self, session_id):
+        """Reload an evicted session into memory if it is not already there"""
+        if not self.spill_path:
+            return
+        with self._spill_lock:
+            with self._lock:
+                if session_id in self._sessions:
+                    return
+                messages = self._spilling.pop(session_id, {}).get("messages")
+            if messages is None and self._conn is not None:
+                with self._conn:
+                    row = self._conn.execute(
+                        "SELECT messages FROM sessions WHERE session_id = ? AND last_access >= ?",
+                        (session_id, time.time() - self.idle_ttl_seconds)
+                    ).fetchone()
+                    self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                messages = json.loads(row[0]) if row else None
+            if messages is None:
+                return
+
+            with self._lock:
+                if session_id in self._sessions:
+                    return
+                session = {
+                    "messages": messages,
+                    "bytes": sum(_message_bytes(m) for m in messages),
+                    "last_access": time.time()
+                }
+                self._sessions[session_id] = session
+                self._total_bytes += session["bytes"]
+                self.resumed += 1
+
+    def _flush_spills(self):
+        """Write sessions evicted under the lock to the spill file, then prune it"""
+        if self._conn is None or not self._spilling:
+            return
+        with self._spill_lock:
+            with self._lock:
+                pending = list(self._spilling.items())
+            if not pending or self._conn is None:
+                return
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO sessions (session_id, messages, last_access) VALUES (?, ?, ?)",
+                    [(session_id, json.dumps(session["messages"]), session["last_access"])
+                     for session_id, session in pending]
+                )
+                # Idle TTL and row cap apply to the spill file too
+                self._conn.execute("DELETE FROM sessions WHERE last_access < ?",
+                                   (time.time() - self.idle_ttl_seconds,))
+                self._conn.execute(
+                    "DELETE FROM sessions WHERE session_id IN ("
+                    " SELECT session_id FROM sessions ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                    (self.max_spilled_sessions,)
+                )
+            with self._lock:
+                for session_id, session in pending:
+                    if self._spilling.get(session_id) is session:
+                        del self._spilling[session_id]
+
+    def _evict(self, session_id, expired=False):
+        """Remove a session from memory, queueing it for the spill file (caller holds the lock)"""
+        session = self._sessions.pop(session_id)
+        self._total_bytes -= session["bytes"]
+        self.evictions += 1
+        # Idle-expired sessions are gone for good; only ceiling evictions are resumable
+        if self.spill_path and session["messages"] and not expired:
+            self._spilling[session_id] = session
+
+    def _expire_idle(self):
+        cutoff = time.time() - self.idle_ttl_seconds
+        # OrderedDict is in LRU order, so idle sessions are at the front
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session["last_access"] >= cutoff:
+                break
+            self._evict(session_id, expired=True)
+
+    def _enforce_ceiling(self, keep=None):
+        while self._sessions and (
+            self._total_bytes > self.max_total_bytes or len(self._sessions) > self.max_sessions
+        ):
+            session_id = next(iter(self._sessions))
+            if session_id == keep:
+                break
+            self._evict(session_id)
+
+    def get_metrics(self):
+        """Session count and memory for monitoring"""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_total_bytes,
+                "evictions": self.evictions,
+                "resumed": self.resumed
+            }
@@ -0,0 +1,104 @@
+"""
+Speculative GraphRAG retrieval on partial transcripts
+Retrieval starts while speech is still being decoded; the result is kept
+when the final query matches the same entities and redone otherwise
+"""
+
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Shared background pool for speculative work (retrieval, LLM prefix prefill)
+background_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="speculation")
+
+
+class SpeculationStats:
+    """Hit/miss counters shared across requests"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.launched = 0
+
+    def record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def record_launch(self):
+        with self._lock:
+            self.launched += 1
+
+    def get_report(self) -> dict:
+        with self._lock:
+            resolved = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "launched": self.launched,
+                "hit_rate": self.hits / resolved if resolved else 0.0
+            }
+
+
+class SpeculativeRetriever:
+    def __init__(self, graphrag, stats=None, executor=background_executor):
+        """
+        One per request: feed partial transcripts with update(),
+        then resolve() with the final query
+        """
+        self.graphrag = graphrag
+        self.stats = stats or SpeculationStats()
+        self.executor = executor
+        self._entities = None
+        self._future = None
+
+    def update(self, partial_text: str):
+        """Launch retrieval in the background when the matched entities change"""
+        if not partial_text.strip():
+            return
+
+        entities = self.graphrag.match_entities(partial_text)
+        if entities == self._entities:
+            return
+
+        self._entities = entities
+        # Carry the caller's context so the retrieval span stays in the request trace
+        self._future = self.executor.submit(contextvars.copy_context().run, self.graphrag.query_entities, entities)
+        self.stats.record_launch()
+
+    def prefetch(self, text: str) -> dict:
+        """
+        Retrieve synchronously for text known up front (typed queries) so the
+        final resolve() can reuse it once visual data has arrived
+        """
+        entities = self.graphrag.match_entities(text)
+        future = Future()
+        try:
+            future.set_result(self.graphrag.query_entities(entities))
+        except Exception as e:
+            future.set_exception(e)
+        self._entities, self._future = entities, future
+        self.stats.record_launch()
+        return future.result()
+
+    def resolve(self, query_text: str) -> dict:
+        """
+        Final retrieval: reuse the speculative result if the final query matches
+        the same entities, otherwise retrieve again
+        """
+        entities = self.graphrag.match_entities(query_text)
+
+        if self._future is not None and entities == self._entities:
+            try:
+                result = self._future.result()
+                self.stats.record(hit=True)
+                return result
+            except Exception as e:
+                print(f"⚠️ Speculative retrieval failed, retrying: {e}")
+
+        if self._future is not None:
+            self.stats.record(hit=False)
+        return self.graphrag.query_entities(entities)
@@ -0,0 +1,140 @@
+"""
+Tiny dependency-graph executor for the request pipeline
+Independent stages (STT, image VLM, PDF VLM, text retrieval) run concurrently
+on a thread pool; a stage starts as soon as the stages it depends on finish
+Each stage runs in a "stage.<name>" span nested under the caller's current span
+"""
+
+import contextvars
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+
+from utils.profiling import track_thread
+from utils.tracing import tracer
+
+# Shared by all requests - stages are mostly I/O or GPU bound and release the GIL
+stage_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="stage")
+
+# Graph of the stage running on this thread, for check_cancelled()
+_current_graph = contextvars.ContextVar("stage_graph", default=None)
+
+
+def check_cancelled():
+    """Raise CancelledError inside a stage whose graph was cancelled (call before waiting for a model slot)"""
+    graph = _current_graph.get()
+    if graph is not None and graph.cancelled:
+        raise CancelledError("request finished early, stage skipped")
+
+
+class StageGraph:
+    def __init__(self, executor=stage_executor):
+        self.executor = executor
+        self._lock = threading.Lock()
+        self._stages = {}      # name -> (fn, deps, context captured at add time)
+        self._futures = {}     # name -> Future (created at add time)
+        self._pending = {}     # name -> set of unfinished deps
+        self._timings = {}     # name -> (start, end) in perf_counter seconds
+        self._origin = time.perf_counter()
+        self.cancelled = False
+
+    def add(self, name, fn, after=()):
+        """
+        Register a stage; fn receives the results of its dependencies as keyword
+        arguments named after them. Stages must be added after their dependencies.
+        Returns the stage's Future.
+        """
+        for dep in after:
+            if dep not in self._futures:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dep}'")
+
+        future = Future()
+        with self._lock:
+            self._stages[name] = (fn, tuple(after), contextvars.copy_context())
+            self._futures[name] = future
+            self._pending[name] = {dep for dep in after if not self._futures[dep].done()}
+            ready = not self._pending[name]
+
+        for dep in after:
+            self._futures[dep].add_done_callback(lambda _, name=name, dep=dep: self._dep_done(name, dep))
+
+        if ready:
+            self._submit(name)
+        return future
+
+    def _dep_done(self, name, dep):
+        with self._lock:
+            pending = self._pending[name]
+            if dep not in pending:
+                return
+            pending.discard(dep)
+            ready = not pending
+        if ready:
+            self._submit(name)
+
+    def _submit(self, name):
+        with self._lock:
+            if self._futures[name].running() or self._futures[name].done():
+                return
+            self._futures[name].set_running_or_notify_cancel()
+        # Run in the caller's context so the stage span nests under its trace
+        self.executor.submit(self._stages[name][2].run, self._run, name)
+
+    def cancel(self):
+        """
+        Stop a graph whose request returned early: stages that have not started
+        are skipped, running ones stop at their next check_cancelled()
+        """
+        with self._lock:
+            self.cancelled = True
+            pending = [future for future in self._futures.values() if not future.running() and not future.done()]
+        # Outside the lock: cancelling runs the dependents' done callbacks
+        for future in pending:
+            future.cancel()
+
+    def _run(self, name):
+        fn, deps, _ = self._stages[name]
+        future = self._futures[name]
+        if self.cancelled:
+            future.set_exception(CancelledError(f"stage '{name}' skipped"))
+            return
+        _current_graph.set(self)
+        start = time.perf_counter()
+        try:
+            # A failed dependency fails its dependents with the same error
+            kwargs = {dep: self._futures[dep].result() for dep in deps}
+            with tracer.span(f"stage.{name}"), track_thread():
+                result = fn(**kwargs)
+        except BaseException as e:
+            self._timings[name] = (start, time.perf_counter())
+            future.set_exception(e)
+            return
+        self._timings[name] = (start, time.perf_counter())
+        future.set_result(result)
+
+    def result(self, name, timeout=None):
+        """Block until a stage finishes and return its result (re-raises its error)"""
+        return self._futures[name].result(timeout=timeout)
+
+    def has(self, name):
+        return name in self._futures
+
+    def get_report(self):
+        """
+        Per-stage durations plus how much the stages overlapped:
+        overlap = total stage time / wall time from graph creation to the last stage end
+        """
+        timings = dict(self._timings)
+        if not timings:
+            return {"stages": {}, "stage_sum": 0.0, "wall": 0.0, "overlap": 1.0}
+
+        stages = {name: end - start for name, (start, end) in timings.items()}
+        wall = max(end for _, end in timings.values()) - self._origin
+        stage_sum = sum(stages.values())
+        return {
+            "stages": stages,
+            "offsets": {name: start - self._origin for name, (start, _) in timings.items()},
+            "stage_sum": stage_sum,
+            "wall": wall,
+            "overlap": stage_sum / wall if wall > 0 else 1.0
+        }
@@ -0,0 +1,318 @@
+"""
+Hierarchical span tracing and rolling latency histograms
+- Spans are timed with the monotonic perf_counter_ns clock and nest through
+  context managers (tracer.span) and decorators (traced) on handler methods
+- Every finished span feeds a rolling histogram for its name, so per-stage
+  p50/p95/p99 survive across requests
+- Snapshots export as JSON or Prometheus text, served from a local endpoint
+
+Usage:
+    with tracer.span("request", input_type="image"):
+        with tracer.span("vlm.analyze_images"):
+            ...
+
+    @traced("llm.generate")
+    def generate(self, ...): ...
+
+    start_metrics_server(port=9464)  # GET /metrics (Prometheus), /metrics.json
+"""
+
+import contextvars
+import functools
+import inspect
+import json
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+_current_span = contextvars.ContextVar("tanit_current_span", default=None)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Span:
+    __slots__ = ("name", "parent", "attributes", "children", "start_ns", "end_ns", "_lock")
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.children = []
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns = None
+        self._lock = threading.Lock()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def elapsed_seconds(self):
+        """Duration so far (final duration once the span has ended)"""
+        end_ns = self.end_ns if self.end_ns is not None else time.perf_counter_ns()
+        return (end_ns - self.start_ns) / 1e9
+
+    def _add_child(self, span):
+        with self._lock:
+            self.children.append(span)
+
+    def to_dict(self, origin_ns=None):
+        """Span tree with start offsets relative to the root, in seconds"""
+        origin_ns = self.start_ns if origin_ns is None else origin_ns
+        with self._lock:
+            children = list(self.children)
+        return {
+            "name": self.name,
+            "start": round((self.start_ns - origin_ns) / 1e9, 6),
+            "seconds": round(self.elapsed_seconds(), 6),
+            "attributes": self.attributes,
+            "children": [child.to_dict(origin_ns) for child in sorted(children, key=lambda c: c.start_ns)]
+        }
+
+
+class RollingHistogram:
+    """Last `window` observations of one metric, plus lifetime count and sum"""
+
+    def __init__(self, window=2048):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def summary(self):
+        ordered = sorted(self.samples)
+        n = len(ordered)
+        return {
+            "count": self.count,
+            "window": n,
+            "mean": sum(ordered) / n if n else 0.0,
+            "p50": ordered[min(n - 1, int(0.5 * n))] if n else 0.0,
+            "p95": ordered[min(n - 1, int(0.95 * n))] if n else 0.0,
+            "p99": ordered[min(n - 1, int(0.99 * n))] if n else 0.0,
+            "max": ordered[-1] if n else 0.0,
+            "sum": self.total
+        }
+
+
+class Tracer:
+    def __init__(self, window=2048, max_traces=50):
+        """
+        window: observations kept per histogram
+        max_traces: most recent finished request trees kept for inspection
+        """
+        self.window = window
+        self._lock = threading.Lock()
+        self._spans = {}      # span name -> RollingHistogram of seconds
+        self._values = {}     # metric name -> RollingHistogram (tokens, bytes, ...)
+        self._collectors = {}  # name -> callable returning a dict of gauges
+        self.recent_traces = deque(maxlen=max_traces)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Time a block as a child of the current span (or as a new trace root)"""
+        parent = _current_span.get()
+        span = Span(name, parent, attributes)
+        if parent is not None:
+            parent._add_child(span)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.attributes["error"] = type(e).__name__
+            raise
+        finally:
+            span.end_ns = time.perf_counter_ns()
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # Generator spans closed from another context
+                pass
+            self._finish(span)
+
+    def _finish(self, span):
+        with self._lock:
+            histogram = self._spans.get(span.name)
+            if histogram is None:
+                histogram = self._spans[span.name] = RollingHistogram(self.window)
+            histogram.observe(span.elapsed_seconds())
+            if span.parent is None:
+                self.recent_traces.append(span)
+
+    def observe(self, name, value):
+        """Record a non-latency measurement (token counts, throughput, memory)"""
+        with self._lock:
+            histogram = self._values.get(name)
+            if histogram is None:
+                histogram = self._values[name] = RollingHistogram(self.window)
+            histogram.observe(value)
+
+    def register_collector(self, name, collect):
+        """Include collect() -> {key: number or nested dict} as gauges in every snapshot"""
+        self._collectors[name] = collect
+
+    def traced(self, name=None):
+        """Decorator: run the function (or iterate the generator) inside a span"""
+        def decorator(fn):
+            span_name = name or fn.__qualname__
+
+            if inspect.isgeneratorfunction(fn):
+                @functools.wraps(fn)
+                def generator_wrapper(*args, **kwargs):
+                    with self.span(span_name):
+                        yield from fn(*args, **kwargs)
+                return generator_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self, include_traces=False):
+        """JSON-ready histograms (seconds for spans), collector gauges and optionally recent traces"""
+        with self._lock:
+            spans = {name: histogram.summary() for name, histogram in sorted(self._spans.items())}
+            values = {name: histogram.summary() for name, histogram in sorted(self._values.items())}
+            traces = list(self.recent_traces) if include_traces else []
+
+        gauges = {}
+        for name, collect in list(self._collectors.items()):
+            try:
+                gauges[name] = collect()
+            except Exception as e:
+                gauges[name] = {"error": str(e)}
+
+        snapshot = {"spans": spans, "metrics": values, "gauges": gauges}
+        if include_traces:
+            snapshot["recent_traces"] = [trace.to_dict() for trace in traces]
+        return snapshot
+
+    def to_prometheus(self, prefix="tanit"):
+        """Prometheus text exposition: span/metric summaries plus collector gauges"""
+        snapshot = self.snapshot()
+        lines = []
+
+        if snapshot["spans"]:
+            metric = f"{prefix}_span_seconds"
+            lines += [f"# HELP {metric} Span duration (rolling window quantiles)", f"# TYPE {metric} summary"]
+            for name, summary in snapshot["spans"].items():
+                lines += _summary_lines(metric, summary, f'span="{_escape(name)}"')
+
+        for name, summary in snapshot["metrics"].items():
+            metric = f"{prefix}_{_metric_name(name)}"
+            lines += [f"# TYPE {metric} summary"]
+            lines += _summary_lines(metric, summary)
+
+        for collector, values in snapshot["gauges"].items():
+            for key, value in _flatten(values):
+                metric = f"{prefix}_{_metric_name(collector)}_{_metric_name(key)}"
+                lines += [f"# TYPE {metric} gauge", f"{metric} {float(value)}"]
+
+        return "\n".join(lines) + "\n"
+
+
+def _summary_lines(metric, summary, labels=""):
+    separator = "," if labels else ""
+    lines = [
+        f'{metric}{{{labels}{separator}quantile="{q}"}} {summary["p" + str(round(q * 100))]}'
+        for q in QUANTILES
+    ]
+    label_block = f"{{{labels}}}" if labels else ""
+    lines.append(f"{metric}_sum{label_block} {summary['sum']}")
+    lines.append(f"{metric}_count{label_block} {summary['count']}")
+    return lines
+
+
+def _flatten(values, prefix=""):
+    """Numeric leaves of a nested dict as (underscore_joined_key, value)"""
+    for key, value in values.items():
+        name = f"{prefix}_{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            yield from _flatten(value, name)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+        elif isinstance(value, bool):
+            yield name, int(value)
+
+
+def _metric_name(name):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", str(name)).lower()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+# Process-wide tracer used by the handlers and the pipeline
+tracer = Tracer()
+traced = tracer.traced
+
+
+def current_span():
+    return _current_span.get()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    tracer = tracer
+    controls = {}
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/metrics.json":
+            include_traces = "traces" in url.query
+            body = json.dumps(self.tracer.snapshot(include_traces=include_traces), indent=2).encode("utf-8")
+            content_type = "application/json"
+        elif url.path == "/metrics":
+            body = self.tracer.to_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        elif url.path in self.controls:
+            body = json.dumps(self.controls[url.path]()).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self._respond(body, content_type)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path not in self.controls:
+            self.send_error(404)
+            return
+        try:
+            body = json.dumps(self.controls[url.path](**dict(parse_qsl(url.query)))).encode("utf-8")
+        except (TypeError, ValueError) as e:
+            self.send_error(400, str(e))
+            return
+        self._respond(body, "application/json")
+
+    def _respond(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port=9464, host="127.0.0.1", tracer=tracer, controls=None):
+    """
+    Serve metrics on a background thread:
+    /metrics (Prometheus text), /metrics.json, /metrics.json?traces=1 (with recent request trees)
+    controls: {path: fn(**query_params) -> dict} runtime settings; GET calls fn(),
+              POST path?key=value calls fn(key="value")
+    """
+    handler = type("MetricsHandler", (_MetricsHandler,), {"tracer": tracer, "controls": dict(controls or {})})
+    server = ThreadingHTTPServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    print(f"📈 Metrics at http://{host}:{port}/metrics (JSON: /metrics.json)")
+    return server
@@ -0,0 +1,125 @@
+"""
+In-memory audio helpers for faster-whisper
+Whisper expects mono float32 samples at 16 kHz
+"""
+
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+WHISPER_SAMPLE_RATE = 16000
+
+
+def to_whisper_audio(samples, sample_rate):
+    """
+    Convert raw samples (e.g. Gradio microphone chunks) to mono float32 at 16 kHz
+    - int16/int32 PCM is scaled to [-1, 1]; unsigned PCM (8-bit WAV) is re-centred first
+    - stereo is averaged to mono
+    - other sample rates go through a polyphase low-pass resampler (no aliasing
+      from 44.1/48 kHz microphones)
+    Already-conforming float32 mono 16 kHz input is returned without a copy
+    """
+    samples = np.asarray(samples)
+    
+    if samples.dtype.kind == "i":
+        samples = samples.astype(np.float32) / np.iinfo(samples.dtype).max
+    elif samples.dtype.kind == "u":
+        midpoint = (int(np.iinfo(samples.dtype).max) + 1) / 2
+        samples = (samples.astype(np.float32) - midpoint) / midpoint
+    elif samples.dtype != np.float32:
+        samples = samples.astype(np.float32)
+    
+    if samples.ndim == 2:
+        # Gradio delivers (samples, channels)
+        samples = samples.mean(axis=1, dtype=np.float32)
+    
+    if sample_rate != WHISPER_SAMPLE_RATE and len(samples):
+        from scipy.signal import resample_poly
+        
+        # e.g. 44100 -> 16000 is up 160 / down 441
+        divisor = math.gcd(int(sample_rate), WHISPER_SAMPLE_RATE)
+        samples = resample_poly(samples, WHISPER_SAMPLE_RATE // divisor, int(sample_rate) // divisor)
+        samples = samples.astype(np.float32, copy=False)
+    
+    return samples
+
+
+def hash_audio_input(audio):
+    """
+    Content hash of an audio input before any decoding:
+    file paths hash their bytes, arrays hash their samples and sample rate
+    """
+    digest = hashlib.sha256()
+    
+    if isinstance(audio, str):
+        with open(audio, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    elif isinstance(audio, tuple):
+        sample_rate, samples = audio
+        samples = np.ascontiguousarray(samples)
+        digest.update(f"{sample_rate}:{samples.dtype}:{samples.shape}".encode())
+        digest.update(memoryview(samples).cast("B"))
+    else:
+        samples = np.ascontiguousarray(audio)
+        digest.update(f"{WHISPER_SAMPLE_RATE}:{samples.dtype}:{samples.shape}".encode())
+        digest.update(memoryview(samples).cast("B"))
+    
+    return digest.hexdigest()
+
+
+def load_audio_input(audio):
+    """
+    Normalize any supported input to 16 kHz float32 samples, decoding only once:
+    - file path: decoded by faster-whisper's ffmpeg wrapper
+    - (sample_rate, samples) tuple: Gradio type="numpy" microphone/upload
+    - ndarray: assumed to be 16 kHz already
+    """
+    if isinstance(audio, str):
+        from faster_whisper.audio import decode_audio
+        return decode_audio(audio, sampling_rate=WHISPER_SAMPLE_RATE)
+    if isinstance(audio, tuple):
+        sample_rate, samples = audio
+        return to_whisper_audio(samples, sample_rate)
+    return to_whisper_audio(audio, WHISPER_SAMPLE_RATE)
+
+
+class TranscriptCache:
+    """Bounded LRU of transcript segments keyed by audio content hash"""
+    
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key):
+        with self._lock:
+            segments = self._entries.get(key)
+            if segments is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return segments
+    
+    def put(self, key, segments):
+        with self._lock:
+            self._entries[key] = segments
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,156 @@
+"""
+Batched offline transcription for bulk voice notes (intake queue)
+Runs VAD-segmented chunks through faster-whisper's batched inference,
+several files at a time, and writes one JSON line per file
+
+Usage:
+    python voice/batch_stt.py notes/ --output transcripts.jsonl --num_workers 4 --batch_size 16
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from faster_whisper import BatchedInferencePipeline, WhisperModel
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".ogg", ".flac", ".webm", ".opus")
+
+
+class BatchTranscriber:
+    def __init__(self, model_size="base", cpu_threads=None, num_workers=4,
+                 batch_size=16, beam_size=1, compute_type="int8"):
+        """
+        - num_workers: files transcribed concurrently (one CTranslate2 worker each)
+        - cpu_threads: threads per worker (default: cores split across workers)
+        - batch_size: VAD chunks per batched decoder call
+        - beam_size: 1 (greedy) is usually enough for voice notes and much faster
+        """
+        if cpu_threads is None:
+            cpu_threads = max(1, (os.cpu_count() or 1) // num_workers)
+
+        print(f"Loading faster-whisper '{model_size}' for batch transcription "
+              f"({num_workers} workers x {cpu_threads} threads)...")
+        self.model = WhisperModel(
+            model_size,
+            device="cpu",
+            compute_type=compute_type,
+            cpu_threads=cpu_threads,
+            num_workers=num_workers
+        )
+        self.pipeline = BatchedInferencePipeline(model=self.model)
+        self.num_workers = num_workers
+        self.batch_size = batch_size
+        self.beam_size = beam_size
+        print("Batch STT model loaded")
+
+    def transcribe_file(self, audio_path):
+        """
+        Transcribe one file with batched inference over its VAD segments
+        Returns: dict with transcript, segments, durations and real-time factor
+        """
+        start = time.perf_counter()
+        segments, info = self.pipeline.transcribe(
+            audio_path,
+            language="en",
+            beam_size=self.beam_size,
+            batch_size=self.batch_size
+        )
+        segments = [
+            {"start": round(segment.start, 2), "end": round(segment.end, 2), "text": segment.text.strip()}
+            for segment in segments
+        ]
+        elapsed = time.perf_counter() - start
+
+        return {
+            "file": audio_path,
+            "transcript": " ".join(segment["text"] for segment in segments).strip(),
+            "segments": segments,
+            "audio_seconds": round(info.duration, 2),
+            "processing_seconds": round(elapsed, 3),
+            "rtf": round(elapsed / info.duration, 4) if info.duration else None
+        }
+
+    def transcribe_files(self, audio_paths):
+        """
+        Transcribe many files concurrently
+        Yields results as they finish (errors are reported per file, not raised)
+        """
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            futures = {executor.submit(self.transcribe_file, path): path for path in audio_paths}
+            for future in as_completed(futures):
+                try:
+                    yield future.result()
+                except Exception as e:
+                    yield {"file": futures[future], "error": str(e)}
+
+
+def collect_audio_files(inputs):
+    """Expand directories and .txt file lists into audio file paths"""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                paths.extend(
+                    os.path.join(root, name) for name in sorted(files)
+                    if name.lower().endswith(AUDIO_EXTENSIONS)
+                )
+        elif item.endswith(".txt"):
+            with open(item, "r") as f:
+                paths.extend(line.strip() for line in f if line.strip())
+        else:
+            paths.append(item)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch-transcribe voice notes to JSONL")
+    parser.add_argument("inputs", nargs="+", help="Audio files, directories, or .txt lists of paths")
+    parser.add_argument("--output", type=str, default="transcripts.jsonl", help="JSONL output file")
+    parser.add_argument("--model_size", type=str, default="base", help="faster-whisper model size")
+    parser.add_argument("--cpu_threads", type=int, default=None, help="Threads per worker")
+    parser.add_argument("--num_workers", type=int, default=4, help="Files transcribed concurrently")
+    parser.add_argument("--batch_size", type=int, default=16, help="VAD chunks per batched decode")
+    parser.add_argument("--beam_size", type=int, default=1, help="Beam width")
+    args = parser.parse_args()
+
+    audio_paths = collect_audio_files(args.inputs)
+    if not audio_paths:
+        print("❌ No audio files found")
+        sys.exit(1)
+
+    transcriber = BatchTranscriber(
+        model_size=args.model_size,
+        cpu_threads=args.cpu_threads,
+        num_workers=args.num_workers,
+        batch_size=args.batch_size,
+        beam_size=args.beam_size
+    )
+
+    print(f"🎧 Transcribing {len(audio_paths)} file(s)...")
+    start = time.perf_counter()
+    audio_seconds = 0.0
+    failures = 0
+
+    with open(args.output, "w") as out:
+        for result in transcriber.transcribe_files(audio_paths):
+            out.write(json.dumps(result) + "\n")
+            if "error" in result:
+                failures += 1
+                print(f"❌ {result['file']}: {result['error']}")
+            else:
+                audio_seconds += result["audio_seconds"]
+                print(f"✅ {result['file']}: {result['audio_seconds']:.1f}s audio, RTF {result['rtf']}")
+
+    elapsed = time.perf_counter() - start
+    print(f"\n📊 {len(audio_paths) - failures}/{len(audio_paths)} files, "
+          f"{audio_seconds:.1f}s audio in {elapsed:.1f}s "
+          f"(overall RTF {elapsed / audio_seconds:.4f}, {audio_seconds / elapsed:.1f}x real time)"
+          if audio_seconds else f"\n📊 {failures} failure(s), no audio transcribed")
+    print(f"💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
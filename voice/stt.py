@@ -1,11 +1,20 @@
+from contextlib import nullcontext
 from faster_whisper import WhisperModel
+import numpy as np
+import re
+
+from voice.audio import (
+    WHISPER_SAMPLE_RATE, TranscriptCache, hash_audio_input, load_audio_input, to_whisper_audio
+)
+from utils.tracing import traced
 
 class STTHandler:
-    def __init__(self, model_size="medium"):
+    def __init__(self, model_size="medium", cache_size=256):
         """
         faster-whisper: 4x faster than OpenAI Whisper, runs on CPU
         - "medium" model: best accuracy/speed tradeoff for medical terminology
         - <1s latency even on CPU
+        - cache_size: transcripts kept in memory by audio content hash
         """
         print(f"Loading faster-whisper '{model_size}' model...")
         self.model = WhisperModel(
@@ -13,21 +22,136 @@ class STTHandler:
             device="cpu",  # Runs efficiently on CPU
             compute_type="int8"  # Quantized for speed
         )
+        self.cache = TranscriptCache(max_entries=cache_size) if cache_size else None
         print("STT model loaded")
     
     def transcribe(self, audio_path):
         """
-        Transcribe audio file to text with medical vocabulary support
+        Transcribe audio to text with medical vocabulary support
+        audio_path: file path, (sample_rate, samples) tuple or 16 kHz float32 samples
+        """
+        # Combine all segments
+        transcript = " ".join(segment["text"] for segment in self.transcribe_stream(audio_path))
+        
+        print(f"Transcribed: {transcript[:100]}...")
+        return transcript.strip()
+    
+    @traced("stt.transcribe_stream")
+    def transcribe_stream(self, audio, beam_size=5, vad_filter=True, use_cache=True):
+        """
+        Yield segments as faster-whisper decodes them, so downstream work can
+        start before the whole recording is transcribed
+        audio: file path, (sample_rate, samples) tuple or 16 kHz float32 samples
+        Repeat submissions of the same audio are served from the transcript cache
+        without decoding
+        Yields: {"start": seconds, "end": seconds, "text": str}
         """
+        key = None
+        if use_cache and self.cache:
+            key = f"{hash_audio_input(audio)}:{beam_size}:{vad_filter}"
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield from cached
+                return
+        
         segments, info = self.model.transcribe(
-            audio_path,
+            load_audio_input(audio),
             language="en",  # Auto-detect if None
-            beam_size=5,
-            vad_filter=True  # Voice activity detection
+            beam_size=beam_size,
+            vad_filter=vad_filter  # Voice activity detection
         )
         
-        # Combine all segments
-        transcript = " ".join([segment.text for segment in segments])
+        decoded = []
+        for segment in segments:
+            decoded.append({"start": segment.start, "end": segment.end, "text": segment.text.strip()})
+            yield decoded[-1]
         
-        print(f"Transcribed: {transcript[:100]}...")
-        return transcript.strip()
\ No newline at end of file
+        # Only complete transcripts are cached
+        if key:
+            self.cache.put(key, decoded)
+
+
+def _normalize_word(word):
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+def stitch_transcripts(committed, new_text, max_overlap_words=20):
+    """
+    Join two overlapping window transcripts: drop the longest run of words at the
+    start of new_text that repeats the end of committed
+    """
+    old_words = committed.split()
+    new_words = new_text.split()
+    old_norm = [_normalize_word(w) for w in old_words[-max_overlap_words:]]
+    new_norm = [_normalize_word(w) for w in new_words[:max_overlap_words]]
+    
+    overlap = 0
+    for size in range(min(len(old_norm), len(new_norm)), 0, -1):
+        if old_norm[-size:] == new_norm[:size]:
+            overlap = size
+            break
+    
+    return " ".join(old_words + new_words[overlap:])
+
+
+class LiveTranscriber:
+    def __init__(self, stt, window_seconds=15.0, overlap_seconds=2.0, step_seconds=2.0, slot=None):
+        """
+        Chunked transcription of live microphone input
+        - Decodes a rolling window every step_seconds of new audio (partial result)
+        - Once a window is full it is committed and the next one starts
+          overlap_seconds earlier; window transcripts are stitched on the overlap
+        slot: context manager factory held around each decode, e.g.
+              lambda: admission.stage("stt") so dictation shares the STT limit
+        """
+        self.stt = stt
+        self.slot = slot or nullcontext
+        self.window_samples = int(window_seconds * WHISPER_SAMPLE_RATE)
+        self.overlap_samples = int(overlap_seconds * WHISPER_SAMPLE_RATE)
+        self.step_samples = int(step_seconds * WHISPER_SAMPLE_RATE)
+        
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.committed = ""
+        self.tentative = ""
+        self._decoded_length = 0
+    
+    def _decode(self, samples):
+        # Short windows: VAD would only add latency
+        with self.slot():
+            return " ".join(
+                segment["text"]
+                for segment in self.stt.transcribe_stream(samples, beam_size=1, vad_filter=False, use_cache=False)
+            ).strip()
+    
+    def feed(self, samples, sample_rate):
+        """
+        Add a microphone chunk; returns the current partial transcript
+        """
+        self.buffer = np.concatenate([self.buffer, to_whisper_audio(samples, sample_rate)])
+        
+        if len(self.buffer) >= self.window_samples:
+            # Window full: commit it and slide, keeping the overlap for stitching
+            self.committed = stitch_transcripts(self.committed, self._decode(self.buffer[:self.window_samples]))
+            self.buffer = self.buffer[self.window_samples - self.overlap_samples:]
+            self.tentative = ""
+            self._decoded_length = 0
+        elif len(self.buffer) - self._decoded_length >= self.step_samples:
+            self.tentative = self._decode(self.buffer)
+            self._decoded_length = len(self.buffer)
+        
+        return self.partial_transcript()
+    
+    def partial_transcript(self):
+        if not self.tentative:
+            return self.committed
+        return stitch_transcripts(self.committed, self.tentative)
+    
+    def finish(self):
+        """Decode whatever is left and return the final transcript"""
+        # After a commit the buffer starts with audio that is already transcribed
+        has_new_audio = len(self.buffer) > (self.overlap_samples if self.committed else 0)
+        if has_new_audio:
+            self.committed = stitch_transcripts(self.committed, self._decode(self.buffer))
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.tentative = ""
+        return self.committed